@@ -0,0 +1,123 @@
+import os
+import sys
+import json
+import gzip
+import shutil
+
+#zstd is used if available as it compresses and decompresses meshes much faster than gzip
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+class Artifact_Store:
+    '''Content-addressed store which keeps a single compressed copy of each unique file (e.g. the mesh shared by the variants of a sweep
+    which only differ in their solver settings). The store directory holds:
+        - objects/<hash>.<extension>.zst (or .gz) - the compressed files, keyed by the SHA-256 hash of their uncompressed contents.
+        - cache/<hash>.<extension> - the decompressed files read by Palace, created on first use.
+        - Artifact_Store.py - a copy of this script, so that the jobs can decompress the files they need when they start, i.e.:
+
+            python Artifact_Store.py <config file>
+
+          which decompresses the mesh of the config into the cache if it is not there yet.
+
+    Only the objects and Artifact_Store.py need to be copied to the cluster. Files compressed with zstd need the zstandard package wherever they are
+    decompressed, otherwise gzip should be chosen.
+
+    Inputs:
+        - store_directory - directory holding the store (created when the first file is added).
+        - compression - (Optional) Defaults to 'zstd' if the zstandard package is installed, otherwise 'gzip'.
+    '''
+
+    def __init__(self, store_directory, compression = None):
+        self.store_directory = store_directory
+        self.compression = compression if compression is not None else ('zstd' if zstandard is not None else 'gzip')
+
+        assert self.compression in ['zstd', 'gzip'], f"Compression '{self.compression}' must be either 'zstd' or 'gzip'."
+        assert self.compression != 'zstd' or zstandard is not None, "The zstandard package is required for zstd compression."
+
+    def add(self, file_path):
+        '''Compresses the file into the store (unless an identical file is already stored) and returns its hash (see
+        Run_Index.hash_files).'''
+
+        #only imported here, as the copy of this script in the store is run on its own to decompress the files
+        from Run_Index import Run_Index
+
+        file_hash = Run_Index.hash_files([file_path])
+        extension = os.path.splitext(file_path)[1].lstrip('.')
+        if self.get_object(file_hash, extension) is not None:
+            return file_hash
+
+        os.makedirs(os.path.join(self.store_directory, 'objects'), exist_ok=True)
+        object_file = os.path.join(self.store_directory, 'objects', file_hash + '.' + extension + ('.zst' if self.compression == 'zstd' else '.gz'))
+
+        #written to a temporary file first, so that other processes never read a partial object
+        with open(file_path, 'rb') as f_in, open(object_file + '.' + str(os.getpid()), 'wb') as f_out:
+            if self.compression == 'zstd':
+                zstandard.ZstdCompressor(level=3, threads=-1).copy_stream(f_in, f_out)
+            else:
+                with gzip.GzipFile(fileobj=f_out, mode='wb', compresslevel=6) as f_gzip:
+                    shutil.copyfileobj(f_in, f_gzip, 1 << 24)
+        os.replace(object_file + '.' + str(os.getpid()), object_file)
+
+        #copy this script into the store, so that the jobs can decompress the files
+        if not os.path.exists(os.path.join(self.store_directory, 'Artifact_Store.py')):
+            shutil.copy(os.path.abspath(__file__), os.path.join(self.store_directory, 'Artifact_Store.py'))
+
+        print(f"Stored '{file_path}' as '{object_file}' ({os.path.getsize(object_file) / os.path.getsize(file_path):.1%} of its size).")
+
+        return file_hash
+
+    def get_object(self, file_hash, extension):
+        '''Returns the location of the compressed file (None if it is not in the store).'''
+
+        for suffix in ['.zst', '.gz']:
+            object_file = os.path.join(self.store_directory, 'objects', file_hash + '.' + extension + suffix)
+            if os.path.exists(object_file):
+                return object_file
+
+        return None
+
+    def extract(self, file_hash, extension):
+        '''Returns the location of the decompressed file, decompressing it into the cache if it is not there yet.'''
+
+        cache_file = os.path.join(self.store_directory, 'cache', file_hash + '.' + extension)
+        if os.path.exists(cache_file):
+            return cache_file
+
+        object_file = self.get_object(file_hash, extension)
+        assert object_file is not None, f"File '{file_hash}.{extension}' is not in the store '{self.store_directory}'."
+        os.makedirs(os.path.join(self.store_directory, 'cache'), exist_ok=True)
+
+        #several jobs may start at once, so each decompresses into its own temporary file
+        with open(object_file, 'rb') as f_in, open(cache_file + '.' + str(os.getpid()), 'wb') as f_out:
+            if object_file.endswith('.zst'):
+                assert zstandard is not None, f"The zstandard package is required to decompress '{object_file}'."
+                zstandard.ZstdDecompressor().copy_stream(f_in, f_out)
+            else:
+                with gzip.GzipFile(fileobj=f_in, mode='rb') as f_gzip:
+                    shutil.copyfileobj(f_gzip, f_out, 1 << 24)
+        os.replace(cache_file + '.' + str(os.getpid()), cache_file)
+
+        return cache_file
+
+    @staticmethod
+    def prepare_config(config_file):
+        '''Decompresses the mesh of a Palace config if it points into the cache of a store and is not there yet.'''
+
+        with open(config_file) as f:
+            mesh_file = json.load(f)['Model']['Mesh']
+
+        cache_directory = os.path.dirname(os.path.abspath(mesh_file))
+        if os.path.exists(mesh_file) or os.path.basename(cache_directory) != 'cache':
+            return
+
+        #the compression only applies to added files
+        file_hash, extension = os.path.basename(mesh_file).split('.', 1)
+        Artifact_Store(os.path.dirname(cache_directory), 'gzip').extract(file_hash, extension)
+        print(f"Mesh decompressed to '{mesh_file}'.")
+
+
+if __name__ == '__main__':
+    for config_file in sys.argv[1:]:
+        Artifact_Store.prepare_config(config_file)
@@ -1,14 +1,18 @@
 import gmsh
+import copy
 from Utilities.Materials import Material
+from Palace_Config import Palace_Config
 
 class Capacitance_Simulation():
 
-    def __init__(self, name, metal_cap_physical_group, metal_cap_names, user_options, hpc_options = []):
+    def __init__(self, name, metal_cap_physical_group, metal_cap_names, user_options, hpc_options = [], terminals = {}, ground_groups = []):
         self.name = name
         self.metal_cap_physical_group = metal_cap_physical_group
         self.metal_cap_names = metal_cap_names
         self.user_options = user_options
         self.hpc_options = hpc_options
+        self.terminals = terminals              #selected terminals (see GMSH_Geometry_Builder.get_capacitance_terminals) - all metals if empty
+        self.ground_groups = ground_groups      #physical groups of the metals which are grounded
 
     def prepare_simulation(self):
         
@@ -31,7 +35,9 @@ class Capacitance_Simulation():
         
         #add individual metals to metals dictionary
         metals = {}
-        if len(self.metal_cap_names) != 0:
+        if self.terminals:
+            metals = dict(self.terminals)
+        elif len(self.metal_cap_names) != 0:
             for m,metal_name in enumerate(self.metal_cap_names):
                 metals[metal_name] = self.metal_cap_physical_group[m]
 
@@ -46,81 +52,66 @@ class Capacitance_Simulation():
         #prepare different metals for capacitance simulation
         metal_terminals = self._process_metals_for_config_file()
 
-        #if hpc_options is not empty then supply correct location for mesh file and location to output simulation files
-        if self.hpc_options:
-            mesh_location = self.hpc_options['input_files_location'] + self.name + '/' + self.name + '.msh'
-            output = self.hpc_options['output_files_location'] + self.name
-        else:
-            mesh_location = self.user_options['sim_directory'] + self.name + '.msh'
-            output = self.hpc_options['output_files_location'] + self.name
-
-        #config file for eigenmode smiulation which will be output as a Json file
-        config = {
-            "Problem":
-            {
-                "Type": "Electrostatic",
-                "Verbose": 2,
-                "Output": output
-            },
-            "Model":
-            {
-                "Mesh":  mesh_location,
-                "L0": 1e-3,  
-                "Refinement":
-                {
-                "UniformLevels": self.user_options["mesh_refinement"]
-                },
-            },
-            "Domains":
-            {
-                "Materials":
-                [
-                    {
-                        "Attributes": [physical_groups['air_box']],  # Air
-                        "Permeability": 1.0,
-                        "Permittivity": 1.0,
-                        "LossTan": 0.0
-                    },
-                    {
-                        "Attributes": [physical_groups['dielectric_substrate']],  # Dielectric
-                        "Permeability": dielectric.permeability,
-                        "Permittivity": dielectric.permittivity,
-                        "LossTan": dielectric.loss_tangent
-                    }
-                ]
-            },
-            "Boundaries":
-            {
-                "PEC":
-                {
-                    "Attributes": [physical_groups['far_field']]  # Metal trace
-                },
-                "Terminal": metal_terminals
-            },
-            "Solver":
-            {
-                "Order": self.user_options["solver_order"],
-                "Electrostatic":
-                {
-                    "Save": self.user_options["solns_to_save"] 
-                },
-                "Linear":
-                {
-                    "Type": "BoomerAMG",
-                    "KSPType": "CG",
-                    "Tol": self.user_options["solver_tol"],
-                    "MaxIts": self.user_options["solver_maxits"]
-                }
-            }
-        }
-
-        return config
+        #location of the mesh file and of the simulation results (on the HPC if hpc_options is not empty)
+        mesh_location, output = Palace_Config.get_file_locations(self.name, self.user_options, self.hpc_options)
+
+        #config file for capacitance smiulation which will be output as a Json file
+        palace_config = Palace_Config("Electrostatic", output, mesh_location, self.user_options["mesh_refinement"])
+        palace_config.add_air_and_substrate(physical_groups, dielectric)
+        palace_config.set_boundary("PEC", {"Attributes": [physical_groups['far_field']] + self.ground_groups})  # Metal trace
+        palace_config.set_boundary("Terminal", metal_terminals)
+        palace_config.set_solver(self.user_options["solver_order"],
+                                 {
+                                    "Save": self.user_options["solns_to_save"]
+                                 },
+                                 {
+                                    "Type": "BoomerAMG",
+                                    "KSPType": "CG",
+                                    "Tol": self.user_options["solver_tol"],
+                                    "MaxIts": self.user_options["solver_maxits"]
+                                 })
+
+        #fields to save to disk for visualization
+        palace_config.apply_output_profile(self.user_options)
+
+        return palace_config.get_config()
+
+
+    def create_terminal_split_config_files(self, config):
+        '''Creates one config per subset of user_options['cap_terminals_per_job'] terminals on the same mesh, each giving the full columns
+        of the Maxwell capacitance matrix for its terminals - the matrix is assembled via Palace_Results.merge_capacitance_slices.'''
+
+        terminals = config['Boundaries']['Terminal']
+        terminals_per_job = self.user_options['cap_terminals_per_job']
+        starts = list(range(0, len(terminals), terminals_per_job))
+
+        #the terminals outside the subset are grounded
+        def set_terminals(job_config, m):
+            job_terminals = terminals[starts[m]:starts[m]+terminals_per_job]
+            other_terminals = terminals[:starts[m]] + terminals[starts[m]+terminals_per_job:]
+
+            job_config['Boundaries']['Terminal'] = copy.deepcopy(job_terminals)
+            job_config['Boundaries']['PEC']['Attributes'] += [x for terminal in other_terminals for x in terminal['Attributes']]
+            #the charge on each grounded terminal (the flux of D through its surface) gives its capacitance to the excited terminals - the
+            #terminals are thin metal sheets, so the flux through both of their sides is summed
+            if other_terminals:
+                postprocessing = job_config['Boundaries'].setdefault('Postprocessing', {})
+                postprocessing.setdefault('SurfaceFlux', []).extend([{'Index': x['Index'], 'Attributes': x['Attributes'], 'Type': 'Electric',
+                                                                      'TwoSided': True} for x in other_terminals])
+
+        return Palace_Config.derive_configs(self.name, config, ['_terms' + str(m) for m in range(len(starts))], set_terminals)
 
 
     def _process_metals_for_config_file(self):
         
         metal_terminals = []
 
+        #only the selected terminals are solved for
+        if self.terminals:
+            for m, terminal in enumerate(self.terminals):
+                metal_terminals.append({'Index': m+1, 'Attributes': self.terminals[terminal]})
+            return metal_terminals
+
         for m, metal in enumerate(self.metal_cap_physical_group):
             terminals = {}
             terminals['Index'] = m+1
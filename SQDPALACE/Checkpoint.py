@@ -0,0 +1,120 @@
+import os
+import json
+import time
+import hashlib
+from Run_Index import Run_Index
+
+class Checkpoint:
+    '''Stage completion markers of a simulation, so that a run which was interrupted (e.g. the notebook kernel died halfway through a
+    sweep) picks up at the first incomplete stage. The stages are:
+        - geometry, mesh - the design was built and meshed in Gmsh. These are only recorded, as the Gmsh model is lost with the process,
+                           so an interrupted simulation is rebuilt from the geometry until its files are written.
+        - files - the simulation files were written. The hash of every file in the simulation directory (see mark_files) and the
+                  information returned by PALACE_Simulation.run_simulation ('sim_info') are stored. The stage only counts as complete if the
+                  files are unchanged.
+        - submitted - the jobs were started (with the slurm 'job_ids' for the Slurm backend, which are polled again on resuming).
+        - finished - the jobs have stopped (with the 'job_results').
+        - parsed - the results were collected (with the 'results').
+
+    The markers are kept in <sim_directory>/checkpoints/<name>.json along with a key of the inputs of the simulation (see get_key). The
+    markers are discarded if the key has changed.
+
+    Inputs:
+        - checkpoint_file - JSON file holding the markers (created when the first stage is marked).
+        - key - key of the inputs of the simulation.
+    '''
+
+    stages = ['geometry', 'mesh', 'files', 'submitted', 'finished', 'parsed']
+
+    #user_options which only control how the simulation is run and are therefore not part of the key
+    runtime_options = ['show_gui', 'run_locally', 'keep_gmsh_initialized', 'overwrite', 'checkpoint']
+
+    def __init__(self, checkpoint_file, key):
+        self.checkpoint_file = checkpoint_file
+        self.key = key
+        self.files_verified = None
+
+        self.data = {'key': key, 'stages': {}}
+        if os.path.exists(checkpoint_file):
+            with open(checkpoint_file) as f:
+                data = json.load(f)
+            if data.get('key') == key:
+                self.data = data
+
+    @staticmethod
+    def get_key(simulation_type, user_options, ports, hpc_options):
+        '''Returns the key of the inputs of a simulation. Changes to the design itself are not detected, so a different identifier (e.g. the
+        overrides of a sweep variant) should be given via user_options['checkpoint_key'] if the design is modified between runs.'''
+
+        inputs = {'simulation_type': simulation_type, 'user_options': {x: y for x, y in user_options.items() if x not in Checkpoint.runtime_options},
+                  'ports': ports, 'hpc_options': hpc_options}
+
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode()).hexdigest()
+
+    @staticmethod
+    def for_simulation(simulation_type, name, user_options, ports, hpc_options):
+        '''Returns the checkpoint of the simulation with the given inputs (see PALACE_Simulation).'''
+
+        return Checkpoint(os.path.join(user_options['sim_directory'], 'checkpoints', name + '.json'),
+                          Checkpoint.get_key(simulation_type, user_options, ports, hpc_options))
+
+    def get(self, stage):
+        '''Returns the information stored with the stage (None if the stage has not been marked).'''
+        return self.data['stages'].get(stage)
+
+    def mark(self, stage, **info):
+        '''Marks the stage as complete along with the given information (which must be JSON serializable). The markers of any later stages
+        are removed, as they belonged to a previous attempt.'''
+
+        assert stage in Checkpoint.stages, f"Stage '{stage}' must be one of {Checkpoint.stages}."
+
+        stages = Checkpoint.stages[:Checkpoint.stages.index(stage)]
+        self.data['stages'] = {x: y for x, y in self.data['stages'].items() if x in stages}
+        self.data['stages'][stage] = {'time': time.time(), **info}
+        if stage == 'files':
+            self.files_verified = True
+
+        #written to a temporary file first, so that the markers are never left half written
+        os.makedirs(os.path.dirname(os.path.abspath(self.checkpoint_file)), exist_ok=True)
+        with open(self.checkpoint_file + '.' + str(os.getpid()), 'w') as f:
+            json.dump(self.data, f, indent=2, default=str)
+        os.replace(self.checkpoint_file + '.' + str(os.getpid()), self.checkpoint_file)
+
+    def mark_files(self, sim_info):
+        '''Marks the 'files' stage with the hash of every file in the simulation directory (other than the configs of jobs with pre-run
+        commands).'''
+
+        #the configs of jobs with pre-run commands are left out, as these commands may rewrite them (e.g. Two_Stage_Refiner updates the
+        #stage two config when the job runs)
+        sim_directory = sim_info['sim_directory']
+        rewritten_files = [os.path.abspath(x['config_file']) for x in sim_info['jobs'].values() if x.get('pre_run_commands')]
+        file_paths = sorted([os.path.join(sim_directory, x) for x in os.listdir(sim_directory) if os.path.isfile(os.path.join(sim_directory, x))
+                             and os.path.abspath(os.path.join(sim_directory, x)) not in rewritten_files])
+        self.mark('files', sim_info=sim_info, hashes={x: Run_Index.hash_files([x]) for x in file_paths})
+
+    def is_complete(self, stage):
+        '''Returns True if the stage and all stages before it are complete (checking that the simulation files are unchanged).'''
+
+        if not all([x in self.data['stages'] for x in Checkpoint.stages[:Checkpoint.stages.index(stage)+1]]):
+            return False
+
+        if Checkpoint.stages.index(stage) >= Checkpoint.stages.index('files') and self.files_verified is None:
+            hashes = self.data['stages']['files']['hashes']
+            self.files_verified = all([os.path.exists(x) and Run_Index.hash_files([x]) == y for x, y in hashes.items()])
+            if not self.files_verified:
+                print(f"The simulation files of checkpoint '{self.checkpoint_file}' have changed, so the simulation is prepared again.")
+
+        return Checkpoint.stages.index(stage) < Checkpoint.stages.index('files') or self.files_verified
+
+    def get_resume_stage(self):
+        '''Returns the first incomplete stage (None if all stages are complete).'''
+
+        for stage in Checkpoint.stages:
+            if not self.is_complete(stage):
+                return stage
+
+        return None
+
+    def has_started(self):
+        '''Returns True if any stage has been marked (i.e. files of a previous attempt may exist).'''
+        return len(self.data['stages']) > 0
@@ -1,5 +1,7 @@
 from RF_Simulation import RF_Simulation
 from Utilities.Materials import Material
+from Palace_Config import Palace_Config
+import numpy as np
 
 class Driven_Simulation(RF_Simulation):
 
@@ -11,108 +13,116 @@ class Driven_Simulation(RF_Simulation):
         #get the material propoerties for the dielectric specified by the user
         dielectric = Material(self.user_options['dielectric_material'])
 
-        #prepare ports - inherited method from parent class RF_Simulation
-        config_ports = self._process_ports_for_config_file()
+        #prepare ports - inherited method from parent class RF_Simulation. For sibling excitations the first port is excited in the base
+        #config and create_excitation_config_files moves the excitation to each port in turn
+        if self.user_options.get('excitation_mode', 'sequential') == 'siblings':
+            config_ports = self._process_ports_for_config_file(self.get_excitation_ports()[:1])
+        else:
+            config_ports = self._process_ports_for_config_file()
+
+        #location of the mesh file and of the simulation results (on the HPC if hpc_options is not empty)
+        mesh_location, output = Palace_Config.get_file_locations(self.name, self.user_options, self.hpc_options)
+
+        #config file for driven smiulation which will be output as a Json file
+        palace_config = Palace_Config("Driven", output, mesh_location, self.user_options["mesh_refinement"])
+        palace_config.add_air_and_substrate(physical_groups, dielectric)
+        for boundary_type, boundary in self._process_far_field_for_config_file(physical_groups).items():
+            palace_config.set_boundary(boundary_type, boundary)
+        palace_config.set_boundary("LumpedPort", config_ports)
+        palace_config.add_interface_dielectrics(physical_groups)
+        palace_config.set_solver(self.user_options["solver_order"],
+                                 self._process_freq_sweep_for_config_file(),
+                                 {
+                                    "Type": "SuperLU",
+                                    "KSPType": "FGMRES",
+                                    "Tol": self.user_options["solver_tol"],
+                                    "MaxIts": self.user_options["solver_maxits"]
+                                 })
+
+        #fields to save to disk for visualization
+        palace_config.apply_output_profile(self.user_options)
+
+        return palace_config.get_config()
+
+
+    def create_excitation_config_files(self, config):
+        '''Creates one config per excited port on the same mesh, for Palace versions without multiple excitations in a single run - the
+        S-parameters are combined via Palace_Results.merge_s_parameters.'''
+
+        ports = self.get_excitation_ports()
+        def set_excitation(sibling_config, m):
+            port_index = list(self.ports_dict.keys()).index(ports[m]) + 1
+            for config_port in sibling_config['Boundaries']['LumpedPort']:
+                config_port.pop('Excitation', None)
+                if config_port['Index'] == port_index:
+                    config_port['Excitation'] = True
+
+        return Palace_Config.derive_configs(self.name, config, ['_' + x for x in ports], set_excitation)
+
 
-        #if hpc_options is not empty then supply correct location for mesh file and location to output simulation files
-        if self.hpc_options:
-            mesh_location = self.hpc_options['input_files_location'] + self.name + '/' + self.name + '.msh'
-            output = self.hpc_options['output_files_location'] + self.name
+    def _process_freq_sweep_for_config_file(self):
+        '''Creates the frequency sweep section of the config file. By default a uniform sweep is performed from 'start_freq' to 'stop_freq'
+        in steps of 'freq_step' (all in GHz). Optional user_options:
+            - adaptive_tol - if given, Palace uses its adaptive fast frequency sweep (reduced-order model) with this error tolerance instead of
+                             solving the full system at every frequency step.
+            - adaptive_max_samples - maximum number of frequency samples used to build the reduced-order model.
+            - adaptive_max_candidates - maximum number of candidate frequencies checked when choosing the next sample of the reduced-order model.
+            - resonance_freqs - list of expected resonance frequencies (GHz). If given, the band is sampled coarsely with 'freq_step' and
+                                finely with 'resonance_freq_step' in windows of width 'resonance_span' (GHz) centred on each resonance.
+                                Note that this uses the 'Samples' syntax, which requires Palace v0.14 or later.
+        '''
+
+        driven = {}
+
+        resonance_freqs = self.user_options.get('resonance_freqs', [])
+        if len(resonance_freqs) > 0:
+            driven['Samples'] = self._get_resonance_samples(resonance_freqs)
         else:
-            mesh_location = self.user_options['sim_directory'] + self.name + '.msh'
-            output = self.hpc_options['output_files_location'] + self.name
-
-        #config file for eigenmode smiulation which will be output as a Json file
-        config = {
-            "Problem":
-            {
-                "Type": "Driven",
-                "Verbose": 2,
-                "Output": output
-            },
-            "Model":
-            {
-                "Mesh":  mesh_location,
-                "L0": 1e-3,  
-                "Refinement":
-                {
-                "UniformLevels": self.user_options["mesh_refinement"]
-                },
-            },
-            "Domains":
-            {
-                "Materials":
-                [
-                    {
-                        "Attributes": [physical_groups['air_box']],  # Air
-                        "Permeability": 1.0,
-                        "Permittivity": 1.0,
-                        "LossTan": 0.0
-                    },
-                    {
-                        "Attributes": [physical_groups['dielectric_substrate']],  # Dielectric
-                        "Permeability": dielectric.permeability,
-                        "Permittivity": dielectric.permittivity,
-                        "LossTan": dielectric.loss_tangent
-                    }
-                ]
-            },
-            "Boundaries":
-            {
-                "PEC":
-                {
-                    "Attributes": [physical_groups['metals'], physical_groups['far_field']]  # Metal trace
-                },
-                "LumpedPort": config_ports,
-                "Postprocessing":
-                {
-                   "Dielectric":
-                    [
-                        {
-                        "Index": 1,
-                        "Attributes": [physical_groups['dielectric_gaps']],
-                        "Type": "SA",
-                        "Thickness": 2.0e-3,  
-                        "Permittivity": 10.0,
-                        "LossTan": 0.9e-3
-                        },
-                        {
-                        "Index": 2,
-                        "Attributes": [physical_groups['metals']],
-                        "Type": "MS",
-                        "Thickness": 2.0e-3,  
-                        "Permittivity": 10.0,
-                        "LossTan": 0.3e-3
-                        },
-                        {
-                        "Index": 3,
-                        "Attributes": [physical_groups['metals']],
-                        "Type": "MA",
-                        "Thickness": 2.0e-3, 
-                        "Permittivity": 10.0,
-                        "LossTan": 0.5e-3
-                        }
-                    ] 
-                }
-            },
-            "Solver":
-            {
-                "Order": self.user_options["solver_order"],
-                "Driven":
-                {
-                    "MinFreq": self.user_options["start_freq"],  # starting freequency
-                    "MaxFreq": self.user_options["stop_freq"],  # end frequency
-                    "FreqStep": self.user_options["freq_step"],  # step size
-                    "SaveStep": self.user_options["solns_to_save"] # Number of frequency steps for computed field modes to save to disk for visualization with ParaView
-                },
-                "Linear":
-                {
-                    "Type": "SuperLU",
-                    "KSPType": "FGMRES",
-                    "Tol": self.user_options["solver_tol"],
-                    "MaxIts": self.user_options["solver_maxits"]
-                }
-            }
-        }
-
-        return config
\ No newline at end of file
+            driven['MinFreq'] = self.user_options["start_freq"]     # starting freequency
+            driven['MaxFreq'] = self.user_options["stop_freq"]      # end frequency
+            driven['FreqStep'] = self.user_options["freq_step"]     # step size
+        driven['SaveStep'] = self.user_options["solns_to_save"]     # Number of frequency steps for computed field modes to save to disk for visualization with ParaView
+
+        #adaptive fast frequency sweep - the reduced-order model is only evaluated at the frequency steps
+        if self.user_options.get('adaptive_tol') is not None:
+            driven['AdaptiveTol'] = self.user_options['adaptive_tol']
+            if self.user_options.get('adaptive_max_samples') is not None:
+                driven['AdaptiveMaxSamples'] = self.user_options['adaptive_max_samples']
+            if self.user_options.get('adaptive_max_candidates') is not None:
+                driven['AdaptiveMaxCandidates'] = self.user_options['adaptive_max_candidates']
+
+        return driven
+
+
+    def _get_resonance_samples(self, resonance_freqs):
+        '''Returns a list of Palace frequency samples with a coarse sweep over the band and fine sweeps around each expected resonance.'''
+
+        start_freq = self.user_options["start_freq"]
+        stop_freq = self.user_options["stop_freq"]
+        fine_step = self.user_options.get('resonance_freq_step', self.user_options["freq_step"] / 100)
+        span = self.user_options.get('resonance_span', 100 * fine_step)
+
+        #fine windows centred on resonances inside the band - overlapping windows are merged into a single window
+        windows = []
+        for freq in np.sort(resonance_freqs):
+            if freq < start_freq or freq > stop_freq:
+                print(f'Resonance at {freq} GHz lies outside the sweep band and is ignored.')
+                continue
+            lower = max(start_freq, freq - span/2)
+            upper = min(stop_freq, freq + span/2)
+            if windows and lower <= windows[-1][1]:
+                windows[-1][1] = max(windows[-1][1], upper)
+            else:
+                windows.append([lower, upper])
+
+        samples = [{"Type": "Linear",
+                    "MinFreq": start_freq,
+                    "MaxFreq": stop_freq,
+                    "FreqStep": self.user_options["freq_step"]}]
+        for lower, upper in windows:
+            samples.append({"Type": "Linear",
+                            "MinFreq": float(lower),
+                            "MaxFreq": float(upper),
+                            "FreqStep": fine_step})
+
+        return samples
@@ -1,5 +1,8 @@
 from RF_Simulation import RF_Simulation
 from Utilities.Materials import Material
+from Palace_Config import Palace_Config
+import numpy as np
+import os
 
 class Eigenmode_Simulation(RF_Simulation):
 
@@ -15,108 +18,143 @@ class Eigenmode_Simulation(RF_Simulation):
         #prepare ports - inherited method from parent class RF_Simulation
         config_ports = self._process_ports_for_config_file()
 
-        #if hpc_options is not empty then supply correct location for mesh file and where to output simulation results
+        #location of the mesh file and of the simulation results (on the HPC if hpc_options is not empty)
+        mesh_location, output = Palace_Config.get_file_locations(self.name, self.user_options, self.hpc_options)
+
+        #config file for eigenmode smiulation which will be output as a Json file
+        palace_config = Palace_Config("Eigenmode", output, mesh_location, self.user_options["mesh_refinement"])
+        palace_config.add_air_and_substrate(physical_groups, dielectric)
+        for boundary_type, boundary in self._process_far_field_for_config_file(physical_groups).items():
+            palace_config.set_boundary(boundary_type, boundary)
+        palace_config.set_boundary("LumpedPort", config_ports)
+        palace_config.add_interface_dielectrics(physical_groups)
+        palace_config.set_solver(self.user_options["solver_order"],
+                                 {
+                                    "N": self.user_options["number_of_freqs"],  # number of eigenfrequencies
+                                    "Tol": self.user_options["solver_tol"],  # solver tolerance
+                                    "Target": self.user_options["starting_freq"],  # GHz - starting point
+                                    "Save": self.user_options["solns_to_save"] # Number of computed field modes to save to disk for visualization with ParaView
+                                 },
+                                 {
+                                    "Type": "SuperLU",
+                                    "KSPType": "FGMRES",
+                                    "Tol": self.user_options["solver_tol"],
+                                    "MaxIts": self.user_options["solver_maxits"]
+                                 })
+        config = palace_config.config
+
+        #optional eigensolver and linear solver settings - Palace defaults are used if they are not specified
+        self._process_eigensolver_options(config['Solver'])
+
+        #fields to save to disk for visualization
+        palace_config.apply_output_profile(self.user_options)
+
+        return palace_config.get_config()
+
+
+    def _process_eigensolver_options(self, solver):
+        '''Adds the optional eigensolver settings in user_options to the solver section of the config:
+            - eigen_solver_type - eigensolver backend: 'Default', 'SLEPc' or 'ARPACK'.
+            - eigen_tol - tolerance of the eigensolver (defaults to solver_tol, which stays the tolerance of the linear solver).
+            - eigen_max_size - maximum size of the Krylov subspace (should be larger than number_of_freqs).
+            - eigen_max_its - maximum number of eigensolver iterations.
+            - divfree_tol - tolerance of the divergence-free projection.
+            - divfree_max_its - maximum number of iterations of the divergence-free projection.
+            - pc_side - side of the preconditioner for the linear solver: 'Default', 'Left' or 'Right'.
+        '''
+
+        eigen_keys = {'eigen_solver_type': 'Type', 'eigen_tol': 'Tol', 'eigen_max_size': 'MaxSize', 'eigen_max_its': 'MaxIts'}
+        linear_keys = {'divfree_tol': 'DivFreeTol', 'divfree_max_its': 'DivFreeMaxIts', 'pc_side': 'PCSide'}
+
+        for option, key in eigen_keys.items():
+            if self.user_options.get(option) is not None:
+                solver['Eigenmode'][key] = self.user_options[option]
+        for option, key in linear_keys.items():
+            if self.user_options.get(option) is not None:
+                solver['Linear'][key] = self.user_options[option]
+
+        if solver['Eigenmode'].get('MaxSize') is not None:
+            assert solver['Eigenmode']['MaxSize'] > solver['Eigenmode']['N'], "The Krylov subspace size 'eigen_max_size' must be larger than 'number_of_freqs'."
+
+
+    def create_autotune_config_files(self, config):
+        '''Creates short trial configs (coarse mesh, first order, no fields saved) over Krylov subspace sizes and eigensolver tolerances -
+        Palace_Results.select_autotune_params then picks the fastest trial which found the requested modes.'''
+
+        #trials default to 2, 3 and 5 times number_of_freqs and 100, 10 and 1 times eigen_tol
+        num_modes = self.user_options["number_of_freqs"]
+        max_sizes = self.user_options.get('autotune_max_sizes', [2*num_modes, 3*num_modes, 5*num_modes])
+        eigen_tol = self.user_options.get('eigen_tol', self.user_options["solver_tol"])
+        tols = self.user_options.get('autotune_tols', [100*eigen_tol, 10*eigen_tol, eigen_tol])
+        trials = [(x, y) for x in max_sizes for y in tols]
+
+        def set_trial(trial_config, m):
+            trial_config['Model']['Refinement']['UniformLevels'] = 0
+            trial_config['Solver']['Order'] = 1
+            trial_config['Solver']['Eigenmode']['MaxSize'] = max(trials[m][0], num_modes + 1)
+            trial_config['Solver']['Eigenmode']['Tol'] = trials[m][1]
+            trial_config['Solver']['Eigenmode']['Save'] = 0
+
+        return Palace_Config.derive_configs(self.name, config, ['_tune' + str(m) for m in range(len(trials))], set_trial)
+
+
+    def create_two_stage_config_files(self, config):
+        '''Creates a cheap low-order stage one config which locates the modes and the full stage two config, whose Target and N are set
+        from the stage one modes by Two_Stage_Refiner. Returns the tuple (configs, job_dependencies, pre_run_commands).'''
+
+        stage_one_name = self.name + '_stage1'
+        stage_two_name = self.name + '_stage2'
+
+        #stage one solves for a few extra modes in case of spurious modes
+        def set_stage(stage_config, m):
+            if m == 0:
+                stage_config['Model']['Refinement']['UniformLevels'] = 0
+                stage_config['Solver']['Order'] = self.user_options.get('stage_one_order', 1)
+                stage_config['Solver']['Eigenmode']['N'] = self.user_options["number_of_freqs"] + self.user_options.get('stage_one_extra_modes', 2)
+                stage_config['Solver']['Eigenmode']['Save'] = 0
+                stage_config['Solver']['Eigenmode'].pop('MaxSize', None)
+
+        configs = Palace_Config.derive_configs(self.name, config, ['_stage1', '_stage2'], set_stage)
+        stage_one_config = configs[stage_one_name]
+
+        #location of the simulation files when the refining step is run - the stage two Target is placed stage_two_margin below the
+        #lowest stage one mode
         if self.hpc_options:
-            mesh_location = self.hpc_options['input_files_location'] + self.name + '/' + self.name + '.msh'
-            output = self.hpc_options['output_files_location'] + self.name
+            sim_location = self.hpc_options['input_files_location'] + self.name + '/'
         else:
-            mesh_location = self.user_options['sim_directory'] + self.name + '.msh'
-            output = self.user_options['sim_directory'] + self.name
+            sim_location = os.path.join(self.user_options['sim_directory'], self.name) + '/'
 
-        if physical_groups.get('dielectric_gaps') is None:
-            physical_groups['dielectric_gaps'] = []
+        refine_command = 'python ' + sim_location + 'Two_Stage_Refiner.py ' + stage_one_config['Problem']['Output'] + ' ' + sim_location + stage_two_name + '.json ' \
+                         + str(self.user_options["number_of_freqs"]) + ' ' + str(self.user_options.get('stage_two_margin', 0.01))
 
-        #config file for eigenmode smiulation which will be output as a Json file
-        config = {
-            "Problem":
-            {
-                "Type": "Eigenmode",
-                "Verbose": 2,
-                "Output": output
-            },
-            "Model":
-            {
-                "Mesh":  mesh_location,
-                "L0": 1e-3,  
-                "Refinement":
-                {
-                "UniformLevels": self.user_options["mesh_refinement"]
-                },
-            },
-            "Domains":
-            {
-                "Materials":
-                [
-                    {
-                        "Attributes": [physical_groups['air_box']],  # Air
-                        "Permeability": 1.0,
-                        "Permittivity": 1.0,
-                        "LossTan": 0.0
-                    },
-                    {
-                        "Attributes": [physical_groups['dielectric_substrate']],  # Dielectric
-                        "Permeability": dielectric.permeability,
-                        "Permittivity": dielectric.permittivity,
-                        "LossTan": dielectric.loss_tangent
-                    }
-                ]
-            },
-            "Boundaries":
-            {
-                "PEC":
-                {
-                    "Attributes": [physical_groups['metals'], physical_groups['far_field']]  # Metal trace
-                },
-                "LumpedPort": config_ports,
-                "Postprocessing":
-                {
-                   "Dielectric":
-                    [
-                        {
-                        "Index": 1,
-                        "Attributes": [physical_groups['dielectric_gaps']],
-                        "Type": "SA",
-                        "Thickness": 2.0e-6,  
-                        "Permittivity": 10.0,
-                        "LossTan": 0.9e-3
-                        },
-                        {
-                        "Index": 2,
-                        "Attributes": [physical_groups['metals']],
-                        "Type": "MS",
-                        "Thickness": 2.0e-6,  
-                        "Permittivity": 10.0,
-                        "LossTan": 0.3e-3
-                        },
-                        {
-                        "Index": 3,
-                        "Attributes": [physical_groups['metals']],
-                        "Type": "MA",
-                        "Thickness": 2.0e-6, 
-                        "Permittivity": 10.0,
-                        "LossTan": 0.5e-3
-                        }
-                    ] 
-                }
-            },
-            "Solver":
-            {
-                "Order": self.user_options["solver_order"],
-                "Eigenmode":
-                {
-                    "N": self.user_options["number_of_freqs"],  # number of eigenfrequencies
-                    "Tol": self.user_options["solver_tol"],  # solver tolerance
-                    "Target": self.user_options["starting_freq"],  # GHz - starting point
-                    "Save": self.user_options["solns_to_save"] # Number of computed field modes to save to disk for visualization with ParaView
-                },
-                "Linear":
-                {
-                    "Type": "SuperLU",
-                    "KSPType": "FGMRES",
-                    "Tol": self.user_options["solver_tol"],
-                    "MaxIts": self.user_options["solver_maxits"]
-                }
-            }
-        }
-
-        return config
\ No newline at end of file
+        if not self.hpc_options:
+            print('Run stage one, then run the following before running stage two:')
+            print(refine_command)
+
+        return configs, {stage_two_name: [stage_one_name]}, {stage_two_name: [refine_command]}
+
+
+    def get_spectrum_windows(self):
+        '''Returns the (lower, upper) bounds in GHz of user_options['num_windows'] equal windows over user_options['freq_band'].'''
+
+        min_freq, max_freq = self.user_options['freq_band']
+        assert max_freq > min_freq, "The upper bound of 'freq_band' must be larger than the lower bound."
+
+        edges = np.linspace(min_freq, max_freq, self.user_options.get('num_windows', 4) + 1)
+
+        return [(float(edges[i]), float(edges[i+1])) for i in range(len(edges)-1)]
+
+
+    def create_spectrum_slice_config_files(self, config):
+        '''Creates one config per spectrum window (see get_spectrum_windows), which can be solved as concurrent jobs on the same mesh - the
+        modes are combined via Palace_Results.merge_spectrum_slices.'''
+
+        #each window searches for modes_per_window modes above its lower edge
+        windows = self.get_spectrum_windows()
+        def set_window(window_config, m):
+            window_config['Solver']['Eigenmode']['Target'] = windows[m][0]
+            window_config['Solver']['Eigenmode']['N'] = self.user_options.get('modes_per_window', 4)
+            window_config['Solver']['Eigenmode']['Save'] = min(window_config['Solver']['Eigenmode']['Save'], window_config['Solver']['Eigenmode']['N'])
+            print(f'Spectrum window {m}: {windows[m][0]:.4f} GHz to {windows[m][1]:.4f} GHz.')
+
+        return Palace_Config.derive_configs(self.name, config, ['_win' + str(m) for m in range(len(windows))], set_window)
@@ -17,11 +17,12 @@ import qiskit_metal
 
 class GMSH_Geometry_Builder:
 
-    def __init__(self, design, simulation_type, ports):
+    def __init__(self, design, simulation_type, ports, user_options = {}):
         
         self.design = design 
         self.simulation_type = simulation_type
         self.ports = ports
+        self.user_options = user_options
 
         #Get dimensions of chip base and convert to design units in 'mm'
         self.center_x = self.design.parse_value(self.design.chips['main'].size.center_x)
@@ -31,8 +32,11 @@ class GMSH_Geometry_Builder:
         self.length_y = self.design.parse_value(self.design.chips['main'].size.size_y)
         self.length_z = self.design.parse_value(self.design.chips['main'].size.size_z)
 
-        #Initialize the GMSH API and name the model
-        gmsh.initialize()
+        #Initialize the GMSH API - a session kept open between simulations (e.g. by Worker_Service) only has its model cleared
+        if gmsh.isInitialized():
+            gmsh.clear()
+        else:
+            gmsh.initialize()
 
       
     def construct_geometry_in_GMSH(self):
@@ -136,6 +140,10 @@ class GMSH_Geometry_Builder:
             #Create a physical group for each metal in the design. This is important for capacitance simulations because we need to uniquely
             #design the
             metal_list = metal_list + ground_plane_list 
+
+            #keep the shapely polygons of each metal (same order as the physical groups) to select terminals by component
+            self.cap_metal_polygons = metals + ground_plane
+            self.num_cap_ground_plane_pieces = len(ground_plane)
             
             for i,metal in enumerate(metal_list):
                 metal_name = 'metal_' + str(i)
@@ -176,6 +184,14 @@ class GMSH_Geometry_Builder:
         else:
             far_field_surfaces = air_box_surfaces[:6]
 
+        #For absorbing boundaries, the back-side ground plane (i.e. the floor of the air box) stays grounded in the 'far_field_ground'
+        #group while the remaining surfaces absorb outgoing radiation
+        if self._use_absorbing_far_field() and bottom_grounded == True:
+            tol = 1e-3 * np.abs(self.length_z)
+            ground_surfaces = [x for x in far_field_surfaces if np.abs(gmsh.model.getBoundingBox(2, x)[5] - self.air_box_bottom_z) < tol]
+            far_field_surfaces = [x for x in far_field_surfaces if x not in ground_surfaces]
+            gmsh.model.addPhysicalGroup(2, ground_surfaces, name = 'far_field_ground')
+
         gmsh.model.addPhysicalGroup(2, far_field_surfaces, name = 'far_field')
         
         #synchronise
@@ -187,6 +203,90 @@ class GMSH_Geometry_Builder:
         return metal_list, metal_meshing_list, dielectric_gap_list, dielectric_cutout_list, ports_dict, metal_cap_physical_group, metal_cap_names, jj_dict
 
 
+    def get_capacitance_terminals(self, metal_cap_physical_group, metal_cap_names, component_names = 'all', group_by_evaporations = False):
+        '''Selects the terminals for a capacitance simulation such that only the required columns of the Maxwell capacitance matrix are
+        solved. All ground plane pieces and metals touching the ground plane are merged into a single ground, while the metals that are not
+        selected are also grounded (as in the definition of the Maxwell capacitance matrix). Must be called after construct_geometry_in_GMSH.
+
+        Args:
+            metal_cap_physical_group - list of physical groups of each metal as returned by construct_geometry_in_GMSH.
+            metal_cap_names - list of the names of each metal as returned by construct_geometry_in_GMSH.
+            component_names - (Optional) Defaults to 'all'. List of Qiskit Metal component names whose metals are used as terminals. If
+                              'all', every metal not connected to ground is a terminal.
+            group_by_evaporations - (Optional) Defaults to False. If True, metals which belong to the same conductor across the PVD evaporation
+                                    steps (see QUtilities.get_metals_in_layer) are merged into a single terminal.
+
+        Returns:
+            Tuple (terminals, ground_groups) where terminals is a dictionary of the terminal names and their lists of physical groups and
+            ground_groups is a list of the physical groups to be grounded.
+        '''
+
+        num_metals = len(self.cap_metal_polygons) - self.num_cap_ground_plane_pieces
+        ground_plane = shapely.unary_union(self.cap_metal_polygons[num_metals:])
+        ground_groups = list(metal_cap_physical_group[num_metals:])
+
+        #component which each metal belongs to (None if the metal is connected to ground or not selected)
+        if component_names == 'all':
+            component_names = list(self.design.components.keys())
+        component_geoms = {x: self._get_component_geometry(x) for x in component_names}
+
+        metal_components = []
+        for m in range(num_metals):
+            metal_poly = self.cap_metal_polygons[m]
+            if metal_poly.distance(ground_plane) < 1e-9:
+                metal_components.append(None)
+                continue
+            overlaps = [(metal_poly.intersection(geom).area, x) for x, geom in component_geoms.items()]
+            overlaps = [x for x in overlaps if x[0] > 0]
+            metal_components.append(max(overlaps)[1] if overlaps else None)
+
+        #metals on the same conductor across evaporation steps share the same selection ID
+        if group_by_evaporations:
+            metal_polys_all, metal_sel_ids = QUtilities.get_metals_in_layer(self.design, 1, group_by_evaporations=True, unit_conv=1)
+            metal_conductors = []
+            for m in range(num_metals):
+                overlaps = [self.cap_metal_polygons[m].intersection(x).area for x in metal_polys_all]
+                metal_conductors.append(metal_sel_ids[int(np.argmax(overlaps))])
+        else:
+            metal_conductors = list(range(num_metals))
+
+        terminals = {}
+        conductor_terminals = {}
+        for m in range(num_metals):
+            if metal_components[m] is None:
+                ground_groups.append(metal_cap_physical_group[m])
+                continue
+            if metal_conductors[m] not in conductor_terminals:
+                terminal_name = metal_components[m]
+                if terminal_name in terminals:
+                    terminal_name = terminal_name + '_' + metal_cap_names[m]
+                conductor_terminals[metal_conductors[m]] = terminal_name
+                terminals[terminal_name] = []
+            terminals[conductor_terminals[metal_conductors[m]]].append(metal_cap_physical_group[m])
+
+        print('Capacitance terminals:', list(terminals.keys()))
+
+        return terminals, ground_groups
+
+
+    def _get_component_geometry(self, component_name):
+        '''Returns the union of the (non-subtracted) metallic polygons and paths of a Qiskit Metal component in design units.'''
+
+        comp_id = self.design.components[component_name].id
+        geoms = []
+
+        polys = self.design.qgeometry.tables['poly']
+        polys = polys[(polys['component'] == comp_id) & (polys['subtract'] == False)]
+        geoms += polys['geometry'].tolist()
+
+        paths = self.design.qgeometry.tables['path']
+        paths = paths[(paths['component'] == comp_id) & (paths['subtract'] == False)]
+        for _, row in paths.iterrows():
+            geoms.append(row['geometry'].buffer(row['width']/2, cap_style=shapely.geometry.CAP_STYLE.flat))
+
+        return shapely.unary_union(geoms)
+
+
     def _process_qiskit_geometries_in_shapely(self):
         '''This function takes the existing geometry in the Qiskit Metal design and processes them using shapely
             to get them ready to build in GMSH. Processing includes fusing metallic elements together such as fusing the launch
@@ -356,10 +456,10 @@ class GMSH_Geometry_Builder:
             Tuple of integers with the first value specifying the dimension and the second value the ID of the object in GMSH. 
         '''
 
-        #for air box choose increase in dimensions as a percentage of the chip dimensions
-        increase = 0.20 
-        air_box_delta_x = increase * self.length_x
-        air_box_delta_y = increase * self.length_y
+        #air box extends by the margins on either side and above the chip
+        margin_x, margin_y, air_box_top = self._get_air_box_margins()
+        air_box_delta_x = 2 * margin_x
+        air_box_delta_y = 2 * margin_y
         
         #bottom left corner of air box
         x_point = self.center_x-self.length_x/2-air_box_delta_x/2 
@@ -368,15 +468,57 @@ class GMSH_Geometry_Builder:
         #Check to place ground plane on back side by choosing statring z point
         if bottom_grounded == True: 
             z_point = self.center_z - np.abs(self.length_z)
-            air_box_delta_z = 2 * np.abs(self.length_z)
+            air_box_delta_z = np.abs(self.length_z) + air_box_top
         else:
             z_point = self.center_z - 2 * np.abs(self.length_z)
-            air_box_delta_z = 3 * np.abs(self.length_z)
+            air_box_delta_z = 2 * np.abs(self.length_z) + air_box_top
+        self.air_box_bottom_z = z_point
 
         air_box = gmsh.model.occ.addBox(x_point, y_point, z_point, self.length_x + air_box_delta_x, self.length_y + air_box_delta_y, air_box_delta_z)
         gmsh.model.occ.synchronize()
 
         return air_box
+
+
+    def _use_absorbing_far_field(self):
+        #absorbing boundaries are only used for RF simulations - electrostatic simulations always use a grounded far-field
+        return self.user_options.get('far_field_type', 'PEC') == 'absorbing' and self.simulation_type != 'Capacitance'
+
+
+    def _get_air_box_margins(self):
+        '''Returns the distances (in design units) between the chip and the air box along x and y (on either side) and above the chip. The
+        default air box is 20% larger than the chip in x and y and extends one substrate thickness above it. The margins are set in
+        user_options via:
+            - air_box_margin - explicit margin in design units on every side and above the chip.
+            - far_field_type - if 'absorbing', the margin is derived from the frequency band: it is a fraction of the free-space wavelength
+                               at the highest frequency of interest, so that the fields reaching the boundary are close to outgoing plane
+                               waves. The fraction ('air_box_wavelength_fraction') defaults to 1/4 for first order absorbing boundaries and
+                               1/8 for second order absorbing boundaries ('absorbing_order'), which are accurate closer to the chip. The
+                               margin is at least three substrate thicknesses, over which the CPW fields decay.
+        '''
+
+        if self.user_options.get('air_box_margin') is not None:
+            return (self.user_options['air_box_margin'],) * 3
+
+        if not self._use_absorbing_far_field():
+            return (0.1 * self.length_x, 0.1 * self.length_y, np.abs(self.length_z))
+
+        #highest frequency of interest (GHz) - the Eigenmode target is used if there is no upper bound
+        if self.user_options.get('stop_freq') is not None:
+            max_freq = self.user_options['stop_freq']
+        elif self.user_options.get('freq_band') is not None:
+            max_freq = self.user_options['freq_band'][1]
+        else:
+            max_freq = self.user_options['starting_freq']
+
+        default_fraction = 1/4 if self.user_options.get('absorbing_order', 1) == 1 else 1/8
+        fraction = self.user_options.get('air_box_wavelength_fraction', default_fraction)
+
+        wavelength = 299792458 / (max_freq * 1e9) / QUtilities.get_units(self.design)
+        margin = max(3 * np.abs(self.length_z), fraction * wavelength)
+        print(f'Air box margin of {margin:.3f} {self.design.get_units()} used for absorbing boundaries.')
+
+        return (margin,) * 3
     
     def _process_ports(self):
         
@@ -0,0 +1,135 @@
+import os
+import time
+import shlex
+import subprocess
+
+class Local_Runner:
+    '''Runs Palace locally (i.e. without an HPC) for queued configs, launching each job via 'mpirun -np <cores> palace <config>'. Several
+    jobs run concurrently as long as the total number of cores in use stays within max_cores. The output of each job is streamed to its own
+    log file and the exit status and wall time of each job are reported once all jobs have finished.
+
+    Inputs:
+        - max_cores - (Optional) Defaults to the number of cores of the machine. Maximum number of cores used by all running jobs.
+        - palace_location - (Optional) Defaults to 'palace'. Command which runs Palace. This can be replaced by a stub (e.g.
+                            'python Test_Scripts/palace_stub.py') to test the runner without Palace.
+        - mpirun - (Optional) Defaults to 'mpirun'. MPI launcher. If None, Palace is run directly (i.e. on a single core).
+        - poll_interval - (Optional) Defaults to 0.2. Time in seconds between checks of the running jobs.
+    '''
+
+    def __init__(self, max_cores = None, palace_location = 'palace', mpirun = 'mpirun', poll_interval = 0.2):
+        self.max_cores = max_cores if max_cores is not None else os.cpu_count()
+        self.palace_location = palace_location
+        self.mpirun = mpirun
+        self.poll_interval = poll_interval
+
+        self.jobs = {}          #queued jobs keyed by job name (in order of submission)
+
+    def add_job(self, job_name, config_file, cores = 1, dependencies = [], pre_run_commands = [], log_file = None):
+        '''Queues a Palace job.
+
+        Args:
+            job_name - unique name of the job.
+            config_file - Palace config (.json) file.
+            cores - (Optional) Defaults to 1. Number of MPI ranks for the job.
+            dependencies - (Optional) list of the job names which must finish successfully before the job starts.
+            pre_run_commands - (Optional) list of shell commands run before Palace is launched (e.g. the Two_Stage_Refiner step).
+            log_file - (Optional) Defaults to <job_name>.log next to the config file. File to which the output of the job is written.
+        '''
+
+        assert job_name not in self.jobs, f"Job '{job_name}' has already been added."
+        assert 1 <= cores <= self.max_cores, f"Job '{job_name}' requests {cores} cores, but only {self.max_cores} cores may be used."
+
+        #the dependencies may include jobs which are added later, so a cycle is closed by the last job added to it
+        visited = []
+        to_visit = list(dependencies)
+        while to_visit:
+            dependency = to_visit.pop()
+            assert dependency != job_name, f"Job '{job_name}' depends on itself via its dependencies {list(dependencies)}."
+            if dependency not in visited and dependency in self.jobs:
+                visited.append(dependency)
+                to_visit += self.jobs[dependency]['dependencies']
+
+        if log_file is None:
+            log_file = os.path.join(os.path.dirname(os.path.abspath(config_file)), job_name + '.log')
+
+        self.jobs[job_name] = {'config_file': config_file, 'cores': cores, 'dependencies': list(dependencies),
+                               'pre_run_commands': list(pre_run_commands), 'log_file': log_file}
+
+    def run(self):
+        '''Runs all queued jobs and blocks until they have finished. Jobs whose dependencies failed are skipped.
+
+        Returns:
+            Dictionary keyed by job name with the 'status' ('completed', 'failed' or 'skipped'), 'returncode', 'time' (wall time in seconds)
+            and 'log_file' of each job.
+        '''
+
+        for job_name, job in self.jobs.items():
+            for dependency in job['dependencies']:
+                assert dependency in self.jobs, f"Job '{job_name}' depends on job '{dependency}', which has not been added."
+
+        pending = list(self.jobs.keys())
+        running = {}
+        results = {}
+
+        while pending or running:
+            #check the running jobs
+            for job_name in list(running.keys()):
+                process, log, start_time = running[job_name]
+                returncode = process.poll()
+                if returncode is None:
+                    continue
+                log.close()
+                del running[job_name]
+                results[job_name] = {'status': 'completed' if returncode == 0 else 'failed', 'returncode': returncode,
+                                     'time': time.time() - start_time, 'log_file': self.jobs[job_name]['log_file']}
+                print(f"Job '{job_name}' {results[job_name]['status']} (exit code {returncode}) in {results[job_name]['time']:.1f} s.")
+
+            #skip jobs whose dependencies did not complete
+            for job_name in list(pending):
+                if any([results.get(x, {}).get('status') in ['failed', 'skipped'] for x in self.jobs[job_name]['dependencies']]):
+                    pending.remove(job_name)
+                    results[job_name] = {'status': 'skipped', 'returncode': None, 'time': 0.0, 'log_file': self.jobs[job_name]['log_file']}
+                    print(f"Job '{job_name}' skipped as a dependency did not complete.")
+
+            #start the jobs (in order of submission) which are ready and fit in the free cores
+            free_cores = self.max_cores - sum([self.jobs[x]['cores'] for x in running])
+            for job_name in list(pending):
+                job = self.jobs[job_name]
+                ready = all([results.get(x, {}).get('status') == 'completed' for x in job['dependencies']])
+                if ready and job['cores'] <= free_cores:
+                    pending.remove(job_name)
+                    running[job_name] = self._start_job(job_name)
+                    free_cores -= job['cores']
+
+            #if no job is running, the pending jobs can never start (add_job rules this out, but the loop would otherwise spin forever)
+            if running:
+                time.sleep(self.poll_interval)
+            elif pending:
+                raise Exception(f"Jobs {pending} can never start, as no job is running and their dependencies are not met.")
+
+        num_completed = len([x for x in results.values() if x['status'] == 'completed'])
+        print(f"{num_completed} of {len(results)} jobs completed.")
+
+        return {x: results[x] for x in self.jobs}
+
+    def get_command(self, job_name):
+        '''Returns the shell command which runs the given job.'''
+
+        job = self.jobs[job_name]
+        palace_command = shlex.split(self.palace_location) + [job['config_file']]
+        if self.mpirun is not None:
+            palace_command = shlex.split(self.mpirun) + ['-np', str(job['cores'])] + palace_command
+
+        return ' && '.join(job['pre_run_commands'] + [shlex.join(palace_command)])
+
+    def _start_job(self, job_name):
+
+        log = open(self.jobs[job_name]['log_file'], 'w')
+        command = self.get_command(job_name)
+        log.write(command + '\n')
+        log.flush()
+
+        print(f"Starting job '{job_name}' on {self.jobs[job_name]['cores']} cores.")
+        process = subprocess.Popen(command, shell=True, stdout=log, stderr=subprocess.STDOUT)
+
+        return process, log, time.time()
@@ -4,7 +4,12 @@ from Eigenmode_Simulation import Eigenmode_Simulation
 from Driven_Simulation import Driven_Simulation
 from Capacitance_Simulation import Capacitance_Simulation
 from Simulation_Files_Builder import Simulation_Files_Builder
+from Resource_Estimator import Resource_Estimator
+from Local_Runner import Local_Runner
+from Checkpoint import Checkpoint
+from Utilities.ModeEstimator import ModeEstimator
 import gmsh
+import os
 
 
 class PALACE_Simulation:
@@ -19,12 +24,59 @@ class PALACE_Simulation:
         self.user_options = user_options
         self.ports = ports
         self.hpc_options = hpc_options
-
-    def run_simulation(self):
+        self.checkpoint = None
+
+    def run_simulation(self, stage_callback = None):
+        '''Builds the geometry and mesh and writes the simulation files (and runs Palace if user_options['run_locally'] is set). The Gmsh
+        GUI is opened at the end unless user_options['show_gui'] is False. Otherwise Gmsh is closed, unless
+        user_options['keep_gmsh_initialized'] is set, in which case only the model is cleared (used by the workers of Worker_Service).
+
+        Args:
+            stage_callback - (Optional) function called with the name of each stage ('geometry', 'mesh', 'files' and 'run') as it starts.
+
+        Returns:
+            Dictionary with the 'name', 'sim_directory', 'hpc_options' and the 'jobs' of the simulation, where each job (keyed by job name)
+            has its 'config_file', 'output', 'dependencies', 'pre_run_commands' and whether it is 'cached' (i.e. skipped as its results were
+            found in the run index, see Simulation_Files_Builder). If the simulation was run locally, 'local_results' holds the results of
+            each job (see Local_Runner.run).
+
+        If user_options['checkpoint'] is True, the completion of each stage is recorded (see Checkpoint) and a simulation whose files were
+        already written by a previous run is not prepared again, i.e. only the remaining stages are run.
+        '''
+
+        if stage_callback is None:
+            stage_callback = lambda stage: None
+
+        #pick up at the first incomplete stage of a previous run
+        if self.user_options.get('checkpoint', False):
+            self.checkpoint = Checkpoint.for_simulation(self.simulation_type, self.name, self.user_options, self.ports, self.hpc_options)
+            if self.checkpoint.is_complete('files'):
+                print(f"Simulation '{self.name}' resumed from its checkpoint at stage '{self.checkpoint.get_resume_stage()}'.")
+                sim_info = self.checkpoint.get('files')['sim_info']
+                if not self.hpc_options and self.user_options.get('run_locally', False):
+                    stage_callback('run')
+                    sim_info['local_results'] = self._run_locally(sim_info)
+                return sim_info
         
+        #use analytic estimates of the resonator and qubit frequencies to choose where the solver searches for modes
+        if self.user_options.get('analytic_seeding', False):
+            self._seed_user_options()
+
         #create gmsh geometry builder object and construct qiskit metal design in gmsh
-        GGB = GMSH_Geometry_Builder(self.design, self.simulation_type, self.ports)
+        stage_callback('geometry')
+        GGB = GMSH_Geometry_Builder(self.design, self.simulation_type, self.ports, self.user_options)
         _, _, _, dielectric_cutouts, ports_dict, metal_cap_physical_group, metal_cap_names, jj_dict = GGB.construct_geometry_in_GMSH()
+        if self.checkpoint is not None:
+            self.checkpoint.mark('geometry')
+
+        #additional configs which share the same mesh (e.g. one per excited port) along with their dependencies and helper scripts
+        sub_configs = {}
+        job_dependencies = {}
+        pre_run_commands = {}
+        support_files = []
+
+        #names of the lumped ports (in the order they are indexed by RF_Simulation) used to label the results
+        labels = {'ports': {str(m+1): x for m, x in enumerate(list(ports_dict.keys()) + list(jj_dict.keys()))}}
 
         #create simulation object
         if self.simulation_type == 'Eigenmode':
@@ -32,32 +84,172 @@ class PALACE_Simulation:
             physical_groups = eigen_sim.prepare_simulation()
             sim_config_file = eigen_sim.create_sim_config_file(physical_groups)
 
+            #only create the short trial runs used to tune the eigensolver settings
+            if self.user_options.get('eigen_autotune', False):
+                sub_configs = eigen_sim.create_autotune_config_files(sim_config_file)
+                sim_config_file = None
+
+            #split the frequency band into windows which are solved as separate jobs
+            elif self.user_options.get('freq_band') is not None:
+                sub_configs = eigen_sim.create_spectrum_slice_config_files(sim_config_file)
+                sim_config_file = None
+
+            #locate the modes with a low-order solve before running the full solve
+            elif self.user_options.get('two_stage', False):
+                sub_configs, job_dependencies, pre_run_commands = eigen_sim.create_two_stage_config_files(sim_config_file)
+                support_files = [os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Two_Stage_Refiner.py')]
+                sim_config_file = None
+
         elif self.simulation_type == 'Driven':
             driven_sim = Driven_Simulation(self.name, ports_dict, self.user_options, jj_dict, self.hpc_options)
             physical_groups = driven_sim.prepare_simulation()
             sim_config_file = driven_sim.create_sim_config_file(physical_groups)
 
+            #create a sibling simulation for each excited port
+            if self.user_options.get('excitation_mode', 'sequential') == 'siblings':
+                sub_configs = driven_sim.create_excitation_config_files(sim_config_file)
+                sim_config_file = None
+
         elif self.simulation_type == 'Capacitance':
-            cap_sim = Capacitance_Simulation(self.name, metal_cap_physical_group, metal_cap_names, self.user_options, self.hpc_options)
+            #restrict the terminals to the selected components (with all other metals grounded)
+            terminals, ground_groups = {}, []
+            if self.user_options.get('cap_terminals') is not None:
+                terminals, ground_groups = GGB.get_capacitance_terminals(metal_cap_physical_group, metal_cap_names, self.user_options['cap_terminals'],
+                                                                         self.user_options.get('cap_group_by_evaporations', False))
+
+            cap_sim = Capacitance_Simulation(self.name, metal_cap_physical_group, metal_cap_names, self.user_options, self.hpc_options, terminals, ground_groups)
+            labels = {'terminals': {str(m+1): x for m, x in enumerate(list(terminals.keys()) if terminals else metal_cap_names)}}
             physical_groups, metals = cap_sim.prepare_simulation()
             sim_config_file = cap_sim.create_sim_config_file(physical_groups)
 
+            #spread the terminal solves across independent jobs
+            if self.user_options.get('cap_terminals_per_job') is not None:
+                sub_configs = cap_sim.create_terminal_split_config_files(sim_config_file)
+                sim_config_file = None
+
         else:
             raise Exception("Simulation type incorrectly specified. Simulation type must be either 'Eigenmode', 'Driven', or 'Capacitance'.")
 
         #create gmsh mesh builder object and build the mesh for the design - currently using dielectric cutouts for fine meshing, can change to metals
-        GMB = GMSH_Mesh_Builder(dielectric_cutouts, self.user_options)
-        GMB.build_mesh()
+        #if the pipeline is used (hpc_options['pipeline']), the mesh is built on the HPC by the first job instead
+        stage_callback('mesh')
+        if not self.hpc_options.get('pipeline', False):
+            GMB = GMSH_Mesh_Builder(dielectric_cutouts, self.user_options)
+            GMB.build_mesh()
+        if self.checkpoint is not None:
+            self.checkpoint.mark('mesh')
+
+        #predict the sbatch resources which are missing or set to 'auto' in hpc_options
+        num_elements = self._get_num_elements()
+        hpc_options = self.hpc_options
+        if self.hpc_options and any([self.hpc_options.get(x, 'auto') == 'auto' for x in ['hpc_nodes', 'cpus_per_node', 'sim_memory', 'sim_time']]):
+            hpc_options = self._estimate_resources([sim_config_file] + list(sub_configs.values()), num_elements)
 
         #create Simulation Files Builder object to handle creation of config file and mesh file
-        SFB = Simulation_Files_Builder(self.name, self.user_options, sim_config_file, self.hpc_options)
+        #the files of an interrupted attempt are overwritten
+        stage_callback('files')
+        user_options = self.user_options
+        if self.checkpoint is not None and self.checkpoint.has_started():
+            user_options = {**self.user_options, 'overwrite': True}
+        SFB = Simulation_Files_Builder(self.name, user_options, sim_config_file, hpc_options, sub_configs,
+                                       job_dependencies, pre_run_commands, support_files, dielectric_cutouts, labels)
         SFB.create_simulation_files()
 
-        #open gmsh
-        gmsh.fltk.run()
+        #the jobs as written by the builder, i.e. without the cached jobs and with the copies of a scaling test
+        configs = SFB.configs
+        sim_info = {
+            'name': self.name,
+            'sim_directory': os.path.join(self.user_options['sim_directory'], self.name),
+            'hpc_options': hpc_options,
+            'num_elements': num_elements,
+            'resource_history': self._get_resource_history(),
+            'jobs': {x: {'config_file': os.path.join(self.user_options['sim_directory'], self.name, x + '.json'),
+                         'output': y['Problem']['Output'],
+                         'dependencies': job_dependencies.get(x, []),
+                         'pre_run_commands': pre_run_commands.get(x, []),
+                         'cached': False} for x, y in configs.items()}
+        }
+        sim_info['jobs'].update({x: {'config_file': y['config_file'], 'output': y['output'], 'dependencies': [], 'pre_run_commands': [],
+                                     'cached': True} for x, y in SFB.cached_jobs.items()})
+        if self.checkpoint is not None:
+            self.checkpoint.mark_files(sim_info)
+
+        #run Palace on this machine if no HPC is used
+        if not self.hpc_options and self.user_options.get('run_locally', False):
+            stage_callback('run')
+            sim_info['local_results'] = self._run_locally(sim_info)
+
+        #open gmsh - otherwise Gmsh is closed (or only its model is cleared) so that the next simulation starts from an empty model
+        if self.user_options.get('show_gui', True):
+            gmsh.fltk.run()
+        elif self.user_options.get('keep_gmsh_initialized', False):
+            gmsh.clear()
+        else:
+            gmsh.finalize()
 
-        
+        return sim_info
+
+
+    def _seed_user_options(self):
+        '''Replaces the frequency settings in user_options with those estimated from the design via ModeEstimator.'''
+
+        estimator = ModeEstimator(self.design, qubit_capacitances = self.user_options.get('qubit_capacitances', {}))
+        estimator.print()
+
+        if self.simulation_type == 'Eigenmode':
+            self.user_options = estimator.seed_eigenmode_options(self.user_options, self.user_options.get('seeding_margin', 0.1))
+        elif self.simulation_type == 'Driven':
+            self.user_options = estimator.seed_driven_options(self.user_options, self.user_options.get('seeding_margin', 0.1))
+
+
+    def _estimate_resources(self, configs, num_elements):
+        '''Returns a copy of hpc_options with the sbatch resources predicted by Resource_Estimator, taking the largest memory and wall time
+        over all jobs. The history of completed jobs is kept in hpc_options['resource_history'] (defaults to resource_history.json in the
+        simulation directory) and the finished jobs are added to it automatically.'''
+
+        assert num_elements is not None, "The number of mesh elements 'mesh_elements' must be given to estimate the resources when the mesh is built on the HPC."
+
+        estimator = Resource_Estimator(self._get_resource_history())
+        return estimator.fill_hpc_options(self.hpc_options, [x for x in configs if x is not None], num_elements)
+
+    def _get_num_elements(self):
+        #the mesh is only built locally if the pipeline is not used
+        if self.hpc_options.get('pipeline', False):
+            return self.hpc_options.get('mesh_elements')
+
+        _, element_tags, _ = gmsh.model.mesh.getElements(3)
+        return sum([len(x) for x in element_tags])
+
+    def _get_resource_history(self):
+        return self.hpc_options.get('resource_history', os.path.join(self.user_options['sim_directory'], 'resource_history.json'))
+
+
+    def _run_locally(self, sim_info):
+        '''Runs the Palace jobs of the simulation (except those whose results were found in the run index) via Local_Runner using the
+        optional user_options:
+            - local_max_cores - Defaults to all cores. Maximum number of cores used by all running jobs.
+            - local_cores_per_job - Defaults to 1. Number of MPI ranks for each job.
+            - palace_location - Defaults to 'palace'. Command which runs Palace.
+            - mpirun - Defaults to 'mpirun'. MPI launcher (None to run Palace directly).
+        Returns the results of each job (see Local_Runner.run). The jobs are not run again if they finished in a previous run.'''
+
+        if self.checkpoint is not None and self.checkpoint.is_complete('finished'):
+            return self.checkpoint.get('finished')['job_results']
 
+        runner = Local_Runner(self.user_options.get('local_max_cores'), self.user_options.get('palace_location', 'palace'),
+                              self.user_options.get('mpirun', 'mpirun'))
+        for job_name, job in sim_info['jobs'].items():
+            if not job['cached']:
+                runner.add_job(job_name, job['config_file'], self.user_options.get('local_cores_per_job', 1), job['dependencies'],
+                               job['pre_run_commands'])
 
+        if self.checkpoint is not None:
+            self.checkpoint.mark('submitted')
+        job_results = runner.run()
+        Resource_Estimator(self._get_resource_history()).record_jobs(sim_info, [x for x, y in job_results.items() if y['status'] == 'completed'],
+                                                                     self.user_options.get('local_cores_per_job', 1))
+        job_results.update({x: {'status': 'cached', 'returncode': None, 'time': 0.0, 'log_file': None} for x, y in sim_info['jobs'].items() if y['cached']})
+        if self.checkpoint is not None:
+            self.checkpoint.mark('finished', job_results=job_results)
 
-    
\ No newline at end of file
+        return job_results
@@ -0,0 +1,315 @@
+import os
+import copy
+import json
+import shutil
+import shlex
+
+try:
+    import jsonschema
+except ImportError:
+    jsonschema = None
+
+class Palace_Config:
+    '''Builds the Palace config shared by all simulation types from composable sections (model, materials, boundaries, postprocessing and
+    solver) and validates it locally, so that broken configs are caught before any simulation files are written or submitted.
+
+    Inputs:
+        - problem_type - Palace problem type: 'Eigenmode', 'Driven' or 'Electrostatic'.
+        - output - directory in which Palace writes the simulation results.
+        - mesh_location - location of the mesh file.
+        - mesh_refinement - number of uniform mesh refinement levels.
+        - L0 - (Optional) Defaults to 1e-3 (i.e. the mesh is in mm). Mesh length unit in metres.
+    '''
+
+    problem_types = ['Eigenmode', 'Driven', 'Electrostatic', 'Magnetostatic', 'Transient']
+
+    #boundaries which cannot share attributes with each other
+    exclusive_boundaries = ['PEC', 'Absorbing', 'LumpedPort', 'Terminal']
+
+    def __init__(self, problem_type, output, mesh_location, mesh_refinement, L0 = 1e-3):
+        self.config = {
+            "Problem":
+            {
+                "Type": problem_type,
+                "Verbose": 2,
+                "Output": output
+            },
+            "Model":
+            {
+                "Mesh":  mesh_location,
+                "L0": L0,
+                "Refinement":
+                {
+                "UniformLevels": mesh_refinement
+                },
+            },
+            "Domains":
+            {
+                "Materials": []
+            },
+            "Boundaries": {},
+            "Solver": {}
+        }
+
+    @staticmethod
+    def get_file_locations(name, user_options, hpc_options):
+        '''Returns a tuple (mesh_location, output) for the mesh file and the output directory. If hpc_options is not empty, the locations
+        on the HPC are used, otherwise the locations in user_options['sim_directory'] are used.'''
+
+        if hpc_options:
+            mesh_location = hpc_options['input_files_location'] + name + '/' + name + '.msh'
+            output = hpc_options['output_files_location'] + name
+        else:
+            mesh_location = os.path.join(user_options['sim_directory'], name, name + '.msh')
+            output = os.path.join(user_options['sim_directory'], name)
+
+        return mesh_location, output
+
+    @staticmethod
+    def derive_configs(name, config, suffixes, modify):
+        '''Returns copies of the config keyed by job name (name + suffix) for each suffix, whose output directories carry the same suffix.
+        Each copy is changed via modify(copy, m) where m is the position of its suffix.'''
+
+        configs = {}
+        for m, suffix in enumerate(suffixes):
+            derived_config = copy.deepcopy(config)
+            derived_config['Problem']['Output'] = config['Problem']['Output'] + suffix
+            modify(derived_config, m)
+            configs[name + suffix] = derived_config
+
+        return configs
+
+    def add_material(self, attributes, permittivity, permeability = 1.0, loss_tangent = 0.0):
+        self.config['Domains']['Materials'].append({
+            "Attributes": attributes,
+            "Permeability": permeability,
+            "Permittivity": permittivity,
+            "LossTan": loss_tangent
+        })
+
+    def add_air_and_substrate(self, physical_groups, dielectric):
+        '''Adds the air box and the dielectric substrate (Material object) as the materials in the domain.'''
+
+        self.add_material([physical_groups['air_box']], 1.0)                                     # Air
+        self.add_material([physical_groups['dielectric_substrate']], dielectric.permittivity,    # Dielectric
+                          dielectric.permeability, getattr(dielectric, 'loss_tangent', 0.0))
+
+    def set_boundary(self, boundary_type, boundary):
+        '''Sets a boundary section (e.g. 'PEC', 'Absorbing', 'LumpedPort' or 'Terminal') of the config.'''
+        self.config['Boundaries'][boundary_type] = boundary
+
+    def add_postprocessing(self, postprocessing_type, entries):
+        '''Adds entries to a postprocessing section (e.g. 'Dielectric' or 'SurfaceFlux') of the boundaries.'''
+        postprocessing = self.config['Boundaries'].setdefault('Postprocessing', {})
+        postprocessing.setdefault(postprocessing_type, []).extend(entries)
+
+    def add_interface_dielectrics(self, physical_groups, thickness = 2e-9):
+        '''Adds the substrate-air (SA), metal-substrate (MS) and metal-air (MA) interfaces for the surface participation ratios with the
+        indices 1, 2 and 3. The thickness of the interfaces is given in metres (defaults to 2 nm) and converted into mesh units.'''
+
+        thickness = thickness / self.config['Model']['L0']
+
+        #the indices stay fixed (as the participation ratios are read by index) even if there are no gaps for the SA interface
+        interfaces = [(1, {"Attributes": [physical_groups.get('dielectric_gaps')], "Type": "SA", "LossTan": 0.9e-3}),
+                      (2, {"Attributes": [physical_groups['metals']], "Type": "MS", "LossTan": 0.3e-3}),
+                      (3, {"Attributes": [physical_groups['metals']], "Type": "MA", "LossTan": 0.5e-3})]
+        if physical_groups.get('dielectric_gaps') is None:
+            interfaces = interfaces[1:]
+
+        for index, interface in interfaces:
+            self.add_postprocessing('Dielectric', [{
+                "Index": index,
+                "Attributes": interface['Attributes'],
+                "Type": interface['Type'],
+                "Thickness": thickness,
+                "Permittivity": 10.0,
+                "LossTan": interface['LossTan']
+            }])
+
+    def set_solver(self, order, problem_section, linear_section):
+        '''Sets the solver order, the problem specific solver section (e.g. Solver['Eigenmode']) and the linear solver section.'''
+
+        self.config['Solver']['Order'] = order
+        self.config['Solver'][self.config['Problem']['Type']] = problem_section
+        self.config['Solver']['Linear'] = linear_section
+
+    def apply_output_profile(self, user_options):
+        '''Sets which fields are saved to disk for visualization (the CSV postprocessing data is always written) via the optional
+        user_options:
+            - output_profile - Defaults to 'full'. 'full' saves the fields set via 'solns_to_save', 'lean' saves no fields and 'selective'
+                               only saves the fields for 'save_modes' (Eigenmode/Electrostatic) or 'save_freqs' (Driven).
+            - save_modes - list of the mode (or terminal) numbers whose fields are saved. Palace saves the fields of the first 'Save' modes, so
+                           the modes below the highest requested mode are also saved.
+            - save_freqs - list of the frequencies (GHz) whose fields are saved. Note that this uses the 'Save' syntax of the Driven solver,
+                           which requires Palace v0.14 or later.
+        '''
+
+        profile = user_options.get('output_profile', 'full')
+        problem_type = self.config['Problem']['Type']
+        solver = self.config['Solver'][problem_type]
+
+        if profile == 'full':
+            return
+        elif profile == 'lean':
+            solver['SaveStep' if problem_type == 'Driven' else 'Save'] = 0
+        elif profile == 'selective':
+            if problem_type == 'Driven':
+                assert user_options.get('save_freqs'), "The 'selective' output profile requires 'save_freqs' for Driven simulations."
+                solver['SaveStep'] = 0
+                solver['Save'] = sorted(user_options['save_freqs'])
+            else:
+                assert user_options.get('save_modes'), f"The 'selective' output profile requires 'save_modes' for {problem_type} simulations."
+                solver['Save'] = max(user_options['save_modes'])
+        else:
+            raise Exception(f"Output profile '{profile}' must be 'full', 'lean' or 'selective'.")
+
+    def get_config(self):
+        '''Returns the validated config as a dictionary.'''
+        Palace_Config.validate_config(self.config)
+        return self.config
+
+    @staticmethod
+    def validate_config(config, schema_file = None):
+        '''Validates a Palace config dictionary. Raises an exception listing all problems found.
+
+        Args:
+            config - config dictionary.
+            schema_file - (Optional) Palace JSON schema (i.e. scripts/schema/config-schema.json in the Palace repository, see find_schema).
+                          If given, the config is also validated against the schema, which requires the jsonschema package.
+        '''
+
+        errors = []
+
+        def check(condition, message):
+            if not condition:
+                errors.append(message)
+
+        def is_number(value):
+            return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+        def is_attribute_list(value):
+            return isinstance(value, list) and len(value) > 0 and all([isinstance(x, int) and not isinstance(x, bool) and x > 0 for x in value])
+
+        #values left unset (e.g. missing user options) are never valid
+        def find_none(value, path):
+            if value is None:
+                errors.append(f"'{path}' is not set.")
+            elif isinstance(value, dict):
+                for key in value:
+                    find_none(value[key], path + '/' + key)
+            elif isinstance(value, list):
+                for m, x in enumerate(value):
+                    find_none(x, path + '/' + str(m))
+        find_none(config, '')
+
+        problem = config.get('Problem', {})
+        check(problem.get('Type') in Palace_Config.problem_types, f"Problem type '{problem.get('Type')}' must be one of {Palace_Config.problem_types}.")
+        check(isinstance(problem.get('Output'), str) and len(problem.get('Output', '')) > 0, "Problem output directory must be given.")
+
+        model = config.get('Model', {})
+        check(isinstance(model.get('Mesh'), str) and model.get('Mesh', '').endswith('.msh'), f"Mesh location '{model.get('Mesh')}' must be a .msh file.")
+        check(is_number(model.get('L0')) and model.get('L0', 0) > 0, "Model L0 must be a positive number.")
+        levels = model.get('Refinement', {}).get('UniformLevels', 0)
+        check(isinstance(levels, int) and levels >= 0, f"Mesh refinement '{levels}' must be a non-negative integer.")
+
+        for m, material in enumerate(config.get('Domains', {}).get('Materials', [])):
+            check(is_attribute_list(material.get('Attributes')), f"Material {m} attributes {material.get('Attributes')} must be a list of positive integers.")
+            check(is_number(material.get('Permittivity')) and material.get('Permittivity', 0) >= 1, f"Material {m} permittivity must be a number of at least 1.")
+            check(is_number(material.get('LossTan', 0)) and material.get('LossTan', 0) >= 0, f"Material {m} loss tangent must be non-negative.")
+
+        #boundary attributes and indices
+        boundaries = config.get('Boundaries', {})
+        boundary_attributes = {}
+        for boundary_type in Palace_Config.exclusive_boundaries:
+            boundary = boundaries.get(boundary_type)
+            if boundary is None:
+                continue
+            entries = boundary if isinstance(boundary, list) else [boundary]
+            attributes = []
+            for entry in entries:
+                for element in entry.get('Elements', [entry]):
+                    check(is_attribute_list(element.get('Attributes')), f"{boundary_type} attributes {element.get('Attributes')} must be a list of positive integers.")
+                    if is_attribute_list(element.get('Attributes')):
+                        attributes += element['Attributes']
+            boundary_attributes[boundary_type] = set(attributes)
+            if isinstance(boundary, list):
+                indices = [x.get('Index') for x in boundary]
+                check(len(indices) == len(set(indices)), f"{boundary_type} indices {indices} must be unique.")
+
+        for m, type_a in enumerate(boundary_attributes):
+            for type_b in list(boundary_attributes)[m+1:]:
+                shared = boundary_attributes[type_a] & boundary_attributes[type_b]
+                check(len(shared) == 0, f"Attributes {sorted(shared)} are in both the {type_a} and {type_b} boundaries.")
+
+        for postprocessing_type, entries in boundaries.get('Postprocessing', {}).items():
+            indices = [x.get('Index') for x in entries]
+            check(len(indices) == len(set(indices)), f"Postprocessing {postprocessing_type} indices {indices} must be unique.")
+            for entry in entries:
+                check(is_attribute_list(entry.get('Attributes')), f"Postprocessing {postprocessing_type} attributes {entry.get('Attributes')} must be a list of positive integers.")
+                if 'Thickness' in entry and is_number(entry['Thickness']) and is_number(model.get('L0')):
+                    thickness = entry['Thickness'] * model['L0']
+                    #interface layers are nanometres thick, so a thickness of microns or more comes from mixing up the units
+                    check(1e-10 <= thickness <= 1e-7, f"Postprocessing {postprocessing_type} thickness of {thickness} m is not physical (thickness is given in mesh units).")
+
+        #solver settings
+        solver = config.get('Solver', {})
+        check(isinstance(solver.get('Order'), int) and solver.get('Order', 0) >= 1, f"Solver order '{solver.get('Order')}' must be a positive integer.")
+        eigen = solver.get('Eigenmode')
+        if problem.get('Type') == 'Eigenmode' and eigen is not None:
+            check(isinstance(eigen.get('N'), int) and eigen.get('N', 0) >= 1, "Eigenmode N must be a positive integer.")
+            check(is_number(eigen.get('Target')) and eigen.get('Target', 0) > 0, "Eigenmode target frequency must be positive.")
+            check(is_number(eigen.get('Tol')) and eigen.get('Tol', 0) > 0, "Eigenmode tolerance must be positive.")
+            if eigen.get('MaxSize') is not None and isinstance(eigen.get('N'), int):
+                check(eigen['MaxSize'] > eigen['N'], "Eigenmode MaxSize must be larger than N.")
+        driven = solver.get('Driven')
+        if problem.get('Type') == 'Driven' and driven is not None:
+            if 'Samples' in driven:
+                check(isinstance(driven['Samples'], list) and len(driven['Samples']) > 0, "Driven samples must be a non-empty list.")
+            else:
+                check(is_number(driven.get('MinFreq')) and is_number(driven.get('MaxFreq')) and driven.get('MinFreq', 0) < driven.get('MaxFreq', 0),
+                      "Driven MinFreq must be smaller than MaxFreq.")
+                check(is_number(driven.get('FreqStep')) and driven.get('FreqStep', 0) > 0, "Driven FreqStep must be positive.")
+                for freq in driven.get('Save', []):
+                    check(driven.get('MinFreq', 0) <= freq <= driven.get('MaxFreq', 0), f"Driven save frequency {freq} GHz lies outside the sweep.")
+            check(problem.get('Type') != 'Driven' or any([x.get('Excitation', False) for x in boundaries.get('LumpedPort', [])]),
+                  "Driven simulations need at least one excited port.")
+        if problem.get('Type') == 'Electrostatic':
+            check(len(boundaries.get('Terminal', [])) > 0, "Electrostatic simulations need at least one terminal.")
+
+        #optional validation against the Palace JSON schema - the schema refers to the files of each section (e.g. config/model.json)
+        #relative to its own location
+        if schema_file is not None:
+            if jsonschema is None:
+                raise Exception("Validating against the Palace schema requires the jsonschema package (pip install jsonschema).")
+            if not os.path.isfile(schema_file):
+                raise Exception(f"Palace schema '{schema_file}' does not exist.")
+            with open(schema_file) as f:
+                schema = json.load(f)
+            resolver = jsonschema.RefResolver('file://' + os.path.abspath(schema_file), schema)
+            validator = jsonschema.validators.validator_for(schema)(schema, resolver=resolver)
+            for error in validator.iter_errors(config):
+                errors.append(f"Schema: {'/'.join([str(x) for x in error.path])}: {error.message}")
+
+        if errors:
+            raise Exception("Invalid Palace config:\n\t" + "\n\t".join(errors))
+
+    @staticmethod
+    def find_schema(palace_location = 'palace'):
+        '''Returns the Palace JSON schema (config-schema.json) of the Palace installation which runs via palace_location (e.g. 'palace' or
+        '/opt/palace/bin/palace'). The schema is looked up in the install prefix (share/palace/schema or scripts/schema) and in the Palace
+        repository above a build directory. Raises an exception if Palace or the schema cannot be found.'''
+
+        palace_executable = shutil.which(shlex.split(palace_location)[0])
+        if palace_executable is None:
+            raise Exception(f"Palace executable '{palace_location}' was not found, so its schema cannot be located.")
+
+        prefix = os.path.dirname(os.path.dirname(os.path.realpath(palace_executable)))
+        schema_files = [os.path.join(prefix, 'share', 'palace', 'schema', 'config-schema.json'),
+                        os.path.join(prefix, 'scripts', 'schema', 'config-schema.json'),
+                        os.path.join(os.path.dirname(prefix), 'scripts', 'schema', 'config-schema.json')]
+        for schema_file in schema_files:
+            if os.path.isfile(schema_file):
+                return schema_file
+
+        raise Exception(f"The Palace schema was not found in {schema_files}. Set user_options['palace_schema'] to the location of "
+                        "scripts/schema/config-schema.json in the Palace repository.")
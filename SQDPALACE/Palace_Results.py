@@ -0,0 +1,366 @@
+import os
+import sys
+import re
+import json
+import numpy as np
+
+class Palace_Results:
+
+    @staticmethod
+    def read_palace_csv(file_path):
+        '''Reads a CSV file written by Palace into its column headers and a numpy array of the data.
+
+        Args:
+            file_path - path to the Palace CSV file (e.g. port-S.csv or eig.csv).
+
+        Returns:
+            Tuple (headers, data) where headers is a list of the stripped column names and data is a 2D numpy array with one row per line.
+        '''
+
+        #the values are split in one pass rather than row by row, as this is much faster for large files
+        #the headers of some files are not ASCII (e.g. the electric flux 'Phi_elec' in surface-F.csv is written with the Greek letter)
+        with open(file_path, encoding='utf-8') as f:
+            headers = [x.strip() for x in f.readline().split(',')]
+            values = f.read().replace(',', ' ').split()
+
+        data = np.array(values, dtype=float).reshape(-1, len(headers))
+
+        return headers, data
+
+
+    @staticmethod
+    def merge_s_parameters(output_dirs):
+        '''Merges the S-parameters from one or more Driven simulations (e.g. sibling simulations with a different excited port over the
+        same mesh) into a single N-port dataset.
+
+        Args:
+            output_dirs - list of Palace output directories, each containing a port-S.csv file.
+
+        Returns:
+            Tuple (freqs, s_matrix) where freqs is a numpy array of frequencies in GHz and s_matrix is a complex numpy array of shape
+            (number of frequencies, N, N) with s_matrix[f, i, j] = S[i+1][j+1]. Entries which were not simulated are set to NaN.
+        '''
+
+        if isinstance(output_dirs, str):
+            output_dirs = [output_dirs]
+
+        freqs = None
+        s_params = {}
+        for output_dir in output_dirs:
+            headers, data = Palace_Results.read_palace_csv(os.path.join(output_dir, 'port-S.csv'))
+
+            cur_freqs = data[:, 0]
+            if freqs is None:
+                freqs = cur_freqs
+            elif freqs.size != cur_freqs.size or not np.allclose(freqs, cur_freqs):
+                raise Exception(f"Frequencies in '{output_dir}' do not match the other simulations. Cannot merge S-parameters.")
+
+            #magnitude (dB) and phase (deg.) columns are given for each S[i][j] where j is the excited port
+            for col, header in enumerate(headers):
+                match = re.match(r'\|S\[(\d+)\]\[(\d+)\]\| \(dB\)', header)
+                if match is None:
+                    continue
+                i, j = int(match.group(1)), int(match.group(2))
+                phase_col = headers.index(f'arg(S[{i}][{j}]) (deg.)')
+                s_params[(i, j)] = 10**(data[:, col]/20) * np.exp(1j*np.deg2rad(data[:, phase_col]))
+
+        assert len(s_params) > 0, "No S-parameters found in the given output directories."
+
+        num_ports = max([max(x) for x in s_params.keys()])
+        s_matrix = np.full((freqs.size, num_ports, num_ports), np.nan, dtype=complex)
+        for (i, j), values in s_params.items():
+            s_matrix[:, i-1, j-1] = values
+
+        return freqs, s_matrix
+
+
+    @staticmethod
+    def merge_spectrum_slices(output_dirs, windows, rel_tol = 1e-4):
+        '''Merges the eigenmodes found in separate spectrum windows (see Eigenmode_Simulation.create_spectrum_slice_config_files) into a
+        single list of modes. Modes outside their window are discarded and modes found in adjacent windows are deduplicated.
+
+        Args:
+            output_dirs - list of Palace output directories (one per window), each containing an eig.csv file.
+            windows - list of tuples (lower, upper) for the frequency bounds of each window in GHz (same order as output_dirs).
+            rel_tol - (Optional) Defaults to 1e-4. Modes with a relative frequency difference below this are considered to be the same mode.
+
+        Returns:
+            Tuple (headers, data) in the same format as eig.csv with the modes sorted by frequency and renumbered.
+        '''
+
+        assert len(output_dirs) == len(windows), "There must be one output directory per spectrum window."
+
+        all_modes = []
+        for m, (output_dir, (lower, upper)) in enumerate(zip(output_dirs, windows)):
+            headers, data = Palace_Results.read_palace_csv(os.path.join(output_dir, 'eig.csv'))
+            freqs = data[:, headers.index('Re{f} (GHz)')]
+
+            #if all modes found lie inside the window, there may be more modes in the window than were requested
+            if freqs.size > 0 and freqs.max() < upper:
+                print(f'Warning: window {m} ({lower} GHz to {upper} GHz) may contain more modes than were solved for. Increase modes_per_window.')
+
+            last_window = m == len(windows) - 1
+            in_window = (freqs >= lower) & ((freqs < upper) | (last_window & (freqs <= upper)))
+            all_modes.append(data[in_window])
+
+        data = np.concatenate(all_modes, axis=0)
+        freq_col = headers.index('Re{f} (GHz)')
+        data = data[np.argsort(data[:, freq_col])]
+
+        #remove duplicate modes found at the edges of adjacent windows
+        keep = np.ones(data.shape[0], dtype=bool)
+        for m in range(1, data.shape[0]):
+            if abs(data[m, freq_col] - data[m-1, freq_col]) <= rel_tol * abs(data[m, freq_col]):
+                keep[m] = False
+        data = data[keep]
+
+        if 'm' in headers:
+            data[:, headers.index('m')] = np.arange(1, data.shape[0]+1)
+
+        return headers, data
+
+
+    @staticmethod
+    def merge_capacitance_slices(output_dirs, terminal_names = None):
+        '''Assembles the Maxwell capacitance matrix from capacitance simulations where the terminals were split across jobs (see
+        Capacitance_Simulation.create_terminal_split_config_files). A single capacitance simulation may also be given.
+
+        Args:
+            output_dirs - list of Palace output directories, each containing a terminal-C.csv file (and a surface-F.csv file with the
+                          charges on the grounded terminals of the other jobs).
+            terminal_names - (Optional) list of the terminal names in order of the terminal index. Used to label the printed matrix.
+
+        Returns:
+            Symmetrized Maxwell capacitance matrix (in F) as a numpy array where entry [i, j] corresponds to terminals i+1 and j+1.
+        '''
+
+        if isinstance(output_dirs, str):
+            output_dirs = [output_dirs]
+
+        entries = {}
+        for output_dir in output_dirs:
+            #capacitances between the terminals solved in this job
+            headers, data = Palace_Results.read_palace_csv(os.path.join(output_dir, 'terminal-C.csv'))
+            for col, header in enumerate(headers):
+                match = re.match(r'C\[i\]\[(\d+)\]', header)
+                if match is not None:
+                    for row in data:
+                        entries[(int(row[0]), int(match.group(1)))] = row[col]
+
+            #charges induced on the grounded terminals (solved in other jobs) for each terminal solved in this job at 1 V, i.e. the
+            #electric flux Phi_elec[j] (C) through each grounded terminal
+            surface_file = os.path.join(output_dir, 'surface-F.csv')
+            if os.path.exists(surface_file):
+                headers, data = Palace_Results.read_palace_csv(surface_file)
+                for col, header in enumerate(headers):
+                    match = re.search(r'elec\[(\d+)\]', header)
+                    if match is not None:
+                        for row in data:
+                            entries[(int(match.group(1)), int(row[0]))] = row[col]
+
+        assert len(entries) > 0, "No capacitances found in the given output directories."
+
+        num_terminals = max([max(x) for x in entries.keys()])
+        cap_matrix = np.full((num_terminals, num_terminals), np.nan)
+        for (i, j), value in entries.items():
+            cap_matrix[i-1, j-1] = value
+
+        #symmetrize - entries only computed in one direction are taken as is
+        cap_matrix = np.nanmean(np.stack([cap_matrix, cap_matrix.T]), axis=0)
+
+        if terminal_names is not None:
+            print('Maxwell capacitance matrix (F):')
+            for m, name in enumerate(terminal_names):
+                print(f'\t{name}: ' + ', '.join([f'{x:.4e}' for x in cap_matrix[m]]))
+
+        return cap_matrix
+
+
+    @staticmethod
+    def get_elapsed_time(output_dir):
+        '''Returns the total wall time in seconds of a Palace run as recorded in palace.json in the output directory (None if unavailable).'''
+
+        file_path = os.path.join(output_dir, 'palace.json')
+        if not os.path.exists(file_path):
+            return None
+
+        with open(file_path) as f:
+            metadata = json.load(f)
+
+        return metadata.get('ElapsedTime', {}).get('Durations', {}).get('Total')
+
+
+    @staticmethod
+    def select_autotune_params(config_files, output_dirs = None, rel_freq_tol = 1e-5):
+        '''Selects the eigensolver settings from the trial runs created by Eigenmode_Simulation.create_autotune_config_files. The fastest
+        trial is chosen out of the trials that found the requested number of modes with frequencies that agree with the most accurate trial
+        (smallest tolerance and largest subspace).
+
+        Args:
+            config_files - list of the trial config (.json) files.
+            output_dirs - (Optional) list of the output directories of each trial. Defaults to the 'Output' path in each config file (i.e.
+                          the results must have been copied back if the trials were run on the HPC).
+            rel_freq_tol - (Optional) Defaults to 1e-5. Maximum relative frequency error with respect to the most accurate trial.
+
+        Returns:
+            Dictionary with the 'eigen_max_size' and 'eigen_tol' settings to use in user_options.
+        '''
+
+        trials = []
+        for m, config_file in enumerate(config_files):
+            with open(config_file) as f:
+                config = json.load(f)
+            output_dir = output_dirs[m] if output_dirs is not None else config['Problem']['Output']
+
+            if not os.path.exists(os.path.join(output_dir, 'eig.csv')):
+                print(f"Trial '{config_file}' has no results and is ignored.")
+                continue
+            headers, data = Palace_Results.read_palace_csv(os.path.join(output_dir, 'eig.csv'))
+
+            trials.append({'max_size': config['Solver']['Eigenmode']['MaxSize'],
+                           'tol': config['Solver']['Eigenmode']['Tol'],
+                           'num_modes': config['Solver']['Eigenmode']['N'],
+                           'freqs': np.sort(data[:, headers.index('Re{f} (GHz)')]),
+                           'time': Palace_Results.get_elapsed_time(output_dir)})
+
+        assert len(trials) > 0, "None of the autotune trials have results."
+
+        reference = min(trials, key=lambda x: (x['tol'], -x['max_size']))
+        assert reference['freqs'].size >= reference['num_modes'], "The most accurate autotune trial did not find the requested number of modes."
+
+        valid_trials = []
+        for trial in trials:
+            if trial['time'] is None or trial['freqs'].size < trial['num_modes']:
+                continue
+            num_modes = trial['num_modes']
+            freq_error = np.abs(trial['freqs'][:num_modes] / reference['freqs'][:num_modes] - 1)
+            if np.all(freq_error <= rel_freq_tol):
+                valid_trials.append(trial)
+
+        assert len(valid_trials) > 0, "None of the autotune trials converged to the requested modes with timing information."
+
+        best = min(valid_trials, key=lambda x: x['time'])
+        print(f"Selected Krylov subspace size {best['max_size']} and tolerance {best['tol']} ({best['time']:.1f} s).")
+
+        return {'eigen_max_size': best['max_size'], 'eigen_tol': best['tol']}
+
+
+    @staticmethod
+    def get_output_bytes_report(output_dirs, report_file = None):
+        '''Reports the number of bytes written by one or more Palace runs, split into the saved fields (ParaView/GridFunction files), the
+        postprocessing CSV files and other files (e.g. palace.json). Used to check the I/O cost of the output profile (see
+        Palace_Config.apply_output_profile).
+
+        Args:
+            output_dirs - list of Palace output directories (or a single directory).
+            report_file - (Optional) if given, the report is also written to this file as JSON (e.g. io_report.json).
+
+        Returns:
+            Dictionary keyed by output directory with the bytes written for 'fields', 'csv', 'other' and 'total'.
+        '''
+
+        if isinstance(output_dirs, str):
+            output_dirs = [output_dirs]
+
+        report = {}
+        for output_dir in output_dirs:
+            bytes_written = {'fields': 0, 'csv': 0, 'other': 0}
+            for root, _, files in os.walk(output_dir):
+                in_field_dir = any([x in ['paraview', 'gridfunction'] for x in os.path.relpath(root, output_dir).split(os.sep)])
+                for file in files:
+                    size = os.path.getsize(os.path.join(root, file))
+                    if in_field_dir or os.path.splitext(file)[1] in ['.pvd', '.vtu', '.pvtu', '.gf', '.mesh']:
+                        bytes_written['fields'] += size
+                    elif file.endswith('.csv'):
+                        bytes_written['csv'] += size
+                    else:
+                        bytes_written['other'] += size
+            bytes_written['total'] = sum(bytes_written.values())
+            report[output_dir] = bytes_written
+
+            print(f"{output_dir}: {bytes_written['total']/1e6:.2f} MB written ({bytes_written['fields']/1e6:.2f} MB fields, {bytes_written['csv']/1e6:.2f} MB CSV).")
+
+        if report_file is not None:
+            with open(report_file, 'w') as f:
+                json.dump(report, f, indent=2)
+
+        return report
+
+
+    @staticmethod
+    def summarize_outputs(output_dirs, summary_file):
+        '''Condenses the results of the Palace runs of a simulation into a single JSON summary. This is run as the postprocessing job of
+        the simulation pipeline on the HPC (see Simulation_Files_Builder), i.e.:
+
+            python Palace_Results.py <summary file> <output directory> <output directory> ...
+
+        The summary contains the eigenmodes (frequency and Q) of each run, the S-parameters merged over all Driven runs, the Maxwell
+        capacitance matrix merged over all capacitance runs and the wall time and bytes written of each run.
+
+        Args:
+            output_dirs - list of Palace output directories.
+            summary_file - location of the summary (.json) file to write.
+
+        Returns:
+            Dictionary of the summary.
+        '''
+
+        summary = {'runs': {}}
+        s_param_dirs, cap_dirs = [], []
+        for output_dir in output_dirs:
+            run = {'elapsed_time': Palace_Results.get_elapsed_time(output_dir),
+                   'bytes_written': Palace_Results.get_output_bytes_report(output_dir)[output_dir]}
+
+            if os.path.exists(os.path.join(output_dir, 'eig.csv')):
+                headers, data = Palace_Results.read_palace_csv(os.path.join(output_dir, 'eig.csv'))
+                run['freqs'] = data[:, headers.index('Re{f} (GHz)')].tolist()
+                if 'Q' in headers:
+                    run['Q'] = data[:, headers.index('Q')].tolist()
+            if os.path.exists(os.path.join(output_dir, 'port-S.csv')):
+                s_param_dirs.append(output_dir)
+            if os.path.exists(os.path.join(output_dir, 'terminal-C.csv')):
+                cap_dirs.append(output_dir)
+
+            summary['runs'][output_dir] = run
+
+        if s_param_dirs:
+            freqs, s_matrix = Palace_Results.merge_s_parameters(s_param_dirs)
+            summary['s_parameters'] = {'freqs': freqs.tolist(), 'real': s_matrix.real.tolist(), 'imag': s_matrix.imag.tolist()}
+        if cap_dirs:
+            summary['capacitance_matrix'] = Palace_Results.merge_capacitance_slices(cap_dirs).tolist()
+
+        #NaN (i.e. entries which were not simulated) and infinities are not valid JSON, so they are written as null
+        def replace_non_finite(value):
+            if isinstance(value, dict):
+                return {x: replace_non_finite(y) for x, y in value.items()}
+            if isinstance(value, list):
+                return [replace_non_finite(x) for x in value]
+            if isinstance(value, float) and not np.isfinite(value):
+                return None
+            return value
+
+        with open(summary_file, 'w') as f:
+            json.dump(replace_non_finite(summary), f, indent=2, allow_nan=False)
+
+        print(f"Summary of {len(output_dirs)} runs written to '{summary_file}'.")
+
+        return summary
+
+
+    @staticmethod
+    def select_launch_profile(output_dirs):
+        '''Returns the fastest launch profile of a scaling test (see Simulation_Files_Builder) from a dictionary of the output directories
+        keyed by the launch profile.'''
+
+        times = {x: Palace_Results.get_elapsed_time(y) for x, y in output_dirs.items()}
+        for profile, time in times.items():
+            print(f"{profile}: " + (f"{time:.1f} s" if time is not None else "no timing information"))
+
+        times = {x: y for x, y in times.items() if y is not None}
+        assert len(times) > 0, "None of the launch profiles have timing information."
+
+        return min(times, key=times.get)
+
+
+if __name__ == '__main__':
+    Palace_Results.summarize_outputs(sys.argv[2:], sys.argv[1])
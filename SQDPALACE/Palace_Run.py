@@ -0,0 +1,156 @@
+import os
+import re
+import json
+import numpy as np
+from Palace_Results import Palace_Results
+
+class Palace_Run:
+    '''Reads the outputs of a single Palace run into typed numpy structures. Each output is only parsed when it is first accessed and is
+    cached afterwards (until the file changes), so that many runs can be opened cheaply, e.g.:
+
+        runs = Palace_Run.from_sim_info(sim_info)
+        modes = runs['my_sim'].eigenmodes          #structured array with the fields 'mode', 'freq', 'freq_imag', 'Q', ...
+        epr = runs['my_sim'].port_epr              #structured array with the fields 'mode' and one per junction (e.g. 'jj_0')
+
+    The ports, terminals and surfaces are labelled via the labels written by Simulation_Files_Builder (<name>_labels.json in the simulation
+    directory), i.e. the names in ports_dict and jj_dict for the lumped ports, the terminal names (metal_cap_names or the selected
+    capacitance terminals) and the interface types ('SA', 'MS' and 'MA') for the dielectric surfaces. Indices without a label keep their
+    Palace index.
+
+    Inputs:
+        - output_dir - Palace output directory.
+        - labels - (Optional) dictionary of the labels or the location of the labels (.json) file.
+    '''
+
+    #fields of the eigenmode table and the eig.csv column they are read from
+    eigenmode_columns = {'mode': 'm', 'freq': 'Re{f} (GHz)', 'freq_imag': 'Im{f} (GHz)', 'Q': 'Q', 'error_bkwd': 'Error (Bkwd.)', 'error_abs': 'Error (Abs.)'}
+
+    def __init__(self, output_dir, labels = None):
+        self.output_dir = output_dir
+
+        if isinstance(labels, str):
+            with open(labels) as f:
+                labels = json.load(f)
+        self.labels = labels if labels is not None else {}
+
+        self._cache = {}
+
+    @staticmethod
+    def from_sim_info(sim_info):
+        '''Returns a dictionary keyed by job name with a Palace_Run for each job of a simulation (see PALACE_Simulation.run_simulation).'''
+
+        labels_file = os.path.join(sim_info['sim_directory'], sim_info['name'] + '_labels.json')
+        labels = labels_file if os.path.exists(labels_file) else None
+
+        return {x: Palace_Run(y['output'], labels) for x, y in sim_info['jobs'].items()}
+
+    def has_output(self, file_name):
+        return os.path.exists(os.path.join(self.output_dir, file_name))
+
+    def read_csv(self, file_name):
+        '''Returns the tuple (headers, data) of a Palace CSV file in the output directory (see Palace_Results.read_palace_csv).'''
+        return self._load(file_name, file_name, lambda: Palace_Results.read_palace_csv(os.path.join(self.output_dir, file_name)))
+
+    def _load(self, key, file_name, loader):
+        #the output is only parsed again if its file has changed since it was last read
+        modified = os.path.getmtime(os.path.join(self.output_dir, file_name))
+        if key not in self._cache or self._cache[key][0] != modified:
+            self._cache[key] = (modified, loader())
+
+        return self._cache[key][1]
+
+    def read_indexed_table(self, file_name, label_type = 'ports'):
+        '''Returns a structured array of a Palace CSV file whose columns are indexed by port, terminal or surface (e.g. 'p[1]' in
+        port-EPR.csv). The mode (or frequency) column is named 'mode' (or 'freq') and each indexed column is named after its label, i.e.
+        '<label>' for a single quantity per index or '<quantity>_<label>' if the file has several quantities per index.
+
+        Args:
+            file_name - name of the CSV file in the output directory.
+            label_type - (Optional) Defaults to 'ports'. Labels used for the indices: 'ports', 'terminals' or 'surfaces'.
+        '''
+
+        return self._load('table:' + file_name, file_name, lambda: self._read_indexed_table(file_name, label_type))
+
+    def _read_indexed_table(self, file_name, label_type):
+
+        headers, data = self.read_csv(file_name)
+        labels = self.labels.get(label_type, {})
+
+        columns = []
+        for header in headers:
+            match = re.match(r'^(.*?)\[(\d+)\]', header)
+            if match is None:
+                columns.append('freq' if header.startswith('f (') else ('mode' if header == 'm' else header))
+            else:
+                columns.append((match.group(1), labels.get(match.group(2), match.group(2))))
+
+        quantities = set([x[0] for x in columns if isinstance(x, tuple)])
+        names = [x if not isinstance(x, tuple) else (x[1] if len(quantities) == 1 else x[0] + '_' + x[1]) for x in columns]
+
+        table = np.zeros(data.shape[0], dtype=[(x, np.int32 if x == 'mode' else np.float64) for x in names])
+        for col, name in enumerate(names):
+            table[name] = data[:, col]
+
+        return table
+
+    @property
+    def eigenmodes(self):
+        '''Structured array of the eigenmodes (eig.csv) with the fields 'mode', 'freq' (GHz), 'freq_imag' (GHz), 'Q', 'error_bkwd' and
+        'error_abs'. Columns missing from the file are NaN.'''
+
+        return self._load('eigenmodes', 'eig.csv', self._read_eigenmodes)
+
+    def _read_eigenmodes(self):
+
+        headers, data = self.read_csv('eig.csv')
+        table = np.zeros(data.shape[0], dtype=[(x, np.int32 if x == 'mode' else np.float64) for x in Palace_Run.eigenmode_columns])
+        for name, header in Palace_Run.eigenmode_columns.items():
+            table[name] = data[:, headers.index(header)] if header in headers else np.nan
+
+        return table
+
+    @property
+    def s_parameters(self):
+        '''Tuple (freqs, s_matrix, port_labels) of the S-parameters (port-S.csv), where s_matrix[f, i, j] = S[i+1][j+1] (see
+        Palace_Results.merge_s_parameters) and port_labels lists the label of each port.'''
+
+        return self._load('s_parameters', 'port-S.csv', self._read_s_parameters)
+
+    def _read_s_parameters(self):
+
+        freqs, s_matrix = Palace_Results.merge_s_parameters([self.output_dir])
+        return freqs, s_matrix, [self.labels.get('ports', {}).get(str(x+1), str(x+1)) for x in range(s_matrix.shape[1])]
+
+    @property
+    def capacitance(self):
+        '''Tuple (cap_matrix, terminal_labels) of the Maxwell capacitance matrix in F (terminal-C.csv, see
+        Palace_Results.merge_capacitance_slices) and the label of each terminal.'''
+
+        return self._load('capacitance', 'terminal-C.csv', self._read_capacitance)
+
+    def _read_capacitance(self):
+
+        cap_matrix = Palace_Results.merge_capacitance_slices([self.output_dir])
+        return cap_matrix, [self.labels.get('terminals', {}).get(str(x+1), str(x+1)) for x in range(cap_matrix.shape[0])]
+
+    @property
+    def port_epr(self):
+        '''Structured array of the energy participation ratios of the inductive lumped ports (port-EPR.csv), with the field 'mode' and one
+        field per port (e.g. 'jj_0').'''
+        return self.read_indexed_table('port-EPR.csv', 'ports')
+
+    @property
+    def port_q(self):
+        '''Structured array of the quality factors due to the resistive lumped ports (port-Q.csv).'''
+        return self.read_indexed_table('port-Q.csv', 'ports')
+
+    @property
+    def surface_participation(self):
+        '''Structured array of the participation ratios and quality factors of the dielectric interfaces (surface-Q.csv), with the field
+        'mode' and the fields of each interface (e.g. 'p_surf_SA' and 'Q_surf_SA').'''
+        return self.read_indexed_table('surface-Q.csv', 'surfaces')
+
+    @property
+    def elapsed_time(self):
+        '''Total wall time of the run in seconds (None if unavailable).'''
+        return Palace_Results.get_elapsed_time(self.output_dir)
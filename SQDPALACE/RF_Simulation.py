@@ -4,9 +4,6 @@ import numpy as np
 
 class RF_Simulation:
 
-    config_ports = []
-    ports_index = 1
-
     def __init__(self, name, ports_dict, user_options, jj_dict, hpc_options = {}):
         self.name = name
         self.ports_dict = ports_dict
@@ -14,6 +11,10 @@ class RF_Simulation:
         self.jj_dict = jj_dict
         self.hpc_options = hpc_options
 
+        #ports are stored per simulation so that repeated simulations do not append to the same list
+        self.config_ports = []
+        self.ports_index = 1
+
 
     def prepare_simulation(self):
 
@@ -35,13 +36,50 @@ class RF_Simulation:
                 physical_groups['air_box'] = group[1]
             elif group_name == 'far_field':
                 physical_groups['far_field']  = group[1]
+            elif group_name == 'far_field_ground':
+                physical_groups['far_field_ground']  = group[1]
 
         return physical_groups
 
 
-    def _process_ports_for_config_file(self):
+    def _process_far_field_for_config_file(self, physical_groups):
+        '''Returns the PEC and (if user_options['far_field_type'] is 'absorbing') Absorbing boundary sections of the config file. The order
+        of the absorbing boundary condition (1 or 2) is set via user_options['absorbing_order'].'''
+
+        if self.user_options.get('far_field_type', 'PEC') == 'absorbing':
+            pec_attributes = [physical_groups['metals']]
+            if physical_groups.get('far_field_ground') is not None:
+                pec_attributes.append(physical_groups['far_field_ground'])
+
+            return {"PEC": {"Attributes": pec_attributes},
+                    "Absorbing": {"Attributes": [physical_groups['far_field']], "Order": self.user_options.get('absorbing_order', 1)}}
+
+        return {"PEC": {"Attributes": [physical_groups['metals'], physical_groups['far_field']]}}  # Metal trace
+
+
+    def get_excitation_ports(self):
+        '''Returns the names of the ports (keys in ports_dict) to be excited. This is set via user_options['excitation_ports'], which is
+        either a list of port names (e.g. ['port_1', 'port_2']) or 'all'. By default only the first port is excited.'''
+
+        port_names = list(self.ports_dict.keys())
+        excitation_ports = self.user_options.get('excitation_ports', port_names[:1])
+        if excitation_ports == 'all':
+            excitation_ports = port_names
+
+        for port in excitation_ports:
+            assert port in port_names, f"Excitation port '{port}' is not one of the ports: {port_names}."
+
+        return excitation_ports
+
+
+    def _process_ports_for_config_file(self, excitation_ports = None):
         #Assumes that ports is a dictionary that contains the port names (with separate keys with suffixes a and b for multi-element ports)
         #where each value is a list of element IDs corresponding to the particular port...
+        #If more than one port is excited, each excited port is given its own excitation index so that Palace (v0.14 onwards) solves
+        #the excitations sequentially within a single run.
+
+        if excitation_ports is None:
+            excitation_ports = self.get_excitation_ports()
 
         #If there are ports for the launch pads in the dictionary process them
         if self.ports_dict:
@@ -51,7 +89,6 @@ class RF_Simulation:
                 ports_json = {}
 
                 ports_json['Index'] = self.ports_index
-                self.ports_index += 1
 
                 ports_json['R'] = 50
 
@@ -66,9 +103,13 @@ class RF_Simulation:
                         }
                     ]
                 
-                if self.ports_index == 1: #Excitation is always on first port in the ports dictionary
-                    ports_json['Excitation'] = True
+                if port in excitation_ports:
+                    if len(excitation_ports) == 1:
+                        ports_json['Excitation'] = True
+                    else:
+                        ports_json['Excitation'] = excitation_ports.index(port) + 1
 
+                self.ports_index += 1
                 self.config_ports.append(ports_json)
         
         #If there are junctions in the dictionary process them
@@ -0,0 +1,127 @@
+import sys
+import json
+import gmsh
+import numpy as np
+from GMSH_Mesh_Builder import GMSH_Mesh_Builder
+
+class Remote_Mesher:
+    '''Builds the mesh from a geometry file shipped to the HPC, so that meshing runs as the first job of the simulation pipeline rather
+    than on the workstation (see Simulation_Files_Builder). This is run next to a copy of GMSH_Mesh_Builder.py, i.e.:
+
+        python Remote_Mesher.py <geometry file> <geometry settings file> <mesh file>
+
+    The geometry is the OpenCASCADE model exported as a BREP file, which holds neither the physical groups nor the mesh fields. These
+    are stored in the settings file (see get_geometry_settings) along with a signature of every entity they refer to (its bounding box,
+    centre of mass and size), as the entity tags may change when the BREP file is imported. The entities are matched back by their
+    signatures, so that the physical groups keep their tags (which the Palace configs refer to).
+    '''
+
+    @staticmethod
+    def get_entity_signatures(dim_tags):
+        '''Returns a list of the signature (xmin, ymin, zmin, xmax, ymax, zmax, x, y, z, mass) of each (dim, tag) in the OpenCASCADE model.'''
+
+        return [list(gmsh.model.getBoundingBox(dim, tag)) + list(gmsh.model.occ.getCenterOfMass(dim, tag)) + [gmsh.model.occ.getMass(dim, tag)]
+                for dim, tag in dim_tags]
+
+    @staticmethod
+    def get_geometry_settings(mesh_surfaces, user_options):
+        '''Returns the dictionary written next to the BREP file of the current model with the physical groups ('physical_groups', each
+        with its 'dim', 'tag', 'name' and entity 'signatures'), the number of entities of each dimension ('num_entities'), the surfaces to
+        mesh finely ('surfaces' and their 'surface_signatures') and the mesh options ('mesh_sampling', 'mesh_min' and 'mesh_max').'''
+
+        physical_groups = []
+        for dim, tag in gmsh.model.getPhysicalGroups():
+            entities = gmsh.model.getEntitiesForPhysicalGroup(dim, tag)
+            physical_groups.append({'dim': dim, 'tag': tag, 'name': gmsh.model.getPhysicalName(dim, tag),
+                                    'signatures': Remote_Mesher.get_entity_signatures([(dim, x) for x in entities])})
+
+        return {
+            'physical_groups': physical_groups,
+            'num_entities': {str(x): len(gmsh.model.getEntities(x)) for x in range(4)},
+            'surfaces': [list(x) for x in mesh_surfaces],
+            'surface_signatures': Remote_Mesher.get_entity_signatures([(2, x[2]) for x in mesh_surfaces]),
+            'mesh_sampling': user_options['mesh_sampling'],
+            'mesh_min': user_options['mesh_min'],
+            'mesh_max': user_options['mesh_max']
+        }
+
+    @staticmethod
+    def match_entities(dim, signatures, rel_tol = 1e-6):
+        '''Returns the tags of the entities of the given dimension in the current model which match the signatures.'''
+
+        entities = [x[1] for x in gmsh.model.getEntities(dim)]
+        if len(signatures) == 0:
+            return []
+
+        candidates = np.array(Remote_Mesher.get_entity_signatures([(dim, x) for x in entities]))
+        xmin, ymin, zmin, xmax, ymax, zmax = gmsh.model.getBoundingBox(-1, -1)
+        tol = rel_tol * max(np.linalg.norm([xmax - xmin, ymax - ymin, zmax - zmin]), 1.0)
+
+        tags = []
+        for signature in np.array(signatures):
+            #positions are compared relative to the size of the model and the sizes (which are integrated numerically) more loosely
+            position_error = np.max(np.abs(candidates[:, :9] - signature[:9]), axis=1) / tol
+            size_error = np.abs(candidates[:, 9] - signature[9]) / (100 * rel_tol * max(abs(signature[9]), 1e-30))
+            error = np.maximum(position_error, size_error)
+            best = int(np.argmin(error))
+            if error[best] > 1:
+                raise Exception(f"No entity of dimension {dim} in the imported geometry matches the signature {list(signature)}.")
+            tags.append(entities[best])
+
+        return tags
+
+    @staticmethod
+    def build_mesh_from_geometry(geometry_file, mesh_settings_file, mesh_file, keep_initialized = False):
+        '''Loads the geometry, sets up the mesh fields and writes the mesh.
+
+        Args:
+            geometry_file - BREP file of the geometry written by Simulation_Files_Builder (or a Gmsh geometry file which already holds the
+                            physical groups).
+            mesh_settings_file - JSON file with the physical groups, the surfaces to mesh finely and the mesh options (see
+                                 get_geometry_settings). For a Gmsh geometry file, only 'surfaces', 'mesh_sampling', 'mesh_min' and
+                                 'mesh_max' are needed.
+            mesh_file - location of the mesh (.msh) file to write.
+            keep_initialized - (Optional) Defaults to False. If True, Gmsh is left initialized with an empty model afterwards (used by the
+                               workers of Worker_Service).
+        '''
+
+        with open(mesh_settings_file) as f:
+            mesh_settings = json.load(f)
+
+        if gmsh.isInitialized():
+            gmsh.clear()
+        else:
+            gmsh.initialize()
+
+        surfaces = [tuple(x) for x in mesh_settings['surfaces']]
+        if 'physical_groups' in mesh_settings:
+            gmsh.model.occ.importShapes(geometry_file, highestDimOnly = False)
+            gmsh.model.occ.synchronize()
+
+            #check that the imported model has the same topology before restoring the physical groups and mesh fields
+            num_entities = {str(x): len(gmsh.model.getEntities(x)) for x in range(4)}
+            if num_entities != mesh_settings['num_entities']:
+                raise Exception(f"The imported geometry has {num_entities} entities of each dimension, but {mesh_settings['num_entities']} were exported.")
+
+            for group in mesh_settings['physical_groups']:
+                gmsh.model.addPhysicalGroup(group['dim'], Remote_Mesher.match_entities(group['dim'], group['signatures']), tag = group['tag'], name = group['name'])
+
+            surface_tags = Remote_Mesher.match_entities(2, mesh_settings['surface_signatures'])
+            surfaces = [x[:2] + (y,) + x[3:] for x, y in zip(surfaces, surface_tags)]
+        else:
+            gmsh.open(geometry_file)
+
+        GMB = GMSH_Mesh_Builder(surfaces, mesh_settings)
+        GMB.build_mesh()
+
+        gmsh.write(mesh_file)
+        if keep_initialized:
+            gmsh.clear()
+        else:
+            gmsh.finalize()
+
+        print(f"Mesh written to '{mesh_file}'.")
+
+
+if __name__ == '__main__':
+    Remote_Mesher.build_mesh_from_geometry(sys.argv[1], sys.argv[2], sys.argv[3])
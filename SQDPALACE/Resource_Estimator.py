@@ -0,0 +1,209 @@
+import os
+import json
+import numpy as np
+from Palace_Results import Palace_Results
+
+class Resource_Estimator:
+    '''Predicts the memory and wall time of a Palace run from the size of the problem and fills the sbatch resources in hpc_options.
+    The problem size is taken as the number of mesh elements (after uniform refinement) times the number of unknowns per element for the
+    solver order. The predictions are power laws in the problem size:
+
+        memory (GB) = a * size^b
+        wall time (s) * cores / work = c * size^d
+
+    where the work is the number of eigenmodes, frequency samples or terminals solved for. The coefficients are fitted to a local history
+    of completed jobs for each problem type once there are enough records. Until then, rough defaults are used which should be replaced
+    by calibrating against the cluster.
+
+    Inputs:
+        - history_file - JSON file holding the records of completed jobs (created when the first record is added).
+    '''
+
+    #default coefficients (a, b, c, d) used before there is enough history to fit them
+    default_coefficients = {
+        'Eigenmode': (1.5e-6, 1.1, 2e-4, 1.2),
+        'Driven': (1.5e-6, 1.1, 2e-4, 1.2),
+        'Electrostatic': (5e-7, 1.0, 5e-5, 1.1)
+    }
+
+    #minimum number of records required to fit the coefficients of a problem type
+    min_records = 3
+
+    def __init__(self, history_file):
+        self.history_file = history_file
+
+    @staticmethod
+    def get_problem_size(num_elements, solver_order, mesh_refinement, problem_type):
+        '''Returns the approximate number of unknowns per element times the number of elements. Each uniform refinement splits every
+        tetrahedron into 8 and the number of unknowns per tetrahedron is p(p+2)(p+3)/2 for Nedelec elements (Eigenmode and Driven) and
+        (p+1)(p+2)(p+3)/6 for H1 elements (Electrostatic) of order p.'''
+
+        p = solver_order
+        if problem_type == 'Electrostatic':
+            unknowns_per_element = (p+1)*(p+2)*(p+3)/6
+        else:
+            unknowns_per_element = p*(p+2)*(p+3)/2
+
+        return num_elements * 8**mesh_refinement * unknowns_per_element
+
+    @staticmethod
+    def get_work(config):
+        '''Returns the number of solves in a Palace config: the number of eigenmodes, the number of frequency samples (capped at the
+        maximum number of samples for adaptive sweeps) or the number of terminals.'''
+
+        problem_type = config['Problem']['Type']
+        solver = config['Solver'][problem_type]
+
+        if problem_type == 'Eigenmode':
+            return solver['N']
+        elif problem_type == 'Driven':
+            if 'Samples' in solver:
+                num_freqs = sum([int(round((x['MaxFreq'] - x['MinFreq']) / x['FreqStep'])) + 1 for x in solver['Samples']])
+            else:
+                num_freqs = int(round((solver['MaxFreq'] - solver['MinFreq']) / solver['FreqStep'])) + 1
+            if solver.get('AdaptiveTol') is not None:
+                num_freqs = min(num_freqs, solver.get('AdaptiveMaxSamples', 20))
+            return num_freqs
+        else:
+            return len(config['Boundaries']['Terminal'])
+
+    def load_history(self):
+        if not os.path.exists(self.history_file):
+            return []
+        with open(self.history_file) as f:
+            return json.load(f)
+
+    def add_record(self, problem_type, num_elements, solver_order, mesh_refinement, work, cores, time, memory = None):
+        '''Adds a completed job to the history.
+
+        Args:
+            problem_type - Palace problem type ('Eigenmode', 'Driven' or 'Electrostatic').
+            num_elements - number of mesh elements before refinement.
+            solver_order - solver order.
+            mesh_refinement - number of uniform refinement levels.
+            work - number of eigenmodes, frequency samples or terminals solved for (see get_work).
+            cores - total number of MPI ranks used.
+            time - wall time in seconds.
+            memory - (Optional) peak memory over all nodes in GB (e.g. the sum of MaxRSS given by sacct). Records without memory are only
+                     used to fit the wall time.
+        '''
+
+        history = self.load_history()
+        history.append({'problem_type': problem_type, 'num_elements': num_elements, 'solver_order': solver_order,
+                        'mesh_refinement': mesh_refinement, 'work': work, 'cores': cores, 'time': time, 'memory': memory})
+
+        with open(self.history_file, 'w') as f:
+            json.dump(history, f, indent=2)
+
+    def record_palace_run(self, config_file, num_elements, cores, memory = None, output_dir = None):
+        '''Adds a completed Palace run to the history, taking the problem settings from its config file and the wall time from palace.json
+        in its output directory (defaults to the 'Output' path in the config).'''
+
+        with open(config_file) as f:
+            config = json.load(f)
+
+        output_dir = output_dir if output_dir is not None else config['Problem']['Output']
+        time = Palace_Results.get_elapsed_time(output_dir)
+        assert time is not None, f"No wall time was found in '{output_dir}'."
+
+        self.add_record(config['Problem']['Type'], num_elements, config['Solver']['Order'], config['Model']['Refinement']['UniformLevels'],
+                        Resource_Estimator.get_work(config), cores, time, memory)
+
+    def record_jobs(self, sim_info, job_names, cores):
+        '''Adds the given finished jobs of a simulation (see PALACE_Simulation.run_simulation) to the history. Jobs whose wall time is not
+        visible from this machine (e.g. outputs left on the cluster) or simulations whose number of mesh elements is unknown are skipped.
+        Returns the number of jobs recorded.'''
+
+        if sim_info.get('num_elements') is None:
+            return 0
+
+        num_recorded = 0
+        for job_name in job_names:
+            job = sim_info['jobs'].get(job_name)
+            if job is None or job.get('cached', False) or Palace_Results.get_elapsed_time(job['output']) is None:
+                continue
+            self.record_palace_run(job['config_file'], sim_info['num_elements'], cores, output_dir = job['output'])
+            num_recorded += 1
+
+        return num_recorded
+
+    def get_coefficients(self, problem_type):
+        '''Returns the coefficients (a, b, c, d) for the problem type, fitted to the history if there are enough records.'''
+
+        a, b, c, d = Resource_Estimator.default_coefficients[problem_type]
+
+        records = [x for x in self.load_history() if x['problem_type'] == problem_type]
+        sizes = np.array([Resource_Estimator.get_problem_size(x['num_elements'], x['solver_order'], x['mesh_refinement'], problem_type) for x in records])
+
+        #least squares fits of the power laws in log space
+        if len(records) >= Resource_Estimator.min_records:
+            scaled_times = np.array([x['time'] * x['cores'] / x['work'] for x in records])
+            d, log_c = np.polyfit(np.log(sizes), np.log(scaled_times), 1)
+            c = np.exp(log_c)
+
+        has_memory = np.array([x['memory'] is not None for x in records], dtype=bool)
+        if np.sum(has_memory) >= Resource_Estimator.min_records:
+            memory = np.array([x['memory'] for x in records if x['memory'] is not None])
+            b, log_a = np.polyfit(np.log(sizes[has_memory]), np.log(memory), 1)
+            a = np.exp(log_a)
+
+        return a, b, c, d
+
+    def estimate(self, problem_type, num_elements, solver_order, mesh_refinement, work, cores):
+        '''Returns a tuple (memory, time) of the predicted peak memory over all nodes in GB and the wall time in seconds.'''
+
+        a, b, c, d = self.get_coefficients(problem_type)
+        size = Resource_Estimator.get_problem_size(num_elements, solver_order, mesh_refinement, problem_type)
+
+        return a * size**b, c * size**d * work / cores
+
+    def fill_hpc_options(self, hpc_options, configs, num_elements):
+        '''Returns a copy of hpc_options where 'hpc_nodes', 'cpus_per_node', 'sim_memory' and 'sim_time' are filled from the prediction
+        if they are missing or set to 'auto'. Values given by the user are kept. As the jobs of a simulation share these resources, the
+        largest memory and wall time over all configs are used. The prediction uses the optional hpc_options:
+            - max_cpus_per_node - Defaults to 32. Number of cores on each node of the cluster.
+            - max_memory_per_node - Defaults to 128. Memory (GB) on each node of the cluster.
+            - resource_safety_factor - Defaults to 1.5. Factor applied to the predicted memory and wall time.
+            - min_sim_time - Defaults to 600. Minimum wall time in seconds.
+
+        Args:
+            hpc_options - dictionary of the HPC settings.
+            configs - list of the Palace configs of the jobs (or a single config).
+            num_elements - number of mesh elements before refinement.
+        '''
+
+        hpc_options = dict(hpc_options)
+        fields = ['hpc_nodes', 'cpus_per_node', 'sim_memory', 'sim_time']
+        if all([hpc_options.get(x, 'auto') != 'auto' for x in fields]):
+            return hpc_options
+
+        max_cpus = hpc_options.get('max_cpus_per_node', 32)
+        max_memory = hpc_options.get('max_memory_per_node', 128)
+        safety = hpc_options.get('resource_safety_factor', 1.5)
+
+        configs = [configs] if isinstance(configs, dict) else configs
+        def estimate_config(config, cores):
+            return self.estimate(config['Problem']['Type'], num_elements, config['Solver']['Order'], config['Model']['Refinement']['UniformLevels'],
+                                 Resource_Estimator.get_work(config), cores)
+
+        memory = max([estimate_config(x, 1)[0] for x in configs]) * safety
+
+        if hpc_options.get('hpc_nodes', 'auto') == 'auto':
+            hpc_options['hpc_nodes'] = str(max(1, int(np.ceil(memory / max_memory))))
+        if hpc_options.get('cpus_per_node', 'auto') == 'auto':
+            hpc_options['cpus_per_node'] = str(max_cpus)
+
+        nodes = int(hpc_options['hpc_nodes'])
+        cores = nodes * int(hpc_options['cpus_per_node'])
+        time = max([estimate_config(x, cores)[1] for x in configs])
+        time = max(time * safety, hpc_options.get('min_sim_time', 600))
+
+        if hpc_options.get('sim_memory', 'auto') == 'auto':
+            hpc_options['sim_memory'] = str(int(np.ceil(min(memory / nodes, max_memory)))) + 'G'
+        if hpc_options.get('sim_time', 'auto') == 'auto':
+            hours, rem = divmod(int(np.ceil(time)), 3600)
+            hpc_options['sim_time'] = f"{hours:02d}:{rem // 60:02d}:{rem % 60:02d}"
+
+        print(f"Estimated resources: {hpc_options['hpc_nodes']} nodes x {hpc_options['cpus_per_node']} cores, {hpc_options['sim_memory']} per node, {hpc_options['sim_time']}.")
+
+        return hpc_options
@@ -0,0 +1,279 @@
+import os
+import re
+import glob
+import json
+import time
+import sqlite3
+import numpy as np
+from Palace_Run import Palace_Run
+
+class Results_Database:
+    '''Local SQLite database of the results of many Palace runs (e.g. all variants of a sweep), so that they can be queried together
+    without reading the output files again, e.g.:
+
+        db = Results_Database('results.db')
+        db.ingest_sweep(user_options['sim_directory'], 'my_sweep')
+        modes = db.query('eigenmodes', ranges={'design.Q1.connection_pads.a.pad_width': ('80um', '100um')}, params=['Solver.Order'])
+
+    Each run is keyed by its output directory and described by parameters stored as (name, value) pairs: the design overrides of the
+    sweep variant ('design.<component>.<option>'), the solver and refinement settings of its config (e.g. 'Solver.Order' or
+    'Solver.Eigenmode.Tol'), the mesh options ('mesh.mesh_sampling', 'mesh.mesh_min' and 'mesh.mesh_max') and any other parameters given
+    when ingesting. Numeric values (including strings with units such as '20um', which are converted to SI units) can be queried by range.
+    The results are stored in the tables:
+        - eigenmodes - mode, freq (GHz), freq_imag (GHz) and Q of each eigenmode.
+        - s_parameters - freq (GHz), the port indices i and j, their labels and the real and imaginary parts of S[i][j].
+        - capacitance - the terminal indices i and j, their labels and the Maxwell capacitance in F.
+        - mode_quantities - the per-mode values of port-EPR.csv, port-Q.csv and surface-Q.csv (file, mode, name and value), e.g. the EPR
+                            of each junction.
+
+    Ingesting is incremental: runs whose output files have not changed since they were last ingested are skipped.
+
+    Inputs:
+        - db_file - SQLite database file (created if it does not exist).
+    '''
+
+    tables = ['eigenmodes', 's_parameters', 'capacitance', 'mode_quantities']
+
+    #conversion of the units used in the design options and results into SI units
+    units = {'': 1.0, 'm': 1.0, 'cm': 1e-2, 'mm': 1e-3, 'um': 1e-6, 'nm': 1e-9, 'Hz': 1.0, 'kHz': 1e3, 'MHz': 1e6, 'GHz': 1e9,
+             'H': 1.0, 'uH': 1e-6, 'nH': 1e-9, 'pH': 1e-12, 'F': 1.0, 'nF': 1e-9, 'pF': 1e-12, 'fF': 1e-15, 'ohm': 1.0, 'Ohm': 1.0}
+
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self.connection = sqlite3.connect(db_file)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self._create_tables()
+
+    def _create_tables(self):
+
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS runs (run_id INTEGER PRIMARY KEY, output TEXT UNIQUE, sim_name TEXT, job_name TEXT, problem_type TEXT,
+                                             config_file TEXT, elapsed_time REAL, modified REAL, ingested REAL);
+            CREATE TABLE IF NOT EXISTS params (run_id INTEGER, name TEXT, value_num REAL, value_text TEXT);
+            CREATE TABLE IF NOT EXISTS eigenmodes (run_id INTEGER, mode INTEGER, freq REAL, freq_imag REAL, Q REAL);
+            CREATE TABLE IF NOT EXISTS s_parameters (run_id INTEGER, freq REAL, i INTEGER, j INTEGER, label_i TEXT, label_j TEXT, real REAL, imag REAL);
+            CREATE TABLE IF NOT EXISTS capacitance (run_id INTEGER, i INTEGER, j INTEGER, label_i TEXT, label_j TEXT, value REAL);
+            CREATE TABLE IF NOT EXISTS mode_quantities (run_id INTEGER, file TEXT, mode INTEGER, name TEXT, value REAL);
+            CREATE INDEX IF NOT EXISTS params_name_value ON params (name, value_num);
+            CREATE INDEX IF NOT EXISTS params_run ON params (run_id);
+            CREATE INDEX IF NOT EXISTS eigenmodes_run ON eigenmodes (run_id);
+            CREATE INDEX IF NOT EXISTS eigenmodes_freq ON eigenmodes (freq);
+            CREATE INDEX IF NOT EXISTS s_parameters_run ON s_parameters (run_id);
+            CREATE INDEX IF NOT EXISTS capacitance_run ON capacitance (run_id);
+            CREATE INDEX IF NOT EXISTS mode_quantities_run ON mode_quantities (run_id, name);
+        ''')
+
+    @staticmethod
+    def to_number(value):
+        '''Returns the value as a float in SI units (None if it is not numeric), e.g. 5 -> 5.0 and '20um' -> 2e-5.'''
+
+        if isinstance(value, (bool, np.bool_)):
+            return float(value)
+        if isinstance(value, (int, float, np.integer, np.floating)):
+            return float(value)
+        if isinstance(value, str):
+            match = re.match(r'^\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*([a-zA-Z]*)\s*$', value)
+            if match is not None and match.group(2) in Results_Database.units:
+                return float(match.group(1)) * Results_Database.units[match.group(2)]
+
+        return None
+
+    @staticmethod
+    def get_config_params(config):
+        '''Returns the solver and refinement settings of a Palace config as a flat dictionary (e.g. {'Solver.Order': 2, ...}).'''
+
+        params = {}
+        def flatten(prefix, section):
+            for key, value in section.items():
+                if isinstance(value, dict):
+                    flatten(prefix + key + '.', value)
+                elif not isinstance(value, list):
+                    params[prefix + key] = value
+
+        flatten('Solver.', config.get('Solver', {}))
+        flatten('Model.Refinement.', config.get('Model', {}).get('Refinement', {}))
+        params['Problem.Type'] = config['Problem']['Type']
+
+        return params
+
+    @staticmethod
+    def get_modified(output_dir):
+        '''Returns the latest modification time of the results in the output directory (None if there are no results).'''
+
+        files = glob.glob(os.path.join(output_dir, '*.csv')) + glob.glob(os.path.join(output_dir, 'palace.json'))
+        return max([os.path.getmtime(x) for x in files]) if files else None
+
+    def ingest_run(self, output_dir, config_file = None, params = {}, labels = None, sim_name = None, job_name = None):
+        '''Adds the results of a Palace run to the database (replacing those of a previous ingest if the outputs have changed).
+
+        Args:
+            output_dir - Palace output directory.
+            config_file - (Optional) Palace config of the run, whose solver settings are added to the parameters.
+            params - (Optional) dictionary of additional parameters of the run (e.g. the design overrides and mesh settings).
+            labels - (Optional) labels of the ports, terminals and surfaces (see Palace_Run).
+            sim_name, job_name - (Optional) names of the simulation and job.
+
+        Returns:
+            True if the run was ingested, False if it was skipped (unchanged or no results).
+        '''
+
+        output_dir = os.path.abspath(output_dir)
+        modified = Results_Database.get_modified(output_dir)
+        if modified is None:
+            return False
+
+        row = self.connection.execute("SELECT run_id, modified FROM runs WHERE output = ?", (output_dir,)).fetchone()
+        if row is not None and row[1] == modified:
+            return False
+
+        config = {}
+        if config_file is not None:
+            with open(config_file) as f:
+                config = json.load(f)
+        run_params = {**(Results_Database.get_config_params(config) if config else {}), **params}
+
+        run = Palace_Run(output_dir, labels)
+
+        #all rows of the run are replaced in a single transaction
+        with self.connection:
+            if row is not None:
+                self._delete_run(row[0])
+
+            cursor = self.connection.execute("INSERT INTO runs (output, sim_name, job_name, problem_type, config_file, elapsed_time, modified, ingested) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                             (output_dir, sim_name, job_name, config.get('Problem', {}).get('Type'), config_file, run.elapsed_time, modified, time.time()))
+            run_id = cursor.lastrowid
+
+            self.connection.executemany("INSERT INTO params VALUES (?, ?, ?, ?)",
+                                        [(run_id, x, Results_Database.to_number(y), str(y)) for x, y in run_params.items()])
+
+            if run.has_output('eig.csv'):
+                modes = run.eigenmodes
+                self.connection.executemany("INSERT INTO eigenmodes VALUES (?, ?, ?, ?, ?)",
+                                            [(run_id, int(x['mode']), float(x['freq']), float(x['freq_imag']), float(x['Q'])) for x in modes])
+
+            if run.has_output('port-S.csv'):
+                freqs, s_matrix, port_labels = run.s_parameters
+                rows = [(run_id, float(freqs[f]), i+1, j+1, port_labels[i], port_labels[j], float(s_matrix[f, i, j].real), float(s_matrix[f, i, j].imag))
+                        for f, i, j in zip(*np.nonzero(~np.isnan(s_matrix)))]
+                self.connection.executemany("INSERT INTO s_parameters VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+            if run.has_output('terminal-C.csv'):
+                cap_matrix, terminal_labels = run.capacitance
+                rows = [(run_id, i+1, j+1, terminal_labels[i], terminal_labels[j], float(cap_matrix[i, j])) for i, j in zip(*np.nonzero(~np.isnan(cap_matrix)))]
+                self.connection.executemany("INSERT INTO capacitance VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+            for file_name, label_type in [('port-EPR.csv', 'ports'), ('port-Q.csv', 'ports'), ('surface-Q.csv', 'surfaces')]:
+                if run.has_output(file_name):
+                    table = run.read_indexed_table(file_name, label_type)
+                    names = [x for x in table.dtype.names if x != 'mode']
+                    self.connection.executemany("INSERT INTO mode_quantities VALUES (?, ?, ?, ?, ?)",
+                                                [(run_id, file_name, int(x['mode']), y, float(x[y])) for x in table for y in names])
+
+        return True
+
+    def ingest_simulation(self, sim_info, params = {}):
+        '''Adds the results of every job of a simulation (see PALACE_Simulation.run_simulation) to the database. Returns the number of runs
+        ingested.'''
+
+        labels_file = os.path.join(sim_info['sim_directory'], sim_info['name'] + '_labels.json')
+        labels = labels_file if os.path.exists(labels_file) else None
+
+        num_ingested = 0
+        for job_name, job in sim_info['jobs'].items():
+            num_ingested += self.ingest_run(job['output'], job['config_file'], params, labels, sim_info['name'], job_name)
+
+        return num_ingested
+
+    def ingest_directory(self, sim_directory, name, params = {}):
+        '''Adds the results of the simulation user_options['sim_directory']/name to the database, finding its jobs from the configs in the
+        simulation directory. Returns the number of runs ingested.'''
+
+        jobs = {}
+        for config_file in sorted(glob.glob(os.path.join(sim_directory, name, '*.json'))):
+            with open(config_file) as f:
+                config = json.load(f)
+            if isinstance(config, dict) and 'Problem' in config:
+                jobs[os.path.splitext(os.path.basename(config_file))[0]] = {'config_file': config_file, 'output': config['Problem']['Output']}
+
+        #the mesh options are only stored with the geometry shipped for meshing on the HPC, otherwise they should be given in params
+        geometry_file = os.path.join(sim_directory, name, name + '_geometry.json')
+        if os.path.exists(geometry_file):
+            with open(geometry_file) as f:
+                geometry_settings = json.load(f)
+            params = {**{'mesh.' + x: geometry_settings[x] for x in ['mesh_sampling', 'mesh_min', 'mesh_max']}, **params}
+
+        return self.ingest_simulation({'name': name, 'sim_directory': os.path.join(sim_directory, name), 'jobs': jobs}, params)
+
+    def ingest_sweep(self, sim_directory, sweep_name, params = {}):
+        '''Adds the results of every variant of a sweep (see Sweep_Engine) to the database, with the overrides of each variant as the
+        parameters 'design.<component>.<option>'. Returns the number of runs ingested.'''
+
+        with open(os.path.join(sim_directory, sweep_name + '_variants.json')) as f:
+            variants = json.load(f)
+
+        num_ingested = 0
+        for variant_name, overrides in variants.items():
+            if os.path.exists(os.path.join(sim_directory, variant_name)):
+                num_ingested += self.ingest_directory(sim_directory, variant_name, {**params, **{'design.' + x: y for x, y in overrides.items()}})
+
+        print(f"Sweep '{sweep_name}': {num_ingested} new or changed runs ingested.")
+
+        return num_ingested
+
+    def query(self, table, ranges = {}, values = {}, params = []):
+        '''Returns the rows of a results table for the runs whose parameters lie in the given ranges and have the given values.
+
+        Args:
+            table - 'eigenmodes', 's_parameters', 'capacitance' or 'mode_quantities'.
+            ranges - (Optional) dictionary of the parameter name with the inclusive (min, max) range (None for an open bound). Bounds may be
+                     given with units (e.g. ('80um', '100um')).
+            values - (Optional) dictionary of the parameter name with its required value (compared numerically if numeric).
+            params - (Optional) list of parameter names added as columns of the result.
+
+        Returns:
+            Dictionary of numpy arrays (one per column), including the 'sim_name', 'job_name' and 'output' of the run of each row.
+        '''
+
+        assert table in Results_Database.tables, f"Table '{table}' must be one of {Results_Database.tables}."
+
+        conditions, arguments = [], []
+        for name, (lower, upper) in ranges.items():
+            condition = "r.run_id IN (SELECT run_id FROM params WHERE name = ?"
+            arguments.append(name)
+            if lower is not None:
+                condition += " AND value_num >= ?"
+                arguments.append(Results_Database.to_number(lower))
+            if upper is not None:
+                condition += " AND value_num <= ?"
+                arguments.append(Results_Database.to_number(upper))
+            conditions.append(condition + ")")
+        for name, value in values.items():
+            if Results_Database.to_number(value) is not None:
+                conditions.append("r.run_id IN (SELECT run_id FROM params WHERE name = ? AND value_num = ?)")
+                arguments += [name, Results_Database.to_number(value)]
+            else:
+                conditions.append("r.run_id IN (SELECT run_id FROM params WHERE name = ? AND value_text = ?)")
+                arguments += [name, str(value)]
+
+        param_columns = ", ".join([f"(SELECT COALESCE(value_num, value_text) FROM params p WHERE p.run_id = r.run_id AND p.name = ?)" for _ in params])
+        sql = f"SELECT t.*, r.sim_name, r.job_name, r.output{', ' + param_columns if params else ''} FROM {table} t JOIN runs r ON t.run_id = r.run_id"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+
+        cursor = self.connection.execute(sql, list(params) + arguments)
+        columns = [x[0] for x in cursor.description[:-len(params)]] + list(params) if params else [x[0] for x in cursor.description]
+        rows = cursor.fetchall()
+
+        return {x: np.array([row[m] for row in rows]) for m, x in enumerate(columns)}
+
+    def get_params(self):
+        '''Returns a dictionary of the parameter names with the number of runs having each parameter.'''
+        return dict(self.connection.execute("SELECT name, COUNT(DISTINCT run_id) FROM params GROUP BY name").fetchall())
+
+    def _delete_run(self, run_id):
+
+        for table in ['runs', 'params'] + Results_Database.tables:
+            self.connection.execute(f"DELETE FROM {table} WHERE run_id = ?", (run_id,))
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,92 @@
+import os
+import copy
+import json
+import time
+import hashlib
+from Palace_Results import Palace_Results
+
+class Run_Index:
+    '''Local index of the Palace runs prepared by Simulation_Files_Builder, used to skip solves which have already been run. Each run is
+    keyed by a hash of its mesh (or of the geometry and mesh settings when the mesh is built on the HPC) and of its config, normalized
+    by removing the paths which differ between otherwise identical runs (i.e. the mesh and output locations). A run counts as finished
+    once Palace has written the wall time to palace.json in its output directory after the run was added, so the outputs must be visible
+    from this machine (as for local runs or a simulation directory mounted from the cluster).
+
+    Each entry is stored in its own file (<run key>.json in the index directory), so that simulations prepared in parallel (e.g. by
+    Sweep_Engine) can share the index.
+
+    Inputs:
+        - index_directory - directory holding the entries (created when the first entry is added).
+    '''
+
+    def __init__(self, index_directory):
+        self.index_directory = index_directory
+
+    @staticmethod
+    def hash_files(file_paths):
+        '''Returns the SHA-256 hash of the contents of the given files.'''
+
+        sha = hashlib.sha256()
+        for file_path in file_paths:
+            with open(file_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 24), b''):
+                    sha.update(chunk)
+
+        return sha.hexdigest()
+
+    @staticmethod
+    def get_run_key(config, mesh_hash, launch_profile = None):
+        '''Returns the key of a run from its Palace config, the hash of its mesh (see hash_files) and, for the runs of a scaling test, the
+        launch profile.'''
+
+        normalized_config = copy.deepcopy(config)
+        normalized_config['Problem'].pop('Output', None)
+        normalized_config['Model']['Mesh'] = mesh_hash
+        if launch_profile is not None:
+            normalized_config['LaunchProfile'] = launch_profile
+
+        return hashlib.sha256(json.dumps(normalized_config, sort_keys=True).encode()).hexdigest()
+
+    def lookup(self, run_key):
+        '''Returns the entry ('job_name', 'config_file', 'output' and 'created') of the run if it has finished since the entry was added,
+        otherwise None.'''
+
+        entry_file = os.path.join(self.index_directory, run_key + '.json')
+        if not os.path.exists(entry_file):
+            return None
+
+        with open(entry_file) as f:
+            entry = json.load(f)
+
+        #palace.json must have been written after the entry was added, as the output directory may still hold the results of an earlier
+        #run (e.g. of a config which has since changed)
+        if Palace_Results.get_elapsed_time(entry['output']) is None:
+            return None
+        if os.path.getmtime(os.path.join(entry['output'], 'palace.json')) < entry['created']:
+            return None
+
+        return entry
+
+    def add(self, run_key, job_name, config_file, output):
+        '''Adds a run to the index. Entries of other runs writing to the same output directory are removed, as their results will be
+        overwritten.'''
+
+        os.makedirs(self.index_directory, exist_ok=True)
+
+        for file_name in os.listdir(self.index_directory):
+            if not file_name.endswith('.json') or file_name == run_key + '.json':
+                continue
+            try:
+                with open(os.path.join(self.index_directory, file_name)) as f:
+                    stale = json.load(f)['output'] == output
+                if stale:
+                    os.remove(os.path.join(self.index_directory, file_name))
+            except (OSError, ValueError, KeyError):
+                #entries being written or removed by another process are skipped
+                continue
+
+        #written to a temporary file first, so that other processes never read a partial entry
+        entry_file = os.path.join(self.index_directory, run_key + '.json')
+        with open(entry_file + '.' + str(os.getpid()), 'w') as f:
+            json.dump({'job_name': job_name, 'config_file': config_file, 'output': output, 'created': time.time()}, f, indent=2)
+        os.replace(entry_file + '.' + str(os.getpid()), entry_file)
@@ -1,48 +1,227 @@
 import os, subprocess
 import json
+import shutil
+import copy
+import string
 import gmsh
+from Palace_Config import Palace_Config
+from Run_Index import Run_Index
+from Artifact_Store import Artifact_Store
+from Remote_Mesher import Remote_Mesher
 
 class Simulation_Files_Builder:
 
-    def __init__(self, name, user_options, sim_config, hpc_options):
+    def __init__(self, name, user_options, sim_config, hpc_options, sub_configs = {}, job_dependencies = {}, pre_run_commands = {}, support_files = [],
+                 mesh_surfaces = [], labels = {}):
         self.name = name
         self.user_options = user_options
         self.sim_config = sim_config
         self.hpc_options = hpc_options
+        self.sub_configs = sub_configs              #additional configs (keyed by job name) which share the same mesh file
+        self.job_dependencies = job_dependencies    #list of jobs (keyed by job name) which must finish successfully before the job starts
+        self.pre_run_commands = pre_run_commands    #list of shell commands (keyed by job name) to run before Palace is launched
+        self.support_files = support_files          #files (e.g. helper scripts) copied into the simulation directory
+        self.mesh_surfaces = mesh_surfaces          #surfaces to mesh finely - only needed if the mesh is built on the HPC
+        self.labels = labels                        #names of the lumped ports and terminals (keyed by 'ports' and 'terminals') by index
+
+        #if hpc_options['pipeline'] is True, the mesh is built by a job on the HPC and a final job condenses the results
+        self.pipeline = bool(self.hpc_options) and self.hpc_options.get('pipeline', False)
+
+        #jobs skipped as their mesh and config have already been run (keyed by job name with the entry from the run index)
+        self.cached_jobs = {}
+
+        #configs of the jobs which are written (keyed by job name, including the copies of a scaling test)
+        self.configs = {}
+
+        #if user_options['artifact_store'] is given, the mesh is kept in the artifact store instead of the simulation directory
+        self.use_artifact_store = self.user_options.get('artifact_store') is not None and not self.pipeline
+        self.mesh_hash = None
     
     def create_simulation_files(self):
+        '''Writes the mesh (or geometry), configs and batch files into user_options['sim_directory']/<name>. An existing directory is only
+        written into if user_options['overwrite'] or user_options['reuse_results'] is True. If user_options['reuse_results'] is True, jobs
+        whose mesh and config match a finished run in the run index (user_options['run_index'], defaults to run_index in the simulation
+        directory) are skipped and listed in cached_jobs instead (see Run_Index). If user_options['artifact_store'] is given, the mesh is
+        moved into that store (see Artifact_Store and _store_mesh).'''
+
+        #validate all configs before any files are written - user_options['palace_schema'] is the Palace schema, or True to take it from
+        #the Palace installation at user_options['palace_location']
+        schema_file = self.user_options.get('palace_schema')
+        if schema_file is True:
+            schema_file = Palace_Config.find_schema(self.user_options.get('palace_location', 'palace'))
+        configs = self._get_configs()
+        for job_name, config in configs.items():
+            try:
+                Palace_Config.validate_config(config, schema_file)
+            except Exception as error:
+                raise Exception(f"Config for '{job_name}' is invalid. {error}")
         
         #create directory to store simulation files
         self._create_directory()
 
-        #save mesh to new directory
-        self._save_mesh_gmsh()
+        #save mesh to new directory - for the pipeline, the geometry is saved instead and meshed on the HPC
+        if self.pipeline:
+            self._save_geometry_gmsh()
+        else:
+            self._save_mesh_gmsh()
+            if self.use_artifact_store:
+                configs = self._store_mesh(configs)
 
-        #write sim_config to json file and save to new directory
-        self._save_config_file_as_json()
+        #write the names of the ports, terminals and surfaces used to label the results (see Palace_Run) - taken from all configs, as every
+        #job may be skipped below
+        self._save_labels(configs)
 
-        if self.hpc_options:
-            #create hpc batch file for simulations using the
-            self._create_hpc_batch_file()
+        #run every job with each launch profile to find the fastest profile on the cluster - the jobs are renamed before they are looked
+        #up in the run index
+        job_hpc_options = {}
+        if self.hpc_options and self.hpc_options.get('scaling_test') is not None:
+            configs, job_hpc_options = self._get_scaling_test_configs(configs)
+
+        #skip the jobs which have already been run
+        run_keys = {}
+        if self.user_options.get('reuse_results', False):
+            configs, run_keys = self._remove_cached_jobs(configs, job_hpc_options)
+        self.configs = configs
+
+        #copy helper scripts to new directory
+        support_files = self.support_files
+        if self.pipeline:
+            sim_location = os.path.dirname(os.path.abspath(__file__))
+            support_files = support_files + [os.path.join(sim_location, x) for x in ['Remote_Mesher.py', 'GMSH_Mesh_Builder.py', 'Palace_Results.py']]
+        for support_file in support_files:
+            shutil.copy(support_file, os.path.join(self.user_options['sim_directory'], self.name))
+
+        for job_name, config in configs.items():
+            #write sim_config to json file and save to new directory
+            self._save_config_file_as_json(job_name, config)
+            if job_name in run_keys:
+                self.run_index.add(run_keys[job_name], job_name, os.path.join(self.user_options['sim_directory'], self.name, job_name + '.json'),
+                                   config['Problem']['Output'])
+
+            if self.hpc_options:
+                #create hpc batch file for simulations using the
+                self._create_hpc_batch_file(job_name, job_hpc_options.get(job_name))
 
+        #create a script which submits all jobs with their dependencies
+        if self.pipeline and configs:
+            job_names, job_dependencies = self._create_pipeline_batch_files(configs)
+            self._create_hpc_submit_script(job_names, job_dependencies)
+        elif self.hpc_options and configs and (len(configs) > 1 or self.job_dependencies or self.name not in configs):
+            self._create_hpc_submit_script(list(configs.keys()), self.job_dependencies)
+
+        if self.cached_jobs:
+            print(f"Reusing the results of {len(self.cached_jobs)} finished jobs: {list(self.cached_jobs.keys())}.")
         print('Simulation files created.')
 
 
-    def _save_config_file_as_json(self):
+    def _get_configs(self):
+        '''Returns a dictionary of all configs to be written where the keys are the job names. The main config may be None if the
+        simulation is only made up of sub-configs.'''
+
+        configs = {}
+        if self.sim_config is not None:
+            configs[self.name] = self.sim_config
+        configs.update(self.sub_configs)
+
+        return configs
+
+
+    def _store_mesh(self, configs):
+        '''Moves the mesh into the artifact store user_options['artifact_store'] (compressed via user_options['artifact_compression'],
+        defaults to zstd if available) and returns the configs pointing to the decompressed mesh in the cache of the store. The hash of the
+        mesh is written to <name>_artifacts.json in the simulation directory. Locally, the mesh is decompressed straight away. On the HPC,
+        the store must be copied to hpc_options['artifact_store_location'] and each job decompresses the mesh when it starts.'''
+
+        store = Artifact_Store(self.user_options['artifact_store'], self.user_options.get('artifact_compression'))
+
+        mesh_file = os.path.join(self.user_options['sim_directory'], self.name, self.name + '.msh')
+        self.mesh_hash = store.add(mesh_file)
+        os.remove(mesh_file)
+
+        if self.hpc_options:
+            assert self.hpc_options.get('artifact_store_location') is not None, "hpc_options['artifact_store_location'] must be given to use the artifact store on the HPC."
+            mesh_location = self.hpc_options['artifact_store_location'] + 'cache/' + self.mesh_hash + '.msh'
+        else:
+            mesh_location = os.path.abspath(store.extract(self.mesh_hash, 'msh'))
+
+        with open(os.path.join(self.user_options['sim_directory'], self.name, self.name + '_artifacts.json'), 'w') as f:
+            json.dump({'mesh': {'hash': self.mesh_hash, 'object': os.path.abspath(store.get_object(self.mesh_hash, 'msh')), 'location': mesh_location}}, f, indent=2)
+
+        return {x: {**y, 'Model': {**y['Model'], 'Mesh': mesh_location}} for x, y in configs.items()}
+
+
+    def _remove_cached_jobs(self, configs, job_hpc_options = {}):
+        '''Looks up each job in the run index and returns the configs of the jobs which must still be run along with their run keys. The
+        finished jobs are stored in cached_jobs. A finished job is still run if a job which must be run depends on it.'''
+
+        self.run_index = Run_Index(self.user_options.get('run_index', os.path.join(self.user_options['sim_directory'], 'run_index')))
+
+        #the hash covers the geometry and mesh settings if the mesh is built on the HPC
+        path = os.path.join(self.user_options['sim_directory'], self.name, self.name)
+        mesh_files = [path + '.brep', path + '_geometry.json'] if self.pipeline else [path + '.msh']
+        mesh_hash = self.mesh_hash if self.mesh_hash is not None else Run_Index.hash_files(mesh_files)
+
+        run_keys = {x: Run_Index.get_run_key(y, mesh_hash, job_hpc_options.get(x, {}).get('launch_profile')) for x, y in configs.items()}
+        cached_jobs = {x: self.run_index.lookup(run_keys[x]) for x in configs}
+        cached_jobs = {x: y for x, y in cached_jobs.items() if y is not None}
+
+        #keep the finished jobs which the remaining jobs depend on
+        while True:
+            required = set(sum([self.job_dependencies.get(x, []) for x in configs if x not in cached_jobs], []))
+            if not required.intersection(cached_jobs):
+                break
+            cached_jobs = {x: y for x, y in cached_jobs.items() if x not in required}
+
+        self.cached_jobs = cached_jobs
+        return {x: y for x, y in configs.items() if x not in cached_jobs}, {x: y for x, y in run_keys.items() if x not in cached_jobs}
+
+
+    def _get_scaling_test_configs(self, configs):
+        '''Returns a copy of each config for every launch profile in hpc_options['scaling_test'] (e.g. ['mpi', 'hybrid', 'memory_bound']),
+        along with the hpc_options of each copy. Each copy writes to its own output directory (suffixed by the profile), so the wall times
+        can be compared via Palace_Results.select_launch_profile.'''
+
+        assert not self.job_dependencies and not self.pipeline, "Scaling tests can only be run for independent jobs."
+
+        test_configs, job_hpc_options = {}, {}
+        for job_name, config in configs.items():
+            for profile in self.hpc_options['scaling_test']:
+                test_config = copy.deepcopy(config)
+                test_config['Problem']['Output'] = config['Problem']['Output'] + '_' + profile
+                test_configs[job_name + '_' + profile] = test_config
+                job_hpc_options[job_name + '_' + profile] = {**self.hpc_options, 'launch_profile': profile}
+
+        return test_configs, job_hpc_options
+
+
+    def _save_config_file_as_json(self, job_name, config):
         
         #simulation file name
-        json_file_name = self.name + "/" + self.name + ".json"
+        json_file_name = self.name + "/" + job_name + ".json"
         
         #save to created directory
         file = os.path.join(self.user_options['sim_directory'], json_file_name)
 
         #write to file
         with open(file, "w+") as f:
-            json.dump(self.sim_config, f, indent=2)
+            json.dump(config, f, indent=2)
+
+
+    def _save_labels(self, configs):
+        '''Writes <name>_labels.json with the names of the lumped ports and terminals (given by PALACE_Simulation) and the interface type of
+        each dielectric surface, keyed by their index in the configs.'''
+
+        config = list(configs.values())[0]
+        surfaces = {str(x['Index']): x['Type'] for x in config['Boundaries'].get('Postprocessing', {}).get('Dielectric', []) if 'Type' in x}
+
+        labels = {'ports': {}, 'terminals': {}, **self.labels, 'surfaces': surfaces}
+        with open(os.path.join(self.user_options['sim_directory'], self.name, self.name + '_labels.json'), 'w') as f:
+            json.dump(labels, f, indent=2)
 
 
     def _create_directory(self):
-        '''create a directory to hold the simulation files'''
+        '''create a directory to hold the simulation files - an existing directory is only reused if user_options['overwrite'] is True or
+        if user_options['reuse_results'] is True (so that the finished jobs of a previous run of the simulation are skipped)'''
   
         # Path
         path = os.path.join(self.user_options['sim_directory'], self.name)
@@ -51,8 +230,8 @@ class Simulation_Files_Builder:
         if not os.path.exists(path):
             os.makedirs(path)
             print("Directory '% s' created at '% s'." % (self.name, path))
-        else:
-            Exception('Path already exists. Create a new path.')
+        elif not self.user_options.get('overwrite', False) and not self.user_options.get('reuse_results', False):
+            raise Exception(f"Path '{path}' already exists. Create a new path or set user_options['overwrite'] (or user_options['reuse_results']) to True.")
 
 
     def _save_mesh_gmsh(self):
@@ -63,38 +242,214 @@ class Simulation_Files_Builder:
         gmsh.write(path)
 
 
-    def _create_hpc_batch_file(self):
+    def _save_geometry_gmsh(self):
+        '''function used to save the OpenCASCADE geometry (as a BREP file) along with the physical groups and the mesh settings (see
+        Remote_Mesher.get_geometry_settings) so that the mesh can be built on the HPC'''
+
+        path = os.path.join(self.user_options['sim_directory'], self.name, self.name)
+        gmsh.write(path + ".brep")
+
+        with open(path + "_geometry.json", "w+") as f:
+            json.dump(Remote_Mesher.get_geometry_settings(self.mesh_surfaces, self.user_options), f, indent=2)
+
+        print(f"Geometry saved ({(os.path.getsize(path + '.brep') + os.path.getsize(path + '_geometry.json')) / 1e6:.1f} MB) to be meshed on the HPC.")
+
+
+    def _create_hpc_batch_file(self, job_name, hpc_options = None, run_command = None):
         
-    
-        #note: I have disabled naming the output file by setting '# SBATCH' instead of '#SBATCH' 
-        #so I can get the slurm job number to use for testing
-        sbatch = {
-                "header": "#!/bin/bash --login",
-                "job_name": "#SBATCH --job-name=" + self.name,
-                "output_loc": "# SBATCH --output=" + self.name + ".out",
-                "error_out": "#SBATCH --error=" + self.name + ".err",
-                "partition": "#SBATCH --partition=general",
-                "nodes": "#SBATCH --nodes=" + self.hpc_options["hpc_nodes"],
-                "tasks": "#SBATCH --ntasks-per-node=" + self.hpc_options['cpus_per_node'],
-                "cpus": "#SBATCH --ntasks-per-core=1",
-                "memory": "#SBATCH --mem=" + self.hpc_options["sim_memory"],
-                "time": "#SBATCH --time=" + self.hpc_options['sim_time'],
-                "account": "#SBATCH --account=" + self.hpc_options['account_name'],
-                "easy_build": "module use /scratch/project_mnt/palace-sqdlab/Palace-Project-NEW/EasyBuild/modules/all",
-                "foss": "module load foss/2023a",
-                "cmake": "module load cmake/3.26.3-gcccore-12.3.0",
-                #"pkgconfig": "module load pkgconfig/1.5.5-gcccore-12.3.0-python",
-                "run_command": f"srun {self.hpc_options['palace_location']} " + self.hpc_options['input_files_location'] + self.name + "/" + self.name + ".json"
-        }
+        #by default the job runs Palace for the config of the same name using the resources in hpc_options
+        if hpc_options is None:
+            hpc_options = self.hpc_options
+
+        if run_command is None:
+            launcher = Simulation_Files_Builder.get_launch_settings(hpc_options)['launcher']
+            run_command = f"{launcher} {self.hpc_options['palace_location']} " + self.hpc_options['input_files_location'] + self.name + "/" + job_name + ".json"
+
+            #decompress the mesh from the artifact store before Palace starts
+            if self.use_artifact_store:
+                run_command = f"python {self.hpc_options['artifact_store_location']}Artifact_Store.py " + self.hpc_options['input_files_location'] \
+                              + self.name + "/" + job_name + ".json && " + run_command
+        commands = self.pre_run_commands.get(job_name, []) + [run_command]
 
         #simulation file name
-        file_name = self.name + "/" + self.name + ".sbatch"
+        file_name = self.name + "/" + job_name + ".sbatch"
         
         #save to created directory
         file = os.path.join(self.user_options['sim_directory'], file_name)
 
-        #write sbatch dictionary to file
+        #write sbatch file
+        with open(file, "w+", newline = '\n') as f:
+            f.write(Simulation_Files_Builder.render_hpc_batch_file(job_name, hpc_options, commands))
+
+
+    #note: I have disabled naming the output file by setting '# SBATCH' instead of '#SBATCH' 
+    #so I can get the slurm job number to use for testing
+    hpc_batch_template = string.Template('''#!/bin/bash --login
+#SBATCH --job-name=$job_name
+# SBATCH --output=$log_name.out
+#SBATCH --error=$log_name.err
+#SBATCH --partition=$partition
+#SBATCH --nodes=$nodes
+#SBATCH --ntasks-per-node=$ntasks_per_node
+$cpu_directives
+$memory_directive
+#SBATCH --time=$time
+#SBATCH --account=$account
+$extra_directives
+$modules
+$environment
+$commands
+''')
+
+    default_modules = [
+        "module use /scratch/project_mnt/palace-sqdlab/Palace-Project-NEW/EasyBuild/modules/all",
+        "module load foss/2023a",
+        "module load cmake/3.26.3-gcccore-12.3.0",
+        #"module load pkgconfig/1.5.5-gcccore-12.3.0-python",
+    ]
+
+    launch_profiles = ['default', 'mpi', 'hybrid', 'memory_bound']
+
+    @staticmethod
+    def get_launch_settings(hpc_options):
+        '''Returns a dictionary of the task layout, environment and launcher for the launch profile hpc_options['launch_profile']:
+            - default - one MPI rank per core launched with a bare srun.
+            - mpi - one MPI rank per core, bound to the cores.
+            - hybrid - MPI+OpenMP with hpc_options['omp_threads'] (defaults to 4) threads per rank, with the ranks and threads bound to
+                       neighbouring cores. Palace must be built with OpenMP support.
+            - memory_bound - hpc_options['ranks_per_node'] (defaults to half the cores) MPI ranks per node spread over the node, so that each
+                             rank has more memory and memory bandwidth.
+        '''
+
+        profile = hpc_options.get('launch_profile', 'default')
+        cpus_per_node = int(hpc_options['cpus_per_node'])
+
+        if profile == 'default':
+            return {'ntasks_per_node': cpus_per_node, 'cpu_directives': ["#SBATCH --ntasks-per-core=1"], 'environment': [], 'launcher': "srun"}
+        elif profile == 'mpi':
+            return {'ntasks_per_node': cpus_per_node, 'cpu_directives': ["#SBATCH --cpus-per-task=1"], 'environment': ["export OMP_NUM_THREADS=1"],
+                    'launcher': "srun --cpu-bind=cores --distribution=block:block"}
+        elif profile == 'hybrid':
+            threads = int(hpc_options.get('omp_threads', 4))
+            return {'ntasks_per_node': max(1, cpus_per_node // threads), 'cpu_directives': ["#SBATCH --cpus-per-task=" + str(threads)],
+                    'environment': ["export OMP_NUM_THREADS=" + str(threads), "export OMP_PLACES=cores", "export OMP_PROC_BIND=close"],
+                    'launcher': "srun --cpu-bind=cores --distribution=block:block"}
+        elif profile == 'memory_bound':
+            ranks = int(hpc_options.get('ranks_per_node', max(1, cpus_per_node // 2)))
+            return {'ntasks_per_node': ranks, 'cpu_directives': ["#SBATCH --cpus-per-task=" + str(max(1, cpus_per_node // ranks))],
+                    'environment': ["export OMP_NUM_THREADS=1"], 'launcher': "srun --cpu-bind=cores --distribution=cyclic:cyclic"}
+        else:
+            raise Exception(f"Launch profile '{profile}' must be one of {Simulation_Files_Builder.launch_profiles}.")
+
+    @staticmethod
+    def render_hpc_batch_file(job_name, hpc_options, commands, extra_directives = [], log_name = None):
+        '''Returns the contents of the sbatch file for the given job, rendered from hpc_batch_template with the launch profile in
+        hpc_options (see get_launch_settings). Optional hpc_options:
+            - partition - Defaults to 'general'.
+            - modules - list of the commands which load the modules (defaults to default_modules).
+            - mem_per_cpu - if given, the memory is requested per core (e.g. '4G') instead of per node ('sim_memory').
+
+        Args:
+            job_name - name of the job.
+            hpc_options - dictionary of the HPC settings.
+            commands - list of the commands run by the job.
+            extra_directives - (Optional) list of additional #SBATCH lines (e.g. for job arrays).
+            log_name - (Optional) Defaults to job_name. Name of the slurm output and error files.
+        '''
+
+        launch_settings = Simulation_Files_Builder.get_launch_settings(hpc_options)
+
+        if hpc_options.get('mem_per_cpu') is not None:
+            memory_directive = "#SBATCH --mem-per-cpu=" + hpc_options['mem_per_cpu']
+        else:
+            memory_directive = "#SBATCH --mem=" + hpc_options["sim_memory"]
+
+        sbatch = Simulation_Files_Builder.hpc_batch_template.substitute(
+            job_name = job_name,
+            log_name = log_name if log_name is not None else job_name,
+            partition = hpc_options.get('partition', 'general'),
+            nodes = hpc_options["hpc_nodes"],
+            ntasks_per_node = launch_settings['ntasks_per_node'],
+            cpu_directives = "\n".join(launch_settings['cpu_directives']),
+            memory_directive = memory_directive,
+            time = hpc_options['sim_time'],
+            account = hpc_options['account_name'],
+            extra_directives = "\n".join(extra_directives),
+            modules = "\n".join(hpc_options.get('modules', Simulation_Files_Builder.default_modules)),
+            environment = "\n".join(launch_settings['environment']),
+            commands = "\n".join(commands)
+        )
+
+        #remove the lines of empty sections
+        return "\n".join([x for x in sbatch.split("\n") if x != ""]) + "\n"
+
+
+    def _create_pipeline_batch_files(self, configs):
+        '''Creates the batch files for the meshing job (run before all Palace jobs) and the postprocessing job (run after all Palace jobs)
+        of the pipeline. Each stage runs on its own resources, given by overriding the entries of hpc_options with:
+            - mesh_resources - Defaults to a single core, i.e. {'hpc_nodes': '1', 'cpus_per_node': '1'}.
+            - postprocess_resources - Defaults to a single core for 30 minutes, i.e. {'hpc_nodes': '1', 'cpus_per_node': '1', 'sim_memory': '4G',
+                                      'sim_time': '00:30:00'}.
+
+        Returns:
+            Tuple (job_names, job_dependencies) of all jobs in the pipeline.
+        '''
+
+        sim_location = self.hpc_options['input_files_location'] + self.name + '/'
+        mesh_job = self.name + '_mesh'
+        post_job = self.name + '_post'
+
+        mesh_options = {**self.hpc_options, 'launch_profile': 'default', **self.hpc_options.get('mesh_resources', {'hpc_nodes': '1', 'cpus_per_node': '1'})}
+        mesh_command = 'python ' + sim_location + 'Remote_Mesher.py ' + sim_location + self.name + '.brep ' + sim_location + self.name + '_geometry.json ' \
+                       + sim_location + self.name + '.msh'
+        self._create_hpc_batch_file(mesh_job, mesh_options, mesh_command)
+
+        post_options = {**self.hpc_options, 'launch_profile': 'default', **self.hpc_options.get('postprocess_resources', {'hpc_nodes': '1', 'cpus_per_node': '1',
+                                                                                              'sim_memory': '4G', 'sim_time': '00:30:00'})}
+        post_command = 'python ' + sim_location + 'Palace_Results.py ' + self.hpc_options['output_files_location'] + self.name + '_summary.json ' \
+                       + ' '.join([x['Problem']['Output'] for x in configs.values()] + [x['output'] for x in self.cached_jobs.values()])
+        self._create_hpc_batch_file(post_job, post_options, post_command)
+
+        #every Palace job waits for the mesh and the postprocessing waits for every Palace job
+        job_dependencies = {x: [mesh_job] + self.job_dependencies.get(x, []) for x in configs}
+        job_dependencies[post_job] = list(configs.keys())
+
+        return [mesh_job] + list(configs.keys()) + [post_job], job_dependencies
+
+
+    def _create_hpc_submit_script(self, job_names, job_dependencies):
+        '''Creates a shell script which submits all the jobs in the simulation directory. Jobs listed in job_dependencies are only started
+        once the jobs they depend on have finished successfully (i.e. via --dependency=afterok).'''
+
+        #order jobs such that every job is submitted after the jobs it depends on
+        ordered_jobs = []
+        while len(ordered_jobs) < len(job_names):
+            ready_jobs = [x for x in job_names if x not in ordered_jobs and set(job_dependencies.get(x, [])).issubset(ordered_jobs)]
+            assert len(ready_jobs) > 0, "The job dependencies are circular or refer to jobs that do not exist."
+            ordered_jobs += ready_jobs
+
+        lines = ["#!/bin/bash"]
+        for job_name in ordered_jobs:
+            sbatch_file = self.hpc_options['input_files_location'] + self.name + "/" + job_name + ".sbatch"
+            dependencies = job_dependencies.get(job_name, [])
+            if dependencies:
+                dependency_flag = "--dependency=afterok:" + ":".join(["$" + self._get_job_variable(x) for x in dependencies]) + " "
+            else:
+                dependency_flag = ""
+            lines.append(f"{self._get_job_variable(job_name)}=$(sbatch --parsable {dependency_flag}{sbatch_file})")
+            lines.append(f"echo \"Submitted {job_name} as job ${self._get_job_variable(job_name)}\"")
+
+        #simulation file name
+        file_name = self.name + "/submit_" + self.name + ".sh"
+
+        #save to created directory
+        file = os.path.join(self.user_options['sim_directory'], file_name)
+
         with open(file, "w+", newline = '\n') as f:
-            for value in sbatch.values():
-                f.write('{}\n'.format(value))
+            for line in lines:
+                f.write('{}\n'.format(line))
+
 
+    def _get_job_variable(self, job_name):
+        #bash variable holding the slurm job id of the given job
+        return 'jid_' + ''.join([x if x.isalnum() else '_' for x in job_name])
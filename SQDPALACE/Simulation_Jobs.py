@@ -0,0 +1,316 @@
+import os
+import time
+import shlex
+import asyncio
+import gmsh
+from Local_Runner import Local_Runner
+from Palace_Results import Palace_Results
+from Resource_Estimator import Resource_Estimator
+
+class Simulation_Handle:
+    '''Tracks a simulation submitted via Simulation_Job_Manager.submit through its stages: 'queued', 'geometry', 'mesh', 'files', 'run',
+    'results' and finally 'done' (or 'failed'). The handle can be awaited, which returns the results of the simulation (see the backends)
+    or raises the error which stopped it.
+    '''
+
+    def __init__(self, name):
+        self.name = name
+        self.stage = 'queued'
+        self.stage_times = {'queued': time.time()}    #time at which each stage started
+        self.sim_info = None                            #information returned by PALACE_Simulation.run_simulation
+        self.results = None
+        self.error = None
+        self.task = None
+
+    def set_stage(self, stage):
+        self.stage = stage
+        self.stage_times[stage] = time.time()
+
+    def done(self):
+        return self.stage in ['done', 'failed']
+
+    def __await__(self):
+        return self.task.__await__()
+
+    def __repr__(self):
+        return f"Simulation_Handle('{self.name}', stage='{self.stage}')"
+
+
+class Local_Backend:
+    '''Runs the Palace jobs of each simulation on this machine. The cores are shared between all simulations run via the backend, so that
+    the total number of cores in use stays within max_cores. See Local_Runner for the inputs.
+
+    Inputs:
+        - cores_per_job - (Optional) Defaults to 1. Number of MPI ranks for each job.
+    '''
+
+    def __init__(self, max_cores = None, cores_per_job = 1, palace_location = 'palace', mpirun = 'mpirun'):
+        self.max_cores = max_cores if max_cores is not None else os.cpu_count()
+        self.cores_per_job = cores_per_job
+        self.palace_location = palace_location
+        self.mpirun = mpirun
+
+        self.free_cores = self.max_cores
+        self.cores_available = None
+
+    async def run(self, sim_info, checkpoint = None):
+        '''Runs the jobs of the simulation and returns a dictionary with the results of each job (see Local_Runner.run). Jobs whose results
+        were found in the run index have the status 'cached'. The start of the jobs is marked in the checkpoint if one is given.'''
+
+        if self.cores_available is None:
+            self.cores_available = asyncio.Condition()
+
+        #the runner is only used to prepare the commands and logs of each job
+        runner = Local_Runner(self.max_cores, self.palace_location, self.mpirun)
+        jobs = {x: y for x, y in sim_info['jobs'].items() if not y.get('cached', False)}
+        for job_name, job in jobs.items():
+            runner.add_job(job_name, job['config_file'], self.cores_per_job, job['dependencies'], job['pre_run_commands'])
+
+        if checkpoint is not None:
+            checkpoint.mark('submitted')
+
+        job_tasks = {}
+        for job_name in jobs:
+            job_tasks[job_name] = asyncio.ensure_future(self._run_job(runner, job_name, job_tasks))
+
+        job_results = dict(zip(job_tasks.keys(), await asyncio.gather(*job_tasks.values())))
+        job_results.update({x: {'status': 'cached', 'returncode': None, 'time': 0.0, 'log_file': None} for x in sim_info['jobs'] if x not in jobs})
+
+        return job_results
+
+    def collect_results(self, sim_info, job_results):
+        '''Returns a dictionary with the results of each job ('jobs') and the summary of the outputs of the completed jobs ('summary', see
+        Palace_Results.summarize_outputs), which is also written to <name>_summary.json in the simulation directory.'''
+
+        output_dirs = [sim_info['jobs'][x]['output'] for x, y in job_results.items() if y['status'] in ['completed', 'cached']]
+        summary = None
+        if output_dirs:
+            summary = Palace_Results.summarize_outputs(output_dirs, os.path.join(sim_info['sim_directory'], sim_info['name'] + '_summary.json'))
+
+        return {'jobs': job_results, 'summary': summary}
+
+    def record_resources(self, sim_info, job_results):
+        '''Adds the completed jobs to the resource history of the simulation (see Resource_Estimator.record_jobs).'''
+
+        if sim_info.get('resource_history') is not None:
+            Resource_Estimator(sim_info['resource_history']).record_jobs(sim_info, [x for x, y in job_results.items() if y['status'] == 'completed'],
+                                                                         self.cores_per_job)
+
+    async def _run_job(self, runner, job_name, job_tasks):
+
+        job = runner.jobs[job_name]
+
+        #wait for the dependencies - the job is skipped if any of them did not complete
+        for dependency in job['dependencies']:
+            dependency_result = await job_tasks[dependency]
+            if dependency_result['status'] != 'completed':
+                print(f"Job '{job_name}' skipped as a dependency did not complete.")
+                return {'status': 'skipped', 'returncode': None, 'time': 0.0, 'log_file': job['log_file']}
+
+        async with self.cores_available:
+            await self.cores_available.wait_for(lambda: self.free_cores >= job['cores'])
+            self.free_cores -= job['cores']
+
+        try:
+            print(f"Starting job '{job_name}' on {job['cores']} cores.")
+            start_time = time.time()
+            with open(job['log_file'], 'w') as log:
+                command = runner.get_command(job_name)
+                log.write(command + '\n')
+                log.flush()
+                process = await asyncio.create_subprocess_shell(command, stdout=log, stderr=asyncio.subprocess.STDOUT)
+                returncode = await process.wait()
+        finally:
+            async with self.cores_available:
+                self.free_cores += job['cores']
+                self.cores_available.notify_all()
+
+        status = 'completed' if returncode == 0 else 'failed'
+        print(f"Job '{job_name}' {status} (exit code {returncode}) in {time.time() - start_time:.1f} s.")
+
+        return {'status': status, 'returncode': returncode, 'time': time.time() - start_time, 'log_file': job['log_file']}
+
+
+class Slurm_Backend:
+    '''Submits the jobs of each simulation to Slurm and waits for them to finish. The simulation files must be visible on the cluster at
+    hpc_options['input_files_location'] (e.g. the workstation is the login node or the simulation directory is mounted on the cluster).
+
+    Inputs:
+        - ssh_host - (Optional) Defaults to None. If given, the Slurm commands are run on this host via ssh.
+        - poll_interval - (Optional) Defaults to 30. Time in seconds between checks of the job states.
+    '''
+
+    #job states in which the job has stopped
+    finished_states = ['COMPLETED', 'FAILED', 'CANCELLED', 'TIMEOUT', 'OUT_OF_MEMORY', 'NODE_FAIL', 'PREEMPTED', 'BOOT_FAIL', 'DEADLINE']
+
+    def __init__(self, ssh_host = None, poll_interval = 30):
+        self.ssh_host = ssh_host
+        self.poll_interval = poll_interval
+
+    async def run(self, sim_info, checkpoint = None):
+        '''Submits the jobs of the simulation (via the submit script if there is one, otherwise via the sbatch file) and returns a
+        dictionary with the slurm job ID ('job_ids') and final state ('states') of each job. Jobs whose results were found in the run index
+        are not submitted and have the state 'CACHED'. If a checkpoint is given, the job IDs are stored in it, and jobs which were already
+        submitted by a previous run are polled again instead of being submitted a second time.'''
+
+        hpc_options = sim_info['hpc_options']
+        assert hpc_options, "The Slurm backend requires hpc_options."
+
+        cached_states = {x: 'CACHED' for x, y in sim_info['jobs'].items() if y.get('cached', False)}
+        if len(cached_states) == len(sim_info['jobs']):
+            return {'job_ids': {}, 'states': cached_states}
+
+        sim_location = hpc_options['input_files_location'] + sim_info['name'] + '/'
+        if checkpoint is not None and checkpoint.is_complete('submitted'):
+            job_ids = checkpoint.get('submitted')['job_ids']
+            print(f"Polling the jobs submitted by a previous run: {job_ids}")
+        else:
+            if os.path.exists(os.path.join(sim_info['sim_directory'], 'submit_' + sim_info['name'] + '.sh')):
+                output = await self._run_command('bash ' + sim_location + 'submit_' + sim_info['name'] + '.sh')
+                job_ids = {x.split()[1]: x.split()[-1] for x in output.splitlines() if x.startswith('Submitted ')}
+            else:
+                output = await self._run_command('sbatch --parsable ' + sim_location + sim_info['name'] + '.sbatch')
+                job_ids = {sim_info['name']: output.strip().split(';')[0]}
+
+            print(f"Submitted jobs: {job_ids}")
+            if checkpoint is not None:
+                checkpoint.mark('submitted', job_ids=job_ids)
+
+        #poll until all jobs have stopped - jobs waiting on a failed dependency never start, so they are not waited for
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            states, reasons = await self._get_job_states(list(job_ids.values()))
+            reasons = {x: reasons.get(y, '') for x, y in job_ids.items()}
+            states = {x: states.get(y, 'UNKNOWN') for x, y in job_ids.items()}
+            stopped = [y.split()[0] in Slurm_Backend.finished_states or (y.split()[0] == 'PENDING' and reasons[x] == 'DependencyNeverSatisfied')
+                       for x, y in states.items()]
+            if all(stopped):
+                break
+
+        return {'job_ids': job_ids, 'states': {**states, **cached_states}}
+
+    def collect_results(self, sim_info, job_results):
+        '''Returns the job IDs and states, as the outputs stay on the cluster (see the postprocessing job of the pipeline in
+        Simulation_Files_Builder for condensing them there).'''
+        return job_results
+
+    def record_resources(self, sim_info, job_results):
+        '''Adds the completed jobs whose outputs are visible from this machine to the resource history of the simulation (see
+        Resource_Estimator.record_jobs).'''
+
+        hpc_options = sim_info['hpc_options']
+        if sim_info.get('resource_history') is not None:
+            cores = int(hpc_options['hpc_nodes']) * int(hpc_options['cpus_per_node'])
+            Resource_Estimator(sim_info['resource_history']).record_jobs(sim_info, [x for x, y in job_results['states'].items() if y == 'COMPLETED'], cores)
+
+    async def _get_job_states(self, job_ids):
+
+        #returns the state and the reason (e.g. why the job is pending) of each job
+        output = await self._run_command('sacct -n -X -P -o JobID,State,Reason -j ' + ','.join(job_ids))
+        states, reasons = {}, {}
+        for line in output.splitlines():
+            if '|' in line:
+                job_id, state, reason = (line.split('|') + [''])[:3]
+                states[job_id] = state
+                reasons[job_id] = reason
+        return states, reasons
+
+    async def _run_command(self, command):
+
+        if self.ssh_host is not None:
+            command = 'ssh ' + self.ssh_host + ' ' + shlex.quote(command)
+
+        process = await asyncio.create_subprocess_shell(command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        stdout, stderr = await process.communicate()
+        if process.returncode != 0:
+            raise Exception(f"Command '{command}' failed: {stderr.decode()}")
+
+        return stdout.decode()
+
+
+class Simulation_Job_Manager:
+    '''Asynchronous interface for running simulations, e.g. in a notebook:
+
+        manager = Simulation_Job_Manager(Local_Backend(max_cores=8))
+        handles = [manager.submit(PALACE_Simulation(...)) for design in designs]
+        results = await manager.gather(*handles)
+
+    Preparing a simulation (geometry, mesh and files) is done in a worker thread one simulation at a time, as Gmsh holds a single global
+    model, while the Palace runs of previously prepared simulations continue in the backend. Gmsh is initialized on the main thread and
+    kept initialized between simulations. The local and Slurm backends are interchangeable. If user_options['checkpoint'] is set for a
+    simulation, resubmitting it after an interruption picks up at its first incomplete stage (see Checkpoint).
+
+    Inputs:
+        - backend - Local_Backend or Slurm_Backend.
+    '''
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.prepare_lock = None
+        self.handles = []
+
+    def submit(self, simulation):
+        '''Queues a PALACE_Simulation object and returns its Simulation_Handle. Must be called with a running event loop (as in a notebook
+        or inside a coroutine).'''
+
+        if self.prepare_lock is None:
+            self.prepare_lock = asyncio.Lock()
+
+        #the backend runs Palace, so the simulation only prepares the files (without opening the Gmsh GUI) - Gmsh is kept initialized, as
+        #it can only be initialized on the main thread (see _run)
+        simulation.user_options = {**simulation.user_options, 'run_locally': False, 'show_gui': False, 'keep_gmsh_initialized': True}
+
+        handle = Simulation_Handle(simulation.name)
+        handle.task = asyncio.ensure_future(self._run(handle, simulation))
+        self.handles.append(handle)
+
+        return handle
+
+    async def gather(self, *handles):
+        '''Waits for all given handles (all submitted handles if none are given) and returns their results. Errors are returned in place
+        of the results of the failed simulations.'''
+
+        handles = handles if handles else self.handles
+        return await asyncio.gather(*[x.task for x in handles], return_exceptions=True)
+
+    def status(self):
+        '''Returns a dictionary of the stage of each submitted simulation.'''
+        return {x.name: x.stage for x in self.handles}
+
+    async def _run(self, handle, simulation):
+
+        try:
+            async with self.prepare_lock:
+                #gmsh.initialize installs a SIGINT handler, which is only allowed on the main thread, so Gmsh is initialized here (without
+                #the handler) and the worker thread only clears its model
+                if not gmsh.isInitialized():
+                    gmsh.initialize(interruptible = False)
+                handle.sim_info = await asyncio.to_thread(simulation.run_simulation, handle.set_stage)
+            checkpoint = simulation.checkpoint
+
+            if checkpoint is not None and checkpoint.is_complete('parsed'):
+                handle.results = checkpoint.get('parsed')['results']
+                handle.set_stage('done')
+                return handle.results
+
+            handle.set_stage('run')
+            if checkpoint is not None and checkpoint.is_complete('finished'):
+                job_results = checkpoint.get('finished')['job_results']
+            else:
+                job_results = await self.backend.run(handle.sim_info, checkpoint)
+                self.backend.record_resources(handle.sim_info, job_results)
+                if checkpoint is not None:
+                    checkpoint.mark('finished', job_results=job_results)
+
+            handle.set_stage('results')
+            handle.results = await asyncio.to_thread(self.backend.collect_results, handle.sim_info, job_results)
+            if checkpoint is not None:
+                checkpoint.mark('parsed', results=handle.results)
+            handle.set_stage('done')
+
+        except Exception as error:
+            handle.error = error
+            handle.set_stage('failed')
+            raise
+
+        return handle.results
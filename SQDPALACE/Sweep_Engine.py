@@ -0,0 +1,160 @@
+import os
+import json
+import time
+import pickle
+import itertools
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from Checkpoint import Checkpoint
+
+class Sweep_Engine:
+    '''Prepares the simulation files (geometry, mesh and configs) for every variant of a parameter sweep in a pool of worker processes.
+    Each worker has its own Gmsh session, so the variants are built in parallel. Errors are captured per variant, so one broken variant
+    does not stop the sweep. The resulting simulations can be packaged into a job array via Sweep_Packager.
+
+    If user_options['checkpoint'] is True, running the sweep again after an interruption skips the variants whose simulation files were
+    already written, and only the remaining variants are built (see Checkpoint).
+
+    Inputs:
+        - name - name of the sweep. The variants are named <name>_<index>.
+        - design - base Qiskit-Metal design object (must be picklable, as for QDesign.save_design).
+        - simulation_type - 'Eigenmode', 'Driven' or 'Capacitance'.
+        - user_options - user_options passed to PALACE_Simulation for every variant.
+        - ports - (Optional) ports passed to PALACE_Simulation.
+        - hpc_options - (Optional) hpc_options passed to PALACE_Simulation.
+        - num_workers - (Optional) Defaults to the number of cores. Number of worker processes.
+        - service - (Optional) Defaults to None. Worker_Service whose warmed-up workers are used instead of starting a new pool for the
+                    sweep (num_workers is then ignored).
+    '''
+
+    def __init__(self, name, design, simulation_type, user_options, ports = [], hpc_options = {}, num_workers = None, service = None):
+        self.name = name
+        self.design = design
+        self.simulation_type = simulation_type
+        self.user_options = user_options
+        self.ports = ports
+        self.hpc_options = hpc_options
+        self.num_workers = num_workers if num_workers is not None else os.cpu_count()
+        self.service = service
+
+    @staticmethod
+    def get_variants(overrides):
+        '''Returns a list of overrides (one dictionary per variant) from either:
+            - a list of dictionaries, each giving the overrides of one variant, or
+            - a dictionary of lists (a grid), where every combination of the values is a variant.
+        The keys are the component name followed by the option path, e.g. {'Q1.pad_gap': ['20um', '30um'], 'Q1.connection_pads.a.pad_width':
+        ['80um', '100um']}.'''
+
+        if isinstance(overrides, dict):
+            keys = list(overrides.keys())
+            return [dict(zip(keys, x)) for x in itertools.product(*[overrides[x] for x in keys])]
+        return list(overrides)
+
+    @staticmethod
+    def apply_overrides(design, overrides):
+        '''Sets the component options given in overrides (see get_variants) and rebuilds the design.'''
+
+        for key, value in overrides.items():
+            component_name, *option_path = key.split('.')
+            assert component_name in design.components, f"Component '{component_name}' is not in the design."
+            assert len(option_path) > 0, f"Override '{key}' must be of the form '<component>.<option>'."
+
+            options = design.components[component_name].options
+            for option in option_path[:-1]:
+                options = options[option]
+            options[option_path[-1]] = value
+
+        design.rebuild()
+
+    def run(self, overrides, progress_callback = None):
+        '''Builds every variant and writes its simulation files into user_options['sim_directory'].
+
+        Args:
+            overrides - overrides of each variant (see get_variants).
+            progress_callback - (Optional) function called with (number finished, number of variants, variant result) as each variant
+                                finishes. By default the progress is printed.
+
+        Returns:
+            Dictionary keyed by the variant name with the 'overrides', 'status' ('completed' or 'failed'), 'time', 'sim_info' (see
+            PALACE_Simulation.run_simulation), 'error' (traceback) and whether it was 'resumed' from a checkpoint of each variant. The
+            overrides of each variant are also written to <name>_variants.json in the simulation directory.
+        '''
+
+        variants = Sweep_Engine.get_variants(overrides)
+        variant_names = [self.name + '_' + str(m).zfill(len(str(len(variants)-1))) for m in range(len(variants))]
+
+        os.makedirs(self.user_options['sim_directory'], exist_ok=True)
+        with open(os.path.join(self.user_options['sim_directory'], self.name + '_variants.json'), 'w') as f:
+            json.dump(dict(zip(variant_names, variants)), f, indent=2, default=str)
+
+        #the design is pickled once and rebuilt in each worker, which has its own Gmsh session (kept open between variants)
+        design_snapshot = pickle.dumps(self.design)
+        user_options = {**self.user_options, 'show_gui': False, 'run_locally': False, 'keep_gmsh_initialized': True}
+
+        #the overrides are part of the key of each checkpoint, as the design itself is not compared
+        variant_options = {x: user_options for x in variant_names}
+        results = {}
+        if self.user_options.get('checkpoint', False):
+            for variant_name, variant in zip(variant_names, variants):
+                variant_options[variant_name] = {**user_options, 'checkpoint_key': json.dumps(variant, sort_keys=True, default=str)}
+                checkpoint = Checkpoint.for_simulation(self.simulation_type, variant_name, variant_options[variant_name], self.ports, self.hpc_options)
+                if checkpoint.is_complete('files'):
+                    results[variant_name] = {'overrides': variant, 'status': 'completed', 'time': 0.0, 'sim_info': checkpoint.get('files')['sim_info'],
+                                             'error': None, 'resumed': True}
+            if results:
+                print(f"Sweep '{self.name}': {len(results)} of {len(variants)} variants resumed from their checkpoints.")
+
+        start_time = time.time()
+        if self.service is not None:
+            self.service.start()
+            executor = self.service.executor
+        else:
+            executor = ProcessPoolExecutor(max_workers = self.num_workers, mp_context = multiprocessing.get_context('spawn'))
+
+        try:
+            futures = {executor.submit(build_variant, design_snapshot, x, y, self.simulation_type, variant_options[x], self.ports, self.hpc_options): x
+                       for x, y in zip(variant_names, variants) if x not in results}
+
+            for future in as_completed(futures):
+                variant_name = futures[future]
+                results[variant_name] = {'overrides': variants[variant_names.index(variant_name)], **future.result(), 'resumed': False}
+
+                if progress_callback is not None:
+                    progress_callback(len(results), len(variants), results[variant_name])
+                else:
+                    print(f"[{len(results)}/{len(variants)}] {variant_name} {results[variant_name]['status']} in {results[variant_name]['time']:.1f} s.")
+        finally:
+            #the workers of a service are kept for later sweeps
+            if self.service is None:
+                executor.shutdown(wait = True)
+
+        num_failed = len([x for x in results.values() if x['status'] == 'failed'])
+        print(f"Sweep '{self.name}': {len(variants) - num_failed} of {len(variants)} variants prepared in {time.time() - start_time:.1f} s.")
+        for variant_name, result in results.items():
+            if result['status'] == 'failed':
+                print(f"{variant_name} failed:\n{result['error']}")
+
+        return {x: results[x] for x in variant_names}
+
+
+def build_variant(design_snapshot, variant_name, overrides, simulation_type, user_options, ports, hpc_options):
+    '''Builds a single sweep variant in a worker process and returns its 'status', 'time', 'sim_info' and 'error'.'''
+
+    start_time = time.time()
+    try:
+        #plots are not shown in the worker processes
+        import matplotlib
+        matplotlib.use('Agg')
+        from PALACE_Simulation import PALACE_Simulation
+
+        design = pickle.loads(design_snapshot)
+        Sweep_Engine.apply_overrides(design, overrides)
+
+        simulation = PALACE_Simulation(simulation_type, variant_name, design, user_options, ports, hpc_options)
+        sim_info = simulation.run_simulation()
+
+        return {'status': 'completed', 'time': time.time() - start_time, 'sim_info': sim_info, 'error': None}
+
+    except Exception:
+        return {'status': 'failed', 'time': time.time() - start_time, 'sim_info': None, 'error': traceback.format_exc()}
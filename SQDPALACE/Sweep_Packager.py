@@ -0,0 +1,99 @@
+import os
+from Simulation_Files_Builder import Simulation_Files_Builder
+
+class Sweep_Packager:
+    '''Packages the simulations of a parameter sweep into a single Slurm job array instead of one submission per simulation. The
+    simulations must have been created beforehand (e.g. via PALACE_Simulation.run_simulation) in user_options['sim_directory']. This
+    writes the following into the directory user_options['sim_directory']/name:
+        - name_index.txt - maps each array task ID to the config files it runs (one line per config: task ID, simulation directory and
+                           config file, all tab separated).
+        - name.sbatch - the job array, submitted via 'sbatch name.sbatch'. Each task runs its configs one after the other.
+
+    Inputs:
+        - name - name of the sweep.
+        - user_options - dictionary with 'sim_directory' (local directory holding the simulations).
+        - hpc_options - dictionary of the HPC settings (see Simulation_Files_Builder). The resources are given per array task.
+        - sims_per_task - (Optional) Defaults to 1. Number of simulations packed into each array task (i.e. run in the same allocation).
+                          Packing is useful for many small simulations, in which case 'sim_time' must cover all simulations in a task.
+        - throttle - (Optional) Defaults to None. Maximum number of array tasks running at the same time (i.e. --array=0-N%throttle).
+
+    If hpc_options['artifact_store_location'] is given, each task decompresses the meshes of its configs from the artifact store before
+    running them (see Artifact_Store).
+    '''
+
+    def __init__(self, name, user_options, hpc_options, sims_per_task = 1, throttle = None):
+        self.name = name
+        self.user_options = user_options
+        self.hpc_options = hpc_options
+        self.sims_per_task = sims_per_task
+        self.throttle = throttle
+
+    def create_array_files(self, sim_jobs):
+        '''Creates the index file and the job array sbatch file.
+
+        Args:
+            sim_jobs - list of simulation names or dictionary keyed by simulation name with the list of job names (i.e. config files
+                       without the .json extension) to run for that simulation. If only a name is given, its main config (name.json) is run.
+                       Jobs which depend on each other (e.g. two-stage solves) should not be packaged into a job array.
+
+        Returns:
+            Dictionary keyed by the array task ID with the list of config files (on the HPC) run by that task.
+        '''
+
+        if not isinstance(sim_jobs, dict):
+            sim_jobs = {x: [x] for x in sim_jobs}
+        assert len(sim_jobs) > 0, "No simulations were given for the sweep."
+        assert self.sims_per_task >= 1, "'sims_per_task' must be at least 1."
+
+        #check that the configs exist locally before writing the array
+        for sim_name, job_names in sim_jobs.items():
+            for job_name in job_names:
+                config_file = os.path.join(self.user_options['sim_directory'], sim_name, job_name + '.json')
+                assert os.path.exists(config_file), f"Config file '{config_file}' does not exist. Create the simulation files first."
+
+        sim_names = list(sim_jobs.keys())
+        tasks = {}
+        for task_id, start in enumerate(range(0, len(sim_names), self.sims_per_task)):
+            tasks[task_id] = [(x, self.hpc_options['input_files_location'] + x + '/' + y + '.json') for x in sim_names[start:start+self.sims_per_task] for y in sim_jobs[x]]
+
+        sweep_directory = os.path.join(self.user_options['sim_directory'], self.name)
+        if not os.path.exists(sweep_directory):
+            os.makedirs(sweep_directory)
+
+        self._create_index_file(sweep_directory, tasks)
+        self._create_array_batch_file(sweep_directory, len(tasks))
+
+        print(f"Sweep '{self.name}' packaged into {len(tasks)} array tasks for {len(sim_names)} simulations.")
+
+        return {x: [z for _, z in y] for x, y in tasks.items()}
+
+    def _create_index_file(self, sweep_directory, tasks):
+
+        file = os.path.join(sweep_directory, self.name + '_index.txt')
+        with open(file, "w+", newline = '\n') as f:
+            for task_id, configs in tasks.items():
+                for sim_name, config_file in configs:
+                    f.write(f'{task_id}\t{sim_name}\t{config_file}\n')
+
+    def _create_array_batch_file(self, sweep_directory, num_tasks):
+
+        array_range = "0-" + str(num_tasks - 1)
+        if self.throttle is not None:
+            array_range += "%" + str(self.throttle)
+
+        #run every config of this task - the remaining configs are still run if one fails, but the task is marked as failed
+        index_file = self.hpc_options['input_files_location'] + self.name + '/' + self.name + '_index.txt'
+        launcher = Simulation_Files_Builder.get_launch_settings(self.hpc_options)['launcher']
+        if self.hpc_options.get('artifact_store_location') is not None:
+            launcher = f"python {self.hpc_options['artifact_store_location']}Artifact_Store.py $CONFIG && " + launcher
+        commands = [f"CONFIGS=$(awk -F '\\t' -v id=$SLURM_ARRAY_TASK_ID '$1 == id {{print $3}}' {index_file})",
+                    "STATUS=0",
+                    f"for CONFIG in $CONFIGS; do {launcher} {self.hpc_options['palace_location']} $CONFIG || STATUS=1; done",
+                    "exit $STATUS"]
+
+        sbatch = Simulation_Files_Builder.render_hpc_batch_file(self.name, self.hpc_options, commands, ["#SBATCH --array=" + array_range],
+                                                                self.name + "_%a")
+
+        file = os.path.join(sweep_directory, self.name + '.sbatch')
+        with open(file, "w+", newline = '\n') as f:
+            f.write(sbatch)
@@ -0,0 +1,53 @@
+import os
+import sys
+import time
+import json
+
+'''Stand-in for the Palace executable used to test the job runners without Palace, i.e.:
+
+    python palace_stub.py <config file>
+
+It prints a few log lines, waits for PALACE_STUB_TIME seconds (defaults to 1) and writes placeholder results in the Palace output format
+(eig.csv, port-S.csv or terminal-C.csv along with palace.json) into the output directory of the config. It exits with code 1 if the
+environment variable PALACE_STUB_FAIL is set.
+'''
+
+config_file = sys.argv[-1]
+with open(config_file) as f:
+    config = json.load(f)
+
+problem_type = config['Problem']['Type']
+output = config['Problem']['Output']
+os.makedirs(output, exist_ok=True)
+
+print(f"Palace stub: running {problem_type} simulation '{config_file}'.", flush=True)
+start_time = time.time()
+time.sleep(float(os.environ.get('PALACE_STUB_TIME', 1)))
+
+if os.environ.get('PALACE_STUB_FAIL'):
+    print("Palace stub: failed.", flush=True)
+    sys.exit(1)
+
+solver = config['Solver'][problem_type]
+if problem_type == 'Eigenmode':
+    lines = ["m, Re{f} (GHz), Im{f} (GHz), Q"]
+    lines += [f"{m+1}, {solver['Target'] * (1 + 0.1*m)}, {1e-4 * (m+1)}, {1e4 / (m+1)}" for m in range(solver['N'])]
+    file_name = 'eig.csv'
+elif problem_type == 'Driven':
+    min_freq, max_freq, freq_step = solver.get('MinFreq', 4.0), solver.get('MaxFreq', 8.0), solver.get('FreqStep', 1.0)
+    port = [x['Index'] for x in config['Boundaries']['LumpedPort'] if x.get('Excitation', False)][0]
+    lines = [f"f (GHz), |S[{port}][{port}]| (dB), arg(S[{port}][{port}]) (deg.)"]
+    lines += [f"{min_freq + m*freq_step}, -1.0, 0.0" for m in range(int(round((max_freq - min_freq) / freq_step)) + 1)]
+    file_name = 'port-S.csv'
+else:
+    indices = [x['Index'] for x in config['Boundaries']['Terminal']]
+    lines = ["i, " + ", ".join([f"C[i][{x}] (F)" for x in indices])]
+    lines += [f"{x}, " + ", ".join([str(1e-13 if x == y else -1e-15) for y in indices]) for x in indices]
+    file_name = 'terminal-C.csv'
+
+with open(os.path.join(output, file_name), 'w') as f:
+    f.write("\n".join(lines) + "\n")
+with open(os.path.join(output, 'palace.json'), 'w') as f:
+    json.dump({'ElapsedTime': {'Durations': {'Total': time.time() - start_time}}}, f, indent=2)
+
+print("Palace stub: completed.", flush=True)
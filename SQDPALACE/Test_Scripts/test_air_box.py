@@ -0,0 +1,79 @@
+import os
+import sys
+import types
+import importlib
+from unittest import mock
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+'''Tests of the air box drawn by GMSH_Geometry_Builder, with stand-ins for Gmsh and for any of the rendering packages (Qiskit-Metal,
+shapely, geopandas and matplotlib) which are not installed, i.e.:
+
+    python -m pytest Test_Scripts
+'''
+
+rendering_modules = ['qiskit_metal', 'qiskit_metal.qgeometries.qgeometries_handler', 'qiskit_metal.renderers.renderer_mpl.mpl_renderer',
+                     'qiskit_metal.qlibrary.terminations.launchpad_wb', 'shapely', 'pandas', 'geopandas', 'matplotlib',
+                     'matplotlib.pyplot', 'Utilities.QiskitShapelyRenderer', 'Utilities.ShapelyEx', 'Utilities.QUtilities']
+
+@pytest.fixture
+def builder_module(monkeypatch):
+
+    for name in rendering_modules:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            monkeypatch.setitem(sys.modules, name, mock.MagicMock())
+
+    boxes = []
+    gmsh = types.ModuleType('gmsh')
+    gmsh.model = types.SimpleNamespace(occ = types.SimpleNamespace(addBox = lambda *args: boxes.append(args) or len(boxes),
+                                                                     synchronize = lambda: None))
+    monkeypatch.setitem(sys.modules, 'gmsh', gmsh)
+    monkeypatch.delitem(sys.modules, 'GMSH_Geometrey_Builder', raising=False)
+
+    module = importlib.import_module('GMSH_Geometrey_Builder')
+    monkeypatch.setattr(module.QUtilities, 'get_units', lambda design: 1e-3, raising=False)
+    module.boxes = boxes
+
+    return module
+
+
+def get_air_box_size(module, user_options, size_x, size_y, size_z):
+    '''Draws the air box of a chip (sizes in mm) on a grounded back side and returns its size (dx, dy, dz) in mm.'''
+
+    builder = module.GMSH_Geometry_Builder.__new__(module.GMSH_Geometry_Builder)
+    builder.design = types.SimpleNamespace(get_units = lambda: 'mm')
+    builder.simulation_type = 'Driven'
+    builder.user_options = user_options
+    builder.center_x, builder.center_y, builder.center_z = 0.0, 0.0, 0.0
+    builder.length_x, builder.length_y, builder.length_z = size_x, size_y, -size_z
+
+    builder._draw_air_box(bottom_grounded = True)
+    _, _, _, dx, dy, dz = module.boxes[-1]
+
+    return dx, dy, dz
+
+
+def test_default_air_box_is_20_percent_larger_than_chip(builder_module):
+
+    assert get_air_box_size(builder_module, {'stop_freq': 8.0}, 10.0, 5.0, 0.5) == pytest.approx((12.0, 6.0, 1.0))
+
+
+@pytest.mark.parametrize('absorbing_order, fraction', [(1, 1/4), (2, 1/8)])
+def test_absorbing_air_box_is_sized_from_wavelength(builder_module, absorbing_order, fraction):
+
+    #free-space wavelength at 8 GHz in mm
+    margin = fraction * 299792458 / 8e9 * 1e3
+    user_options = {'start_freq': 4.0, 'stop_freq': 8.0, 'far_field_type': 'absorbing', 'absorbing_order': absorbing_order}
+
+    assert get_air_box_size(builder_module, user_options, 10.0, 5.0, 0.5) == pytest.approx((10.0 + 2*margin, 5.0 + 2*margin, 0.5 + margin))
+
+
+def test_absorbing_air_box_margin_is_at_least_three_substrate_thicknesses(builder_module):
+
+    #a quarter wavelength at 300 GHz (0.25 mm) is less than three substrate thicknesses
+    user_options = {'start_freq': 4.0, 'stop_freq': 300.0, 'far_field_type': 'absorbing'}
+
+    assert get_air_box_size(builder_module, user_options, 10.0, 5.0, 0.5) == pytest.approx((13.0, 8.0, 2.0))
@@ -0,0 +1,84 @@
+import os
+import sys
+import json
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Local_Runner import Local_Runner
+
+'''Tests of Local_Runner with Test_Scripts/palace_stub.py in place of Palace, i.e.:
+
+    python -m pytest Test_Scripts
+'''
+
+palace_stub = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'palace_stub.py')
+
+
+def write_config(directory, job_name):
+    '''Writes an Eigenmode config which the Palace stub can run and returns its file name.'''
+
+    config = {'Problem': {'Type': 'Eigenmode', 'Output': os.path.join(str(directory), 'output_' + job_name)},
+              'Solver': {'Eigenmode': {'Target': 5.0, 'N': 2}}}
+    config_file = os.path.join(str(directory), job_name + '.json')
+    with open(config_file, 'w') as f:
+        json.dump(config, f)
+
+    return config_file
+
+
+@pytest.fixture
+def runner(tmp_path, monkeypatch):
+
+    monkeypatch.setenv('PALACE_STUB_TIME', '0.3')
+    monkeypatch.delenv('PALACE_STUB_FAIL', raising=False)
+    runner = Local_Runner(max_cores = 2, palace_location = f'{sys.executable} {palace_stub}', mpirun = None, poll_interval = 0.05)
+
+    #record when each job is started (the runner measures the wall time from the same start time)
+    runner.start_times = {}
+    start_job = runner._start_job
+    def record_start(job_name):
+        process, log, start_time = start_job(job_name)
+        runner.start_times[job_name] = start_time
+        return process, log, start_time
+    monkeypatch.setattr(runner, '_start_job', record_start)
+
+    return runner
+
+
+def test_dag_respects_cores_and_dependencies(tmp_path, runner):
+
+    #'fail' exits with an error, so 'after_fail' and (via it) 'after_after_fail' never start
+    jobs = {'a': (1, []), 'b': (1, []), 'wide': (2, ['a']), 'fail': (1, []), 'after_fail': (1, ['fail']),
+            'after_after_fail': (1, ['after_fail'])}
+    for job_name, (cores, dependencies) in jobs.items():
+        pre_run_commands = ['export PALACE_STUB_FAIL=1'] if job_name == 'fail' else []
+        runner.add_job(job_name, write_config(tmp_path, job_name), cores, dependencies, pre_run_commands)
+
+    results = runner.run()
+
+    assert {x: y['status'] for x, y in results.items()} == {'a': 'completed', 'b': 'completed', 'wide': 'completed', 'fail': 'failed',
+                                                          'after_fail': 'skipped', 'after_after_fail': 'skipped'}
+    assert set(runner.start_times) == {'a', 'b', 'wide', 'fail'}
+    assert os.path.exists(os.path.join(str(tmp_path), 'output_wide', 'eig.csv'))
+    assert not os.path.exists(os.path.join(str(tmp_path), 'output_after_fail'))
+
+    #the job only starts once its dependency has finished
+    end_times = {x: y + results[x]['time'] for x, y in runner.start_times.items()}
+    assert runner.start_times['wide'] >= end_times['a']
+
+    #the cores in use never exceed max_cores
+    for start_time in runner.start_times.values():
+        cores = sum([jobs[x][0] for x, y in runner.start_times.items() if y <= start_time < end_times[x]])
+        assert cores <= runner.max_cores
+
+
+@pytest.mark.parametrize('jobs', [{'a': ['a']}, {'a': ['b'], 'b': ['a']}, {'a': ['c'], 'b': ['a'], 'c': ['b']}])
+def test_dependency_cycles_are_rejected(tmp_path, runner, jobs):
+
+    job_names = list(jobs.keys())
+    for job_name in job_names[:-1]:
+        runner.add_job(job_name, write_config(tmp_path, job_name), dependencies = jobs[job_name])
+
+    with pytest.raises(AssertionError, match='depends on itself'):
+        runner.add_job(job_names[-1], write_config(tmp_path, job_names[-1]), dependencies = jobs[job_names[-1]])
@@ -0,0 +1,56 @@
+import os
+import sys
+import json
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Palace_Config as palace_config_module
+from Palace_Config import Palace_Config
+
+'''Tests of the config sections and validation in Palace_Config, i.e.:
+
+    python -m pytest Test_Scripts
+'''
+
+def get_config():
+    config = Palace_Config('Eigenmode', 'output', 'mesh.msh', 0)
+    config.set_solver(1, {'N': 2, 'Target': 5.0, 'Tol': 1e-6}, {'Type': 'Default'})
+    return config
+
+
+@pytest.mark.parametrize('physical_groups, indices', [({'dielectric_gaps': 7, 'metals': 8}, {'SA': 1, 'MS': 2, 'MA': 3}),
+                                                      ({'metals': 8}, {'MS': 2, 'MA': 3})])
+def test_interface_dielectrics_keep_their_indices(physical_groups, indices):
+
+    config = get_config()
+    config.add_interface_dielectrics(physical_groups)
+    dielectrics = config.get_config()['Boundaries']['Postprocessing']['Dielectric']
+
+    assert {x['Type']: x['Index'] for x in dielectrics} == indices
+    assert all([x['Thickness'] == pytest.approx(2e-6) for x in dielectrics])
+
+
+def test_schema_validation_fails_without_jsonschema(tmp_path, monkeypatch):
+
+    schema_file = tmp_path / 'config-schema.json'
+    schema_file.write_text(json.dumps({'type': 'object'}))
+    monkeypatch.setattr(palace_config_module, 'jsonschema', None)
+
+    with pytest.raises(Exception, match='requires the jsonschema package'):
+        Palace_Config.validate_config(get_config().get_config(), str(schema_file))
+
+
+def test_schema_is_found_in_the_palace_installation(tmp_path):
+
+    palace = tmp_path / 'bin' / 'palace'
+    palace.parent.mkdir()
+    palace.write_text('#!/bin/sh\n')
+    palace.chmod(0o755)
+    with pytest.raises(Exception, match='schema was not found'):
+        Palace_Config.find_schema(str(palace))
+
+    schema_file = tmp_path / 'share' / 'palace' / 'schema' / 'config-schema.json'
+    schema_file.parent.mkdir(parents=True)
+    schema_file.write_text('{}')
+    assert Palace_Config.find_schema(f'{palace} -launcher-args') == str(schema_file)
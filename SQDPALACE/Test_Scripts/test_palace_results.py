@@ -0,0 +1,33 @@
+import os
+import sys
+import json
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Palace_Results import Palace_Results
+
+'''Tests of Palace_Results on synthetic Palace outputs, i.e.:
+
+    python -m pytest Test_Scripts
+'''
+
+def test_summary_writes_missing_entries_as_null(tmp_path):
+
+    #only port 2 is excited, so S[i][1] was not simulated - the directory name must come through unchanged
+    output_dir = tmp_path / 'NaN_check_port2'
+    output_dir.mkdir()
+    (output_dir / 'port-S.csv').write_text("f (GHz), |S[1][2]| (dB), arg(S[1][2]) (deg.), |S[2][2]| (dB), arg(S[2][2]) (deg.)\n"
+                                           "4.0, -20.0, 90.0, -1.0, 0.0\n5.0, -20.0, 90.0, -1.0, 0.0\n")
+    (output_dir / 'palace.json').write_text(json.dumps({'ElapsedTime': {'Durations': {'Total': 2.5}}}))
+    summary_file = tmp_path / 'summary.json'
+
+    Palace_Results.summarize_outputs([str(output_dir)], str(summary_file))
+    with open(summary_file) as f:
+        summary = json.load(f)
+
+    assert list(summary['runs'].keys()) == [str(output_dir)]
+    assert summary['runs'][str(output_dir)]['elapsed_time'] == 2.5
+    assert summary['s_parameters']['real'][0][0][0] is None
+    assert summary['s_parameters']['imag'][0][0][1] == pytest.approx(0.1)
+    assert summary['s_parameters']['real'][0][1][1] == pytest.approx(10**(-1.0/20))
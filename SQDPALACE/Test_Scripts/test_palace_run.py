@@ -0,0 +1,65 @@
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Palace_Run import Palace_Run
+
+'''Tests of Palace_Run on synthetic Palace outputs, i.e.:
+
+    python -m pytest Test_Scripts
+'''
+
+def write_eigenmodes(output_dir, freqs):
+    lines = ["m, Re{f} (GHz), Im{f} (GHz), Q"] + [f"{m+1}, {x}, 0.0001, 1e6" for m, x in enumerate(freqs)]
+    (output_dir / 'eig.csv').write_text("\n".join(lines) + "\n")
+
+
+def test_indexed_table_columns_are_named_after_labels(tmp_path):
+
+    (tmp_path / 'port-EPR.csv').write_text("m, p[1], p[2]\n1, 0.9, 0.05\n2, 0.01, 0.8\n")
+    (tmp_path / 'surface-Q.csv').write_text("m, p_surf[1], Q_surf[1], p_surf[2], Q_surf[2]\n1, 1e-4, 1e7, 2e-4, 5e6\n")
+    labels = {'ports': {'1': 'jj_0'}, 'surfaces': {'1': 'SA', '2': 'MS'}}
+    run = Palace_Run(str(tmp_path), labels)
+
+    #ports without a label keep their Palace index
+    epr = run.port_epr
+    assert epr.dtype.names == ('mode', 'jj_0', '2')
+    assert epr['mode'].tolist() == [1, 2]
+    assert epr['jj_0'].tolist() == [0.9, 0.01]
+
+    #several quantities per index are prefixed by the quantity
+    surfaces = run.surface_participation
+    assert surfaces.dtype.names == ('mode', 'p_surf_SA', 'Q_surf_SA', 'p_surf_MS', 'Q_surf_MS')
+    assert surfaces['Q_surf_MS'].tolist() == [5e6]
+
+
+def test_outputs_are_cached_until_their_file_changes(tmp_path):
+
+    write_eigenmodes(tmp_path, [4.0, 6.0])
+    run = Palace_Run(str(tmp_path))
+
+    modes = run.eigenmodes
+    assert run.eigenmodes is modes
+    assert modes['freq'].tolist() == [4.0, 6.0]
+
+    write_eigenmodes(tmp_path, [4.5, 6.5, 8.5])
+    modified = os.path.getmtime(tmp_path / 'eig.csv') + 10
+    os.utime(tmp_path / 'eig.csv', (modified, modified))
+
+    assert run.eigenmodes is not modes
+    assert run.eigenmodes['freq'].tolist() == [4.5, 6.5, 8.5]
+
+
+def test_runs_of_a_simulation_share_its_labels(tmp_path):
+
+    (tmp_path / 'sim_labels.json').write_text(json.dumps({'ports': {'1': 'jj_0'}}))
+    sim_info = {'name': 'sim', 'sim_directory': str(tmp_path),
+                'jobs': {'sim': {'output': str(tmp_path / 'out')}, 'sim_tune0': {'output': str(tmp_path / 'out_tune0')}}}
+
+    runs = Palace_Run.from_sim_info(sim_info)
+
+    assert sorted(runs.keys()) == ['sim', 'sim_tune0']
+    assert runs['sim_tune0'].output_dir == str(tmp_path / 'out_tune0')
+    assert runs['sim'].labels == {'ports': {'1': 'jj_0'}}
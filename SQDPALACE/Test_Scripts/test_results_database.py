@@ -0,0 +1,72 @@
+import os
+import sys
+import json
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Results_Database import Results_Database
+
+'''Tests of Results_Database on synthetic Palace outputs, i.e.:
+
+    python -m pytest Test_Scripts
+'''
+
+def write_run(directory, name, freq):
+    '''Writes the config and eigenmode results of an Eigenmode run and returns the (output directory, config file).'''
+
+    output_dir = directory / name
+    output_dir.mkdir()
+    (output_dir / 'eig.csv').write_text(f"m, Re{{f}} (GHz), Im{{f}} (GHz), Q\n1, {freq}, 0.0001, 1e6\n2, {freq + 3}, 0.001, 1e5\n")
+    (output_dir / 'port-EPR.csv').write_text("m, p[1]\n1, 0.9\n2, 0.01\n")
+    config_file = directory / (name + '.json')
+    config_file.write_text(json.dumps({'Problem': {'Type': 'Eigenmode', 'Output': str(output_dir)},
+                                       'Model': {'Mesh': 'mesh.msh', 'Refinement': {'UniformLevels': 0}},
+                                       'Solver': {'Order': 2, 'Eigenmode': {'N': 2, 'Tol': 1e-8}}}))
+
+    return str(output_dir), str(config_file)
+
+
+@pytest.fixture
+def database(tmp_path):
+    database = Results_Database(str(tmp_path / 'results.db'))
+    yield database
+    database.close()
+
+
+def test_unchanged_runs_are_skipped_on_reingest(tmp_path, database):
+
+    output_dir, config_file = write_run(tmp_path, 'run_0', 4.0)
+
+    assert database.ingest_run(output_dir, config_file, labels = {'ports': {'1': 'jj_0'}})
+    assert not database.ingest_run(output_dir, config_file)
+    assert database.connection.execute("SELECT COUNT(*) FROM eigenmodes").fetchone()[0] == 2
+
+    #changed results replace the rows of the previous ingest
+    eig_file = os.path.join(output_dir, 'eig.csv')
+    with open(eig_file, 'w') as f:
+        f.write("m, Re{f} (GHz), Im{f} (GHz), Q\n1, 4.2, 0.0001, 1e6\n")
+    modified = os.path.getmtime(eig_file) + 10
+    os.utime(eig_file, (modified, modified))
+
+    assert database.ingest_run(output_dir, config_file)
+    assert database.query('eigenmodes')['freq'].tolist() == [4.2]
+    assert database.connection.execute("SELECT COUNT(*) FROM runs").fetchone()[0] == 1
+
+
+def test_range_queries_convert_units(tmp_path, database):
+
+    for m, pad_width in enumerate(['80um', '90um', '0.1mm', '120um']):
+        output_dir, config_file = write_run(tmp_path, f'run_{m}', 4.0 + m)
+        database.ingest_run(output_dir, config_file, params = {'design.pad_width': pad_width}, labels = {'ports': {'1': 'jj_0'}},
+                            sim_name = f'run_{m}')
+
+    results = database.query('eigenmodes', ranges = {'design.pad_width': ('85um', '0.1mm')}, values = {'Solver.Order': 2},
+                             params = ['design.pad_width'])
+    assert sorted(set(results['sim_name'].tolist())) == ['run_1', 'run_2']
+    assert sorted(set(results['design.pad_width'].tolist())) == pytest.approx([9e-5, 1e-4])
+
+    #open bounds and the labelled mode quantities
+    results = database.query('mode_quantities', ranges = {'design.pad_width': ('100um', None)})
+    assert sorted(set(results['sim_name'].tolist())) == ['run_2', 'run_3']
+    assert set(results['name'].tolist()) == {'jj_0'}
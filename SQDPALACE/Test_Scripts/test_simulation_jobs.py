@@ -0,0 +1,118 @@
+import os
+import sys
+import types
+import signal
+import asyncio
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+'''Tests of Simulation_Job_Manager with a stand-in for Gmsh (the real package needs a display library), i.e.:
+
+    python -m pytest Test_Scripts
+'''
+
+class Gmsh_Stub(types.ModuleType):
+    '''Records the Gmsh calls and, like gmsh.initialize, installs a SIGINT handler unless interruptible is False (which raises
+    "ValueError: signal only works in main thread" off the main thread).'''
+
+    def __init__(self):
+        super().__init__('gmsh')
+        self.initialized = False
+        self.calls = []
+
+    def initialize(self, argv = [], readConfigFiles = True, run = False, interruptible = True):
+        if interruptible:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+        self.initialized = True
+        self.calls.append(('initialize', threading.current_thread() is threading.main_thread()))
+
+    def isInitialized(self):
+        return int(self.initialized)
+
+    def clear(self):
+        self.calls.append(('clear', threading.current_thread() is threading.main_thread()))
+
+    def finalize(self):
+        self.initialized = False
+        self.calls.append(('finalize', threading.current_thread() is threading.main_thread()))
+
+
+class Simulation_Stub:
+    '''Prepares no files, but handles the Gmsh session as PALACE_Simulation and GMSH_Geometry_Builder do.'''
+
+    def __init__(self, name, sim_directory):
+        self.name = name
+        self.user_options = {'sim_directory': sim_directory}
+        self.checkpoint = None
+
+    def run_simulation(self, stage_callback):
+        gmsh = sys.modules['gmsh']
+
+        stage_callback('geometry')
+        if gmsh.isInitialized():
+            gmsh.clear()
+        else:
+            gmsh.initialize()
+
+        stage_callback('mesh')
+        stage_callback('files')
+        if self.user_options.get('keep_gmsh_initialized', False):
+            gmsh.clear()
+        else:
+            gmsh.finalize()
+
+        return {'name': self.name, 'sim_directory': os.path.join(self.user_options['sim_directory'], self.name), 'hpc_options': {}, 'jobs': {}}
+
+
+def test_submit_prepares_simulations_off_the_main_thread(tmp_path, monkeypatch):
+
+    gmsh = Gmsh_Stub()
+    monkeypatch.setitem(sys.modules, 'gmsh', gmsh)
+    monkeypatch.delitem(sys.modules, 'Simulation_Jobs', raising=False)
+    from Simulation_Jobs import Simulation_Job_Manager, Local_Backend
+
+    async def submit_all():
+        manager = Simulation_Job_Manager(Local_Backend(max_cores = 1))
+        handles = [manager.submit(Simulation_Stub(f'sim_{m}', str(tmp_path))) for m in range(2)]
+        return handles, await manager.gather(*handles)
+
+    handles, results = asyncio.run(submit_all())
+
+    assert [x.stage for x in handles] == ['done', 'done'], [x.error for x in handles]
+    assert results == [{'jobs': {}, 'summary': None}] * 2
+
+    #Gmsh is only initialized once, on the main thread, and the simulations only clear its model
+    assert gmsh.calls[0] == ('initialize', True)
+    assert [x[0] for x in gmsh.calls[1:]] == ['clear'] * 4
+    assert gmsh.isInitialized()
+
+
+def test_slurm_backend_waits_for_pending_siblings_of_a_failed_job(tmp_path, monkeypatch):
+
+    monkeypatch.setitem(sys.modules, 'gmsh', Gmsh_Stub())
+    monkeypatch.delitem(sys.modules, 'Simulation_Jobs', raising=False)
+    from Simulation_Jobs import Slurm_Backend
+
+    #job 2 fails, job 3 depends on it and job 4 is independent but still queued when job 2 fails
+    polls = ['1|COMPLETED|None\n2|FAILED|NonZeroExitCode\n3|PENDING|DependencyNeverSatisfied\n4|PENDING|Priority\n',
+             '1|COMPLETED|None\n2|FAILED|NonZeroExitCode\n3|PENDING|DependencyNeverSatisfied\n4|RUNNING|None\n',
+             '1|COMPLETED|None\n2|FAILED|NonZeroExitCode\n3|PENDING|DependencyNeverSatisfied\n4|COMPLETED|None\n']
+    commands = []
+
+    async def run_command(command):
+        commands.append(command)
+        if command.startswith('bash '):
+            return ''.join([f'Submitted {x} {m + 1}\n' for m, x in enumerate(['a', 'b', 'c', 'd'])])
+        return polls.pop(0)
+
+    (tmp_path / 'submit_sim.sh').write_text('')
+    sim_info = {'name': 'sim', 'sim_directory': str(tmp_path), 'hpc_options': {'input_files_location': '/cluster/'},
+                'jobs': {x: {} for x in ['a', 'b', 'c', 'd']}}
+    backend = Slurm_Backend(poll_interval = 0)
+    monkeypatch.setattr(backend, '_run_command', run_command)
+
+    results = asyncio.run(backend.run(sim_info))
+
+    assert results['states'] == {'a': 'COMPLETED', 'b': 'FAILED', 'c': 'PENDING', 'd': 'COMPLETED'}
+    assert polls == []
@@ -0,0 +1,48 @@
+import os
+import sys
+import csv
+import json
+
+class Two_Stage_Refiner:
+    '''Updates the config of the second (high-order) stage of a two-stage Eigenmode simulation from the modes found by the first (low-order)
+    stage. This only uses the standard library so that it can be run on the HPC between the two stages, i.e.:
+
+        python Two_Stage_Refiner.py <stage 1 output directory> <stage 2 config file> <number of modes> <margin>
+    '''
+
+    @staticmethod
+    def refine_stage_two_config(stage_one_output, stage_two_config_file, num_modes, margin = 0.01):
+        '''Sets the Target of the stage two config just below the lowest mode found in stage one and N to the number of requested modes.
+
+        Args:
+            stage_one_output - Palace output directory of the first stage (containing eig.csv).
+            stage_two_config_file - config (.json) file of the second stage, which is overwritten.
+            num_modes - number of modes requested by the user.
+            margin - (Optional) Defaults to 0.01. Fractional margin below the lowest mode at which the Target is placed.
+        '''
+
+        with open(os.path.join(stage_one_output, 'eig.csv'), newline='') as f:
+            rows = [row for row in csv.reader(f) if row]
+        headers = [x.strip() for x in rows[0]]
+        freqs = sorted([float(row[headers.index('Re{f} (GHz)')]) for row in rows[1:]])
+
+        assert len(freqs) > 0, f"No modes were found in stage one ('{stage_one_output}')."
+        freqs = freqs[:num_modes]
+
+        with open(stage_two_config_file) as f:
+            config = json.load(f)
+
+        config['Solver']['Eigenmode']['Target'] = freqs[0] * (1 - margin)
+        config['Solver']['Eigenmode']['N'] = len(freqs)
+        config['Solver']['Eigenmode']['Save'] = min(config['Solver']['Eigenmode']['Save'], len(freqs))
+        if config['Solver']['Eigenmode'].get('MaxSize') is not None:
+            config['Solver']['Eigenmode']['MaxSize'] = max(config['Solver']['Eigenmode']['MaxSize'], len(freqs) + 1)
+
+        with open(stage_two_config_file, "w") as f:
+            json.dump(config, f, indent=2)
+
+        print(f"Stage two: Target = {config['Solver']['Eigenmode']['Target']:.6f} GHz, N = {len(freqs)}.")
+
+
+if __name__ == '__main__':
+    Two_Stage_Refiner.refine_stage_two_config(sys.argv[1], sys.argv[2], int(sys.argv[3]), float(sys.argv[4]))
@@ -31,6 +31,23 @@ class CpwParams:
 
     @staticmethod
     def calc_impedance(tr_wid, tr_gap, er, h):
+        k, kp, k1, k1p = CpwParams._calc_moduli(tr_wid, tr_gap, h)
+        e_eff = CpwParams.calc_eff_permittivity(tr_wid, tr_gap, er, h)
+
+        z0 = 60.0*np.pi/np.sqrt(e_eff) * 1.0 / (scipy.special.ellipk(k**2)/scipy.special.ellipk(kp**2) + scipy.special.ellipk(k1**2)/scipy.special.ellipk(k1p**2))
+
+        return z0
+
+    @staticmethod
+    def calc_eff_permittivity(tr_wid, tr_gap, er, h):
+        k, kp, k1, k1p = CpwParams._calc_moduli(tr_wid, tr_gap, h)
+
+        kp_k1_on_k_k1p = scipy.special.ellipk(kp**2)*scipy.special.ellipk(k1**2) / (scipy.special.ellipk(k**2)*scipy.special.ellipk(k1p**2))
+        return (1.0 + er*kp_k1_on_k_k1p)/(1.0 + kp_k1_on_k_k1p)
+
+    @staticmethod
+    def _calc_moduli(tr_wid, tr_gap, h):
+        #elliptic moduli of the CPW on a substrate of finite thickness h
         a = tr_wid
         b = tr_wid + 2.0*tr_gap
         k = a/b
@@ -38,12 +55,7 @@ class CpwParams:
         kp = np.sqrt(1-k**2)
         k1p = np.sqrt(1-k1**2)
 
-        kp_k1_on_k_k1p = scipy.special.ellipk(kp**2)*scipy.special.ellipk(k1**2) / (scipy.special.ellipk(k**2)*scipy.special.ellipk(k1p**2))
-        e_eff = (1.0 + er*kp_k1_on_k_k1p)/(1.0 + kp_k1_on_k_k1p)
-
-        z0 = 60.0*np.pi/np.sqrt(e_eff) * 1.0 / (scipy.special.ellipk(k**2)/scipy.special.ellipk(kp**2) + scipy.special.ellipk(k1**2)/scipy.special.ellipk(k1p**2))
-
-        return z0
+        return k, kp, k1, k1p
 
     def get_gap_from_width(self, trace_width, target_impedance=50):
         er = self.rel_permittivity
@@ -0,0 +1,145 @@
+import numpy as np
+import copy
+from qiskit_metal.qlibrary.core import QRoute
+from qiskit_metal.qlibrary.terminations.launchpad_wb import LaunchpadWirebond
+from qiskit_metal.qlibrary.terminations.short_to_ground import ShortToGround
+from Utilities.QUtilities import QUtilities
+from Utilities.CpwParams import CpwParams
+from Utilities.QubitDesigner import ResonatorQuarterWave, ResonatorHalfWave
+from Utilities.GenUtilities import GenUtilities
+
+class ModeEstimator:
+    '''Estimates the frequencies of the resonators and qubits in a Qiskit-Metal design from analytic models. These estimates are used to
+    seed the Target/N of Eigenmode simulations and the frequency band/fine sampling regions of Driven simulations, so that the solver only
+    searches where modes are expected.
+
+    Inputs:
+        - design - Qiskit-Metal design object.
+        - chip_name - (Optional) Defaults to 'main'. Chip on which the components are placed.
+        - qubit_capacitances - (Optional) Dictionary of the total capacitance (in F) of each qubit, keyed by the component name. This is
+                               typically taken from a capacitance simulation.
+        - default_qubit_capacitance - (Optional) Defaults to 80fF. Total capacitance used for qubits not in qubit_capacitances.
+    '''
+
+    def __init__(self, design, chip_name='main', qubit_capacitances={}, default_qubit_capacitance=80e-15):
+        self.design = design
+        self.chip_name = chip_name
+        self.qubit_capacitances = qubit_capacitances
+        self.default_qubit_capacitance = default_qubit_capacitance
+        self.cpw = CpwParams.fromQDesign(design, chip_name)
+
+    def get_resonators(self):
+        '''Returns a dictionary of resonator objects (ResonatorQuarterWave or ResonatorHalfWave) keyed by the route component name.
+
+        Routes are taken to be resonators unless they connect to a launch pad (i.e. a feedline). A route with exactly one end connected to
+        a ShortToGround is taken as a quarter-wave resonator, otherwise it is taken as a half-wave resonator. The length is taken along the
+        filleted path via QUtilities.calc_points_on_path.
+        '''
+        unit_conv = QUtilities.get_units(self.design)
+        c = 299792458
+
+        resonators = {}
+        for comp_name, comp in self.design.components.items():
+            if not isinstance(comp, QRoute):
+                continue
+            end_comps = [self._get_connected_components(comp, pin) for pin in ['start', 'end']]
+            if np.any([isinstance(x, LaunchpadWirebond) for y in end_comps for x in y]):
+                continue
+
+            _, _, width, gap, length = QUtilities.calc_points_on_path(1, self.design, comp_name)
+            width, gap, length = width*unit_conv, gap*unit_conv, length*unit_conv
+
+            e_eff = CpwParams.calc_eff_permittivity(width, gap, self.cpw.rel_permittivity, self.cpw.dielectric_thickness)
+            z0 = CpwParams.calc_impedance(width, gap, self.cpw.rel_permittivity, self.cpw.dielectric_thickness)
+
+            num_shorted = sum([np.any([isinstance(x, ShortToGround) for x in y]) for y in end_comps])
+            if num_shorted == 1:
+                resonators[comp_name] = ResonatorQuarterWave(c / (4*length*np.sqrt(e_eff)), shorted=True, impedance=z0)
+            else:
+                resonators[comp_name] = ResonatorHalfWave(c / (2*length*np.sqrt(e_eff)), shorted=num_shorted==2, impedance=z0)
+
+        return resonators
+
+    def get_qubits(self):
+        '''Returns a dictionary of the estimated qubit frequencies (in Hz) keyed by the component name.
+
+        The qubit frequency is taken from the transmon relation f = sqrt(8 Ej Ec) - Ec (see TransmonBase in QubitDesigner), where Ej is
+        given by the junction inductance in the design and Ec by the total qubit capacitance.
+        '''
+        elem = 1.60217663e-19
+        h = 6.62607015e-34
+        phi0 = h / (2*elem)
+
+        comp_names = {comp.id: comp_name for comp_name, comp in self.design.components.items()}
+
+        qubits = {}
+        for _, row in self.design.qgeometry.tables['junction'].iterrows():
+            comp_name = comp_names[row['component']]
+            inductance = float(row['hfss_inductance'][:-2]) * 1e-9     #junction inductance given in nH
+            capacitance = self.qubit_capacitances.get(comp_name, self.default_qubit_capacitance)
+
+            Ej = (phi0 / (2*np.pi))**2 / inductance / h
+            Ec = elem**2 / (2*capacitance) / h
+            qubits[comp_name] = np.sqrt(8*Ej*Ec) - Ec
+
+        return qubits
+
+    def get_mode_frequencies(self):
+        '''Returns a list of tuples (component name, frequency in Hz) for all resonators and qubits sorted by frequency.'''
+        modes = [(x, y.get_res_frequency()) for x, y in self.get_resonators().items()]
+        modes += list(self.get_qubits().items())
+        assert len(modes) > 0, "No resonators or qubits were found in the design."
+        return sorted(modes, key=lambda x: x[1])
+
+    def print(self):
+        print("Estimated modes:")
+        for comp_name, freq in self.get_mode_frequencies():
+            print(f"\t{comp_name}: {GenUtilities.add_units(freq, 5)}Hz")
+
+    def seed_eigenmode_options(self, user_options, margin=0.1):
+        '''Returns a copy of the user_options where the Eigenmode Target ('starting_freq') is placed just below the lowest estimated mode and
+        the number of modes ('number_of_freqs') is the number of estimated modes. If spectrum slicing is used ('freq_band' in user_options),
+        the band is set to cover all estimated modes instead.
+
+        Inputs:
+            - user_options - user_options for the Eigenmode simulation.
+            - margin - (Optional) Defaults to 0.1. Fractional margin placed around the estimated modes to account for the model error.
+        '''
+        freqs = np.array([x[1] for x in self.get_mode_frequencies()]) / 1e9
+
+        user_options = copy.deepcopy(user_options)
+        user_options['starting_freq'] = float(freqs.min() * (1 - margin))
+        user_options['number_of_freqs'] = int(freqs.size)
+        if user_options.get('freq_band') is not None:
+            user_options['freq_band'] = (float(freqs.min() * (1 - margin)), float(freqs.max() * (1 + margin)))
+
+        return user_options
+
+    def seed_driven_options(self, user_options, margin=0.1, resonance_margin=0.02):
+        '''Returns a copy of the user_options where the Driven band ('start_freq' and 'stop_freq') covers all estimated modes and the
+        estimated modes are given as 'resonance_freqs' to be finely sampled (see Driven_Simulation).
+
+        Inputs:
+            - user_options - user_options for the Driven simulation.
+            - margin - (Optional) Defaults to 0.1. Fractional margin placed around the estimated modes when choosing the band.
+            - resonance_margin - (Optional) Defaults to 0.02. Fractional width (either side) of the fine sampling window about each mode. Only
+                                 used if 'resonance_span' is not already given in user_options.
+        '''
+        freqs = np.array([x[1] for x in self.get_mode_frequencies()]) / 1e9
+
+        user_options = copy.deepcopy(user_options)
+        user_options['start_freq'] = float(freqs.min() * (1 - margin))
+        user_options['stop_freq'] = float(freqs.max() * (1 + margin))
+        user_options['resonance_freqs'] = freqs.tolist()
+        if user_options.get('resonance_span') is None:
+            user_options['resonance_span'] = float(2 * resonance_margin * freqs.min())
+
+        return user_options
+
+    def _get_connected_components(self, comp, pin_name):
+        net_id = comp.pins[pin_name].net_id
+        if not net_id:
+            return []
+        net_info = self.design.net_info
+        comp_ids = net_info.loc[(net_info['net_id'] == net_id) & (net_info['component_id'] != comp.id), 'component_id']
+        return [self.design._components[x] for x in comp_ids]
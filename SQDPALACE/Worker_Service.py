@@ -0,0 +1,121 @@
+import os
+import time
+import pickle
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait
+from Sweep_Engine import build_variant
+
+class Worker_Service:
+    '''Long-lived pool of worker processes for preparing many small simulations. Each worker imports Qiskit-Metal, geopandas, matplotlib
+    and Gmsh and initializes Gmsh once when it starts, after which only the Gmsh model is cleared between jobs. The start-up cost of a
+    fresh process (several seconds) is therefore paid once per worker rather than once per simulation, e.g.:
+
+        service = Worker_Service(num_workers=4)
+        service.start()
+        futures = [service.submit_design(f'sim_{m}', design, 'Eigenmode', user_options, overrides={'Q1.pad_gap': x}) for m, x in ...]
+        results = [x.result() for x in futures]
+        service.shutdown()
+
+    The service can also be passed to Sweep_Engine so that consecutive sweeps reuse the same workers.
+
+    Inputs:
+        - num_workers - (Optional) Defaults to the number of cores. Number of worker processes.
+    '''
+
+    def __init__(self, num_workers = None):
+        self.num_workers = num_workers if num_workers is not None else os.cpu_count()
+        self.executor = None
+
+    def start(self):
+        '''Starts the workers and waits until all of them are warmed up. Returns the time in seconds taken to start them.'''
+
+        if self.executor is not None:
+            return 0.0
+
+        start_time = time.time()
+        self.executor = ProcessPoolExecutor(max_workers = self.num_workers, mp_context = multiprocessing.get_context('spawn'),
+                                            initializer = warm_up_worker)
+
+        #the pool only starts a worker when a job is submitted, so one short job per worker is queued to start them all now
+        wait([self.executor.submit(time.sleep, 0.1) for _ in range(self.num_workers)])
+        print(f"Started {self.num_workers} workers in {time.time() - start_time:.1f} s.")
+
+        return time.time() - start_time
+
+    def submit_design(self, name, design, simulation_type, user_options, ports = [], hpc_options = {}, overrides = {}):
+        '''Queues the preparation of a simulation (geometry, mesh and simulation files) from a design.
+
+        Args:
+            name - name of the simulation.
+            design - Qiskit-Metal design object or a snapshot of it (the bytes returned by pickle.dumps(design)). Snapshots avoid pickling
+                     the same design again for every job.
+            simulation_type - 'Eigenmode', 'Driven' or 'Capacitance'.
+            user_options - user_options passed to PALACE_Simulation.
+            ports - (Optional) ports passed to PALACE_Simulation.
+            hpc_options - (Optional) hpc_options passed to PALACE_Simulation.
+            overrides - (Optional) component options set before the simulation is built (see Sweep_Engine.get_variants).
+
+        Returns:
+            Future whose result is a dictionary with the 'status' ('completed' or 'failed'), 'time', 'sim_info' (see
+            PALACE_Simulation.run_simulation) and 'error' (traceback) of the job.
+        '''
+
+        self.start()
+
+        design_snapshot = design if isinstance(design, bytes) else pickle.dumps(design)
+        user_options = {**user_options, 'show_gui': False, 'run_locally': False, 'keep_gmsh_initialized': True}
+
+        return self.executor.submit(build_variant, design_snapshot, name, overrides, simulation_type, user_options, ports, hpc_options)
+
+    def submit_geometry(self, geometry_file, mesh_settings_file, mesh_file):
+        '''Queues the meshing of a rendered geometry, i.e. the BREP and geometry settings files written by Simulation_Files_Builder when
+        hpc_options['pipeline'] is set (see Remote_Mesher.build_mesh_from_geometry).
+
+        Returns:
+            Future whose result is a dictionary with the 'status' ('completed' or 'failed'), 'time', 'mesh_file' and 'error' (traceback)
+            of the job.
+        '''
+
+        self.start()
+        return self.executor.submit(mesh_geometry, geometry_file, mesh_settings_file, mesh_file)
+
+    def shutdown(self):
+        '''Stops the workers once the queued jobs have finished.'''
+
+        if self.executor is not None:
+            self.executor.shutdown(wait = True)
+            self.executor = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.shutdown()
+
+
+def warm_up_worker():
+    '''Imports the packages used to prepare simulations and initializes Gmsh when a worker process starts.'''
+
+    #plots are not shown in the worker processes
+    import matplotlib
+    matplotlib.use('Agg')
+    import PALACE_Simulation        #imports Qiskit-Metal, geopandas and Gmsh
+    import gmsh
+
+    gmsh.initialize()
+
+
+def mesh_geometry(geometry_file, mesh_settings_file, mesh_file):
+    '''Meshes a rendered geometry in a worker process, leaving Gmsh initialized for the next job.'''
+
+    start_time = time.time()
+    try:
+        from Remote_Mesher import Remote_Mesher
+        Remote_Mesher.build_mesh_from_geometry(geometry_file, mesh_settings_file, mesh_file, keep_initialized = True)
+
+        return {'status': 'completed', 'time': time.time() - start_time, 'mesh_file': mesh_file, 'error': None}
+
+    except Exception:
+        return {'status': 'failed', 'time': time.time() - start_time, 'mesh_file': mesh_file, 'error': traceback.format_exc()}